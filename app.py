@@ -1,6 +0,0 @@
-from app import create_app
-
-app, celery = create_app()
-
-if __name__ == '__main__':
-    app.run(debug=True)
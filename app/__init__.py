@@ -9,7 +9,13 @@ from app.config import Config
 from dotenv import load_dotenv
 import os
 from celery import Celery
+from celery.schedules import crontab
+from kombu import Queue
+from sqlalchemy.engine import make_url
 from flask_mail import Mail
+from app.storage import BlobStorage
+from app.passwords import PasswordHasher, PasswordHashingBusy
+from app.mailer import MailTransport
 
 # Load environment variables from .env file
 load_dotenv()
@@ -21,14 +27,65 @@ bcrypt = Bcrypt()
 api = Api()
 migrate = Migrate()
 mail = Mail()
+blob_storage = BlobStorage()
+password_hasher = PasswordHasher()
+mail_transport = MailTransport()
+
+# The one Celery app; every task module registers on it, make_celery configures it.
+celery = Celery(__name__)
+
+# Transactional mail (welcome, password, one-off messages) and bulk fan-out get
+# their own queues, so a notification to every user can never sit in front of
+# a welcome email. Run dedicated workers per queue, e.g.
+#   celery -A wsgi.celery worker -Q transactional -c 4
+#   celery -A wsgi.celery worker -Q bulk,default -c 2
+# Priorities order tasks within a queue and follow the Redis transport, where
+# 0 is served first (kombu buckets them into steps 0, 3, 6 and 9). On the bulk
+# queue a fan-out or an import starts ahead of the chunks already waiting.
+CELERY_TASK_ROUTES = {
+    'app.routes.send_email_task': {'queue': 'transactional', 'priority': 0},
+    'app.routes.fan_out_notification_task': {'queue': 'bulk', 'priority': 3},
+    'app.routes.send_notification_chunk_task': {'queue': 'bulk', 'priority': 6},
+    'app.routes.send_sms_task': {'queue': 'bulk', 'priority': 6},
+    'app.routes.import_students_task': {'queue': 'bulk', 'priority': 3},
+    'app.routes.reconcile_invoices_task': {'queue': 'default'},
+}
 
 def make_celery(app):
-    celery = Celery(
-        app.import_name,
-        backend=app.config['CELERY_RESULT_BACKEND'],
-        broker=app.config['CELERY_BROKER_URL']
+    celery.main = app.import_name
+    celery.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
+        task_queues=(
+            Queue('transactional', routing_key='transactional'),
+            Queue('bulk', routing_key='bulk'),
+            Queue('default', routing_key='default'),
+        ),
+        task_default_queue='default',
+        task_routes=CELERY_TASK_ROUTES,
+        # Tasks spend most of their time waiting on SMTP or the database: take one
+        # message at a time and only ack it once it is done, so a worker that dies
+        # mid-send hands its message to another worker instead of losing it.
+        worker_prefetch_multiplier=app.config['CELERY_WORKER_PREFETCH_MULTIPLIER'],
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        broker_transport_options={
+            'visibility_timeout': app.config['CELERY_VISIBILITY_TIMEOUT'],
+            # A worker consuming several queues drains them in the order listed above.
+            'queue_order_strategy': 'priority',
+        },
+        task_annotations={
+            'app.routes.send_notification_chunk_task': {'rate_limit': app.config['CELERY_BULK_RATE_LIMIT']},
+            'app.routes.send_email_task': {'rate_limit': app.config['CELERY_TRANSACTIONAL_RATE_LIMIT']},
+        },
+        beat_schedule={
+            'reconcile-invoices-nightly': {
+                'task': 'app.routes.reconcile_invoices_task',
+                'schedule': crontab(hour=2, minute=0),
+            },
+        },
+        task_always_eager=app.config.get('CELERY_TASK_ALWAYS_EAGER', False),
     )
-    celery.conf.update(app.config)
     TaskBase = celery.Task
 
     class ContextTask(TaskBase):
@@ -40,10 +97,23 @@ def make_celery(app):
     return celery
 
 def create_app():
-    """Application factory for setting up the Flask app."""
+    """Application factory for setting up the Flask app.
+
+    Nothing builds an app at import time: call this once per process, as
+    wsgi.py does for gunicorn and Celery. `flask --app app` finds it on its own.
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Student numbers, attendance marks and the reporting summaries are all written
+    # with INSERT ... ON CONFLICT: refuse other databases now, not on the first write.
+    from app.models import UPSERT_DIALECTS
+    backend = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if backend not in UPSERT_DIALECTS:
+        raise RuntimeError(
+            f"Unsupported database {backend!r}: DATABASE_URI must point at one of {', '.join(UPSERT_DIALECTS)}"
+        )
+
     # Initialize extensions
     db.init_app(app)
     api.init_app(app)
@@ -51,6 +121,13 @@ def create_app():
     bcrypt.init_app(app)
     migrate.init_app(app, db)
     mail.init_app(app)  # Initialize Flask-Mail
+    mail_transport.init_app(app)  # Pooled SMTP sessions on top of Flask-Mail's settings
+    blob_storage.init_app(app)
+    password_hasher.init_app(app)
+
+    @api.errorhandler(PasswordHashingBusy)
+    def handle_password_hashing_busy(error):
+        return {'message': str(error)}, 429, {'Retry-After': '1'}
 
     # Configure JWT
     app.config['JWT_SECRET_KEY'] = Config.JWT_SECRET_KEY
@@ -60,12 +137,23 @@ def create_app():
     # Apply CORS to the app
     CORS(app)
 
-    app.config.update(
-        CELERY_BROKER_URL=Config.CELERY_BROKER_URL,
-        CELERY_RESULT_BACKEND=Config.CELERY_RESULT_BACKEND
-    )
-
-    celery = make_celery(app)
+    make_celery(app)
+
+    # Imported here because it depends on the models, which need `db` first
+    from app.profiles import profile_cache
+    from app.analytics import analytics
+    from app.countries import country_registry
+    from app.instrumentation import instrumentation
+    from app.backfills import backfill_enrollment_courses_command
+    from app.summaries import rebuild_summaries_command
+    from app.ledger import reconcile_invoices_command
+    profile_cache.init_app(app)
+    analytics.init_app(app)
+    country_registry.init_app(app)
+    instrumentation.init_app(app, api)
+    app.cli.add_command(backfill_enrollment_courses_command)
+    app.cli.add_command(rebuild_summaries_command)
+    app.cli.add_command(reconcile_invoices_command)
 
     # Register namespaces
     from app.routes import (
@@ -98,8 +186,4 @@ def create_app():
     api.add_namespace(grades_ns, path='/grades')  # Register grades namespace
     api.add_namespace(attendance_ns, path='/attendance')
 
-
-    return app, celery
-
-# Create the application instance
-app, celery = create_app()
+    return app
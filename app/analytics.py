@@ -0,0 +1,165 @@
+import time
+from datetime import datetime, timezone
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import distinct, func, select
+
+from app import db
+from app.cache import make_cache
+from app.models import (
+    Attendance, Country, Course, CourseAttendanceSummary, CourseGradeSummary, Enrollment, Invoice, Payment,
+    Student, enrollment_course_association,
+)
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+
+def enrollment_view():
+    """Students per country and enrolled students per course."""
+    by_country = db.session.execute(
+        select(Country.name, func.count(Student.id))
+        .join(Student, Student.country_id == Country.id)
+        .group_by(Country.name)
+        .order_by(Country.name)
+    ).all()
+    by_course = db.session.execute(
+        select(Course.name, func.count(distinct(Enrollment.student_id)))
+        .join(enrollment_course_association, enrollment_course_association.c.course_id == Course.id)
+        .join(Enrollment, Enrollment.id == enrollment_course_association.c.enrollment_id)
+        .group_by(Course.name)
+        .order_by(Course.name)
+    ).all()
+    return {
+        'by_country': [{'country': name, 'students': count} for name, count in by_country],
+        'by_course': [{'course': name, 'students': count} for name, count in by_course],
+    }
+
+
+def fees_view():
+    """Invoiced vs. collected amounts, overall and per invoice status."""
+    paid = (
+        select(Payment.invoice_id, func.sum(Payment.amount).label('paid'))
+        .group_by(Payment.invoice_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            Invoice.status,
+            func.count(Invoice.id).label('invoices'),
+            func.coalesce(func.sum(Invoice.amount), 0).label('invoiced'),
+            func.coalesce(func.sum(paid.c.paid), 0).label('collected'),
+        )
+        .outerjoin(paid, paid.c.invoice_id == Invoice.id)
+        .group_by(Invoice.status)
+        .order_by(Invoice.status)
+    ).all()
+
+    invoiced = sum(row.invoiced for row in rows)
+    collected = sum(row.collected for row in rows)
+    return {
+        'invoices': sum(row.invoices for row in rows),
+        'invoiced': invoiced,
+        'collected': collected,
+        'outstanding': invoiced - collected,
+        'collection_rate': _rate(collected, invoiced),
+        'by_status': [
+            {
+                'status': row.status,
+                'invoices': row.invoices,
+                'invoiced': row.invoiced,
+                'collected': row.collected,
+                'collection_rate': _rate(row.collected, row.invoiced),
+            }
+            for row in rows
+        ],
+    }
+
+
+def grades_view():
+    """How often each grade was awarded, per course, from the grade summary table."""
+    rows = CourseGradeSummary.query.order_by(CourseGradeSummary.course, CourseGradeSummary.grade).all()
+    return {
+        'by_course': [
+            {'course': course, **CourseGradeSummary.stats(course_rows)}
+            for course, course_rows in groupby(rows, key=lambda row: row.course)
+        ],
+    }
+
+
+def attendance_view():
+    """Attendance counts and rates, overall and per course, from the attendance summary table."""
+    summaries = CourseAttendanceSummary.query.order_by(CourseAttendanceSummary.course).all()
+    totals = {
+        column: sum(getattr(summary, column) for summary in summaries)
+        for column in ('total',) + tuple(status.lower() for status in Attendance.STATUSES)
+    }
+    return {
+        **Attendance.summarize_counts(totals['total'], totals),
+        'by_course': [summary.to_dict() for summary in summaries if summary.total],
+    }
+
+
+VIEWS = {
+    'enrollment': enrollment_view,
+    'fees': fees_view,
+    'grades': grades_view,
+    'attendance': attendance_view,
+}
+
+
+class Analytics:
+    """Serves the /reporting/analytics views from a time-bucketed cache.
+
+    Time is cut into ANALYTICS_CACHE_TTL-second buckets and each view is
+    computed at most once per bucket; every request within the bucket (on
+    any worker, with the redis backend) gets the same snapshot. Dashboards
+    polling every few seconds therefore scan the tables once per bucket.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ANALYTICS_CACHE_BACKEND', 'memory')
+        app.config.setdefault('ANALYTICS_CACHE_TTL', 60)
+        app.config.setdefault('ANALYTICS_CACHE_REDIS_URL', 'redis://localhost:6379/1')
+        app.extensions['analytics_cache'] = make_cache(
+            app.config['ANALYTICS_CACHE_BACKEND'],
+            ttl=app.config['ANALYTICS_CACHE_TTL'],
+            max_size=len(VIEWS) * 2,
+            redis_url=app.config['ANALYTICS_CACHE_REDIS_URL'],
+            prefix='shiloh:analytics:',
+        )
+
+    @property
+    def cache(self):
+        return current_app.extensions['analytics_cache']
+
+    def view(self, name):
+        """Result of view `name` for the current time bucket, computing it on a miss."""
+        period = current_app.config['ANALYTICS_CACHE_TTL']
+        bucket = int(time.time() // period) if period else None
+        key = f'{name}:{bucket}'
+
+        cached = self.cache.get(key) if bucket is not None else None
+        if cached is not None:
+            return cached
+
+        result = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'data': VIEWS[name](),
+        }
+        if bucket is not None:
+            # Expire with the bucket, so stale buckets never pile up.
+            self.cache.set(key, result, ttl=(bucket + 1) * period - time.time() + 1)
+        return result
+
+    def invalidate(self):
+        self.cache.clear()
+
+
+analytics = Analytics()
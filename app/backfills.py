@@ -0,0 +1,45 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+# The migration that drops enrollments.courses owns the backfill code; the command
+# runs the same function ahead of the upgrade, against a live database.
+BACKFILL_REVISION = 'e41a8c9d2f57'
+
+
+def _backfill_migration():
+    """The module of migration BACKFILL_REVISION, loaded through Alembic's script directory."""
+    from alembic.script import ScriptDirectory
+
+    migrate = current_app.extensions['migrate']
+    scripts = ScriptDirectory.from_config(migrate.migrate.get_config(migrate.directory))
+    return scripts.get_revision(BACKFILL_REVISION).module
+
+
+def backfill_enrollment_courses(connection, batch_size=500, start_after=0, on_batch=None):
+    """Link every enrollment to the courses named in its `courses` text; see the migration for details.
+
+    Returns the last enrollment id processed.
+    """
+    return _backfill_migration().link_enrollment_courses(connection, batch_size, start_after, on_batch)
+
+
+@click.command('backfill-enrollment-courses')
+@click.option('--batch-size', default=500, show_default=True, help='Enrollments per committed batch.')
+@click.option('--start-after', default=0, show_default=True, help='Resume after this enrollment id.')
+@with_appcontext
+def backfill_enrollment_courses_command(batch_size, start_after):
+    """Copy enrollments.courses text into enrollment_course_association.
+
+    Run this against a live database before upgrading past the migration that
+    drops the text column; that migration then only has the tail to link.
+    """
+    from app import db
+
+    with db.engine.connect() as connection:
+        def commit(last_id):
+            connection.commit()
+            click.echo(f"Linked enrollments up to id {last_id}")
+
+        backfill_enrollment_courses(connection, batch_size, start_after, on_batch=commit)
+    click.echo("Enrollment course backfill complete.")
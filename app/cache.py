@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class NullCache:
+    """Cache that stores nothing; used when caching is switched off."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """JSON values in Redis, shared by every worker that points at the same server."""
+
+    def __init__(self, url, ttl=300, prefix='shiloh:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis cache backend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value, default=str), ex=int(ttl or self.ttl))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(backend, ttl=300, max_size=1024, redis_url=None, prefix='shiloh:'):
+    """Build a cache from configuration values ('memory', 'redis' or 'null')."""
+    if backend == 'memory':
+        return LRUCache(max_size=max_size, ttl=ttl)
+    if backend == 'redis':
+        return RedisCache(redis_url, ttl=ttl, prefix=prefix)
+    if backend in (None, '', 'null'):
+        return NullCache()
+    raise ValueError(f"Unknown cache backend '{backend}'. Available backends are: memory, redis, null")
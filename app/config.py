@@ -5,6 +5,8 @@ from datetime import timedelta
 
 load_dotenv()
 
+basedir = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
 class Config:
     SECRET_KEY = os.environ["SECRET_KEY"]
     SQLALCHEMY_DATABASE_URI = os.environ["DATABASE_URI"] # Set the database URI
@@ -26,8 +28,50 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
-    CELERY_BROKER_URL= os.environ.get('MAIL_DEFAULT_SENDER'),
-    CELERY_RESULT_BACKEND= os.environ.get('MAIL_DEFAULT_SENDER')
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE', 4))
+    MAIL_POOL_TIMEOUT = float(os.environ.get('MAIL_POOL_TIMEOUT', 30))
+    MAIL_POOL_KEEPALIVE = float(os.environ.get('MAIL_POOL_KEEPALIVE', 30))
+    MAIL_POOL_MAX_IDLE = float(os.environ.get('MAIL_POOL_MAX_IDLE', 240))
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    # Pool workers a bulk batch may occupy at once; keep it below PASSWORD_HASH_WORKERS.
+    PASSWORD_HASH_BULK_WORKERS = int(os.environ.get('PASSWORD_HASH_BULK_WORKERS', 1))
+    PROFILE_CACHE_BACKEND = os.environ.get('PROFILE_CACHE_BACKEND', 'memory')
+    PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 300))
+    PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 4096))
+    PROFILE_CACHE_REDIS_URL = os.environ.get('PROFILE_CACHE_REDIS_URL', 'redis://localhost:6379/1')
+    # The 'memory' backend is per process: a commit only evicts entries in the worker
+    # that made it, so its TTL is capped here. Use 'redis' with several workers.
+    PROFILE_CACHE_MEMORY_MAX_TTL = int(os.environ.get('PROFILE_CACHE_MEMORY_MAX_TTL', 15))
+    ANALYTICS_CACHE_BACKEND = os.environ.get('ANALYTICS_CACHE_BACKEND', 'memory')
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+    ANALYTICS_CACHE_REDIS_URL = os.environ.get('ANALYTICS_CACHE_REDIS_URL', 'redis://localhost:6379/1')
+    NOTIFICATION_CHUNK_SIZE = int(os.environ.get('NOTIFICATION_CHUNK_SIZE', 100))
+    NOTIFICATION_PAGE_SIZE = int(os.environ.get('NOTIFICATION_PAGE_SIZE', 1000))
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+    # A running import whose heartbeat is older than this is taken over by a redelivered task.
+    IMPORT_STALE_AFTER = int(os.environ.get('IMPORT_STALE_AFTER', 300))
+    # Every item is a bcrypt hash done inside the request; larger rosters go through
+    # the background import (POST /users/upload?import=students).
+    BULK_STUDENTS_MAX_ITEMS = int(os.environ.get('BULK_STUDENTS_MAX_ITEMS', 100))
+    BULK_STUDENTS_BATCH_SIZE = int(os.environ.get('BULK_STUDENTS_BATCH_SIZE', 500))
+    BLOB_STORAGE_BACKEND = os.environ.get('BLOB_STORAGE_BACKEND', 'local')
+    BLOB_STORAGE_PATH = os.environ.get('BLOB_STORAGE_PATH', os.path.join(basedir, 'instance', 'blobs'))
+    CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+    CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+    # Seconds a reserved, unacked task may run before Redis hands it to another worker.
+    CELERY_VISIBILITY_TIMEOUT = int(os.environ.get('CELERY_VISIBILITY_TIMEOUT', 3600))
+    # Per-worker rate limits; bulk chunks are throttled so they cannot saturate the SMTP relay.
+    CELERY_BULK_RATE_LIMIT = os.environ.get('CELERY_BULK_RATE_LIMIT', '30/m')
+    CELERY_TRANSACTIONAL_RATE_LIMIT = os.environ.get('CELERY_TRANSACTIONAL_RATE_LIMIT') or None
+    # Per-request query counting, slow-query logging and /metrics (see app.instrumentation).
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'true').lower() in ['true', 'on', '1']
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+    N_PLUS_ONE_RAISE = os.environ.get('N_PLUS_ONE_RAISE', 'false').lower() in ['true', 'on', '1']
 
 # Configure logging
 # logging.basicConfig()
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Country
+
+PENDING_FLAG = 'country_registry_stale'
+
+# Detached copy of a countries row, safe to share between threads and sessions.
+CountryRecord = namedtuple('CountryRecord', ('id', 'name', 'code'))
+
+
+class CountryRegistry:
+    """In-process lookup of countries by lowercased name or code.
+
+    The table is read once per process on first use and then served from
+    memory, so resolving a country during registration, roster imports or
+    seeding costs no query. The snapshot is reloaded after
+    COUNTRY_REGISTRY_TTL seconds, and right away once a transaction that
+    wrote a Country commits in this process; other processes pick the
+    change up within the TTL.
+    """
+
+    def __init__(self, app=None):
+        self._by_key = None
+        self._records = ()
+        self._loaded_at = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COUNTRY_REGISTRY_TTL', 300)
+        app.extensions['country_registry'] = self
+
+    def _snapshot(self):
+        with self._lock:
+            stale = time.monotonic() - self._loaded_at > current_app.config['COUNTRY_REGISTRY_TTL']
+            if self._by_key is None or stale or self._pid != os.getpid():
+                rows = db.session.execute(select(Country.id, Country.name, Country.code).order_by(Country.name))
+                self._records = tuple(CountryRecord(*row) for row in rows)
+                self._by_key = {}
+                for record in self._records:
+                    self._by_key[record.name.strip().lower()] = record
+                    self._by_key[record.code.strip().lower()] = record
+                self._loaded_at = time.monotonic()
+                self._pid = os.getpid()
+            return self._by_key, self._records
+
+    def resolve(self, name_or_code):
+        """The CountryRecord for a country name or ISO code, in any case, or None."""
+        if not name_or_code:
+            return None
+        by_key, _ = self._snapshot()
+        return by_key.get(str(name_or_code).strip().lower())
+
+    def lookup(self):
+        """Mapping of every lowercased name and code to its CountryRecord."""
+        return self._snapshot()[0]
+
+    def all(self):
+        """Every country, ordered by name."""
+        return list(self._snapshot()[1])
+
+    def names(self):
+        return [record.name for record in self.all()]
+
+    def invalidate(self):
+        with self._lock:
+            self._by_key = None
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_countries_changed(session, flush_context):
+    if any(isinstance(obj, Country) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info[PENDING_FLAG] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_countries(session):
+    if session.info.pop(PENDING_FLAG, False) and has_app_context() and 'country_registry' in current_app.extensions:
+        current_app.extensions['country_registry'].invalidate()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_country_changes(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_FLAG, None)
+
+
+country_registry = CountryRegistry()
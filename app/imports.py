@@ -0,0 +1,307 @@
+import logging
+import secrets
+from datetime import datetime
+from itertools import islice
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app import blob_storage, db, password_hasher
+from app.countries import country_registry
+from app.models import ImportJob, Student, StudentIDCounter, User
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'email', 'phone_number', 'country')
+OPTIONAL_COLUMNS = ('middle_name',)
+# Header spellings accepted for each column, after lowercasing and replacing spaces with underscores.
+COLUMN_ALIASES = {'country_name': 'country', 'phone': 'phone_number', 'email_address': 'email'}
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+IMPORTABLE_TYPES = ('csv', 'xlsx')
+
+logger = logging.getLogger(__name__)
+
+
+class RosterImportError(Exception):
+    """The file as a whole cannot be imported (unreadable, missing columns)."""
+
+
+class ImportInProgress(Exception):
+    """Another worker holds the job and its heartbeat is fresh; try again later."""
+
+
+def _cell_text(value):
+    """A worksheet cell as the text a CSV export of it would hold.
+
+    Excel stores every number as a float, so integral ones (phone numbers,
+    ids) are written without the trailing '.0'.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _read_chunks(file_type, stream, chunk_size):
+    """Yield DataFrames of at most `chunk_size` rows, all values as strings.
+
+    The index of each frame is the row's line number in the file, so errors
+    can point at the exact row.
+    """
+    if file_type == 'csv':
+        reader = pd.read_csv(stream, chunksize=chunk_size, dtype=str, keep_default_na=False, skipinitialspace=True)
+        for chunk in reader:
+            chunk.index = chunk.index + 2  # header is line 1
+            yield chunk
+        return
+
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RosterImportError("Excel imports require the 'openpyxl' package")
+    # read_only streams rows instead of loading the whole sheet.
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value) if value is not None else '' for value in next(rows, ())]
+        line = 2
+        while True:
+            block = list(islice(rows, chunk_size))
+            if not block:
+                return
+            cells = [[_cell_text(value) for value in row] for row in block]
+            yield pd.DataFrame(cells, columns=header, index=range(line, line + len(block)), dtype=object)
+            line += len(block)
+    finally:
+        workbook.close()
+
+
+def _normalize(chunk):
+    chunk = chunk.rename(columns=lambda name: str(name).strip().lower().replace(' ', '_'))
+    chunk = chunk.rename(columns=COLUMN_ALIASES)
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+    if missing:
+        raise RosterImportError(f"Missing required columns: {', '.join(missing)}")
+    for column in OPTIONAL_COLUMNS:
+        if column not in chunk.columns:
+            chunk[column] = ''
+    chunk = chunk[list(REQUIRED_COLUMNS + OPTIONAL_COLUMNS)].apply(lambda column: column.str.strip())
+    chunk['email'] = chunk['email'].str.lower()
+    return chunk
+
+
+class StudentWriter:
+    """Validates and inserts batches of students given as DataFrames.
+
+    A batch is validated column-wise with pandas and checked against the
+    database with one query per unique column. Valid rows get a block of
+    student ids per country from StudentIDCounter.reserve and go in with one
+    multi-row INSERT for users and one for students. Emails, phones and
+    usernames already written are remembered across batches. Committing is
+    left to the caller.
+    """
+
+    def __init__(self, source='file'):
+        # Where duplicates were found, for error messages ('file', 'request').
+        self.source = source
+        self.countries = country_registry.lookup()
+        self.seen_emails = set()
+        self.seen_phones = set()
+        self.seen_usernames = set()
+
+    def _taken(self, column, values):
+        values = list(values)
+        if not values:
+            return set()
+        return set(db.session.execute(select(column).where(column.in_(values))).scalars())
+
+    def validate(self, chunk):
+        """Per-row error messages (empty string for valid rows)."""
+        errors = pd.Series('', index=chunk.index)
+
+        def flag(mask, message):
+            errors[mask & (errors == '')] = message
+
+        for column in REQUIRED_COLUMNS:
+            flag(chunk[column] == '', f"Missing {column.replace('_', ' ')}")
+        flag(~chunk['email'].str.match(EMAIL_PATTERN), "Invalid email address")
+        flag(chunk['country'].str.lower().map(self.countries).isna(), "Unknown country")
+
+        flag(chunk['email'].duplicated() | chunk['email'].isin(self.seen_emails), f"Duplicate email in {self.source}")
+        flag(chunk['phone_number'].duplicated() | chunk['phone_number'].isin(self.seen_phones), f"Duplicate phone number in {self.source}")
+
+        emails = set(chunk['email'])
+        flag(chunk['email'].isin(self._taken(User.email, emails) | self._taken(Student.email, emails)), "Email already registered")
+        flag(chunk['phone_number'].isin(self._taken(Student.phone_number, set(chunk['phone_number']))), "Phone number already registered")
+        return errors
+
+    def _usernames(self, emails):
+        """Email local parts as usernames, falling back to the full address when one is taken."""
+        local = emails.str.split('@').str[0].str[:50]
+        taken = self._taken(User.username, set(local)) | self.seen_usernames
+        clash = local.isin(taken) | local.duplicated()
+        return local.where(~clash, emails.str[:50])
+
+    def remember(self, chunk):
+        self.seen_emails.update(chunk['email'])
+        self.seen_phones.update(chunk['phone_number'])
+
+    def insert(self, valid, password_hashes):
+        """Insert the validated rows; returns their `(id, student_id)` pairs in order."""
+        countries = valid['country'].str.lower().map(self.countries)
+        student_ids = pd.Series('', index=valid.index)
+        for country_id, rows in valid.groupby(countries.map(lambda country: country.id)).groups.items():
+            code = countries[rows[0]].code
+            first = StudentIDCounter.reserve(country_id, len(rows))
+            student_ids[rows] = [Student.generate_student_id(code, number) for number in range(first, first + len(rows))]
+
+        usernames = self._usernames(valid['email'])
+        user_ids = db.session.execute(
+            insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True),
+            [
+                {'email': email, 'username': username, 'password': password_hash, 'role': 'student'}
+                for email, username, password_hash in zip(valid['email'], usernames, password_hashes)
+            ]
+        ).scalars().all()
+
+        students = Student.__table__
+        created = db.session.execute(
+            insert(students).returning(students.c.id, students.c.student_id, sort_by_parameter_order=True),
+            [
+                {
+                    'first_name': row['first_name'],
+                    'middle_name': row['middle_name'] or None,
+                    'last_name': row['last_name'],
+                    'name': f"{row['first_name']} {row['last_name']}",
+                    'phone_number': row['phone_number'],
+                    'email': row['email'],
+                    'student_id': student_id,
+                    'country_id': country.id,
+                    'user_id': user_id,
+                }
+                for row, student_id, country, user_id in zip(valid.to_dict('records'), student_ids, countries, user_ids)
+            ]
+        ).all()
+        self.seen_usernames.update(usernames)
+        return created
+
+
+class RosterImporter(StudentWriter):
+    """Imports a student roster chunk by chunk, committing each chunk together
+    with the job's progress and row errors."""
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        # One hash for the whole file, made by the upload request. Without a default
+        # password, accounts get an unguessable one and are activated by setting a new one.
+        self.password_hash = job.password_hash or password_hasher.hash(secrets.token_urlsafe(32))
+
+    def import_chunk(self, chunk):
+        chunk = _normalize(chunk)
+        errors = self.validate(chunk)
+        valid = chunk[errors == '']
+        row_errors = [{'row': int(row), 'error': message} for row, message in errors[errors != ''].items()]
+
+        imported = 0
+        if not valid.empty:
+            try:
+                imported = len(self.insert(valid, [self.password_hash] * len(valid)))
+            except IntegrityError as e:
+                # Someone registered one of these rows since validation; report the chunk, keep going.
+                db.session.rollback()
+                self.job = db.session.get(ImportJob, self.job.id)
+                row_errors.extend({'row': int(row), 'error': f"Not imported: {e.orig}"} for row in valid.index)
+
+        self.remember(chunk)
+        self.job.processed_rows += len(chunk)
+        self.job.imported_rows += imported
+        self.job.add_errors(row_errors)
+        self.job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+
+def run_import(job_id):
+    """Import the roster behind ImportJob `job_id`, recording progress on the job as it goes.
+
+    Each chunk is committed together with `processed_rows`, so a job whose
+    worker died (the task is acked late and redelivered) resumes after the
+    last committed row once its heartbeat is IMPORT_STALE_AFTER seconds old.
+    Raises ImportInProgress while another worker still holds the job.
+    """
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.status not in ('queued', 'running'):
+        return
+    if not ImportJob.claim(job_id, current_app.config['IMPORT_STALE_AFTER']):
+        db.session.rollback()
+        raise ImportInProgress(f"Import job {job_id} is being run by another worker")
+    db.session.commit()
+    db.session.refresh(job)
+    if job.processed_rows:
+        logger.warning("Resuming roster import %s after row %s", job_id, job.processed_rows)
+
+    upload = job.file_upload
+    try:
+        importer = RosterImporter(job)
+        # Rows are numbered from line 2 (after the header); earlier ones were committed before.
+        resume_from = job.processed_rows + 2
+        with blob_storage.open(upload.file_key) as stream:
+            for chunk in _read_chunks(upload.file_type, stream, current_app.config['IMPORT_CHUNK_SIZE']):
+                done = chunk.index < resume_from
+                if done.any():
+                    importer.remember(_normalize(chunk[done]))
+                    chunk = chunk[~done]
+                    if chunk.empty:
+                        continue
+                importer.import_chunk(chunk)
+                job = importer.job
+        job.status = 'completed'
+    except Exception as e:
+        # Whatever went wrong (bad rows, a corrupt workbook, a missing blob, a busy
+        # hasher), the job must not be left 'running'.
+        db.session.rollback()
+        message = str(e)
+        if not isinstance(e, (RosterImportError, ValueError, pd.errors.ParserError)):
+            logger.exception("Roster import %s failed", job_id)
+            message = f"{type(e).__name__}: {e}"
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'failed'
+        job.message = message[:255]
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+# Keys accepted per student by create_students, as in POST /students.
+BULK_FIELDS = ('first_name', 'middle_name', 'last_name', 'phone_number', 'email', 'country_name', 'password')
+
+
+def create_students(items, batch_size=500):
+    """Create students from a list of dicts in one transaction.
+
+    Every item is validated up front, passwords of the valid ones are hashed
+    in parallel with PasswordHasher.hash_many, and rows are inserted
+    `batch_size` at a time. Returns one result per item, either
+    `{'index', 'result': 'created', 'id', 'student_id'}` or
+    `{'index', 'result': 'error', 'message'}`. The caller commits.
+    """
+    records = [item if isinstance(item, dict) else {} for item in items]
+    frame = pd.DataFrame.from_records(records, columns=BULK_FIELDS, index=range(len(records)))
+    frame = frame.astype(object).where(frame.notna(), '').astype(str)
+    passwords = frame.pop('password')
+    chunk = _normalize(frame.rename(columns={'country_name': 'country'}))
+
+    writer = StudentWriter(source='request')
+    errors = writer.validate(chunk)
+    errors[(passwords == '') & (errors == '')] = "Missing password"
+    valid = chunk[errors == '']
+
+    results = [{'index': int(index), 'result': 'error', 'message': message} for index, message in errors.items()]
+    hashes = password_hasher.hash_many(passwords[valid.index])
+    for start in range(0, len(valid), batch_size):
+        batch = valid.iloc[start:start + batch_size]
+        created = writer.insert(batch, hashes[start:start + batch_size])
+        writer.remember(batch)
+        for index, (pk, student_id) in zip(batch.index, created):
+            results[index] = {'index': int(index), 'result': 'created', 'id': pk, 'student_id': student_id}
+    return results
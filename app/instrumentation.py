@@ -0,0 +1,297 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, current_app, g, has_request_context, request
+from flask_restx.representations import output_json
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.passwords import LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Literal IN lists vary in length with the data; collapse them so one shape covers them all.
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneDetected(Exception):
+    """Raised at the end of a request when N_PLUS_ONE_RAISE is set and a statement shape repeated too often."""
+
+
+def statement_shape(statement):
+    """The statement with whitespace and IN-list lengths normalised; parameters are already placeholders."""
+    return _IN_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestStats:
+    """What one request did against the database, filled in by the engine hooks."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.slow = []
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed, keep):
+        self.queries += 1
+        self.db_seconds += elapsed
+        self.shapes[statement_shape(statement)] += 1
+        # Min-heap of the `keep` slowest statements so far.
+        if len(self.slow) < keep:
+            heapq.heappush(self.slow, (elapsed, statement))
+        elif keep and elapsed > self.slow[0][0]:
+            heapq.heapreplace(self.slow, (elapsed, statement))
+
+    def slowest(self):
+        return sorted(self.slow, reverse=True)
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class RequestMetrics:
+    """Per-endpoint counters and a duration histogram, aggregated in-process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.buckets = defaultdict(lambda: [0] * len(REQUEST_BUCKETS))
+            self.seconds = Counter()
+            self.queries = Counter()
+            self.db_seconds = Counter()
+            self.serialize_seconds = Counter()
+            self.slow_queries = Counter()
+            self.n_plus_one = Counter()
+
+    def observe(self, endpoint, method, status, elapsed, stats, slow_queries, n_plus_one):
+        key = (endpoint, method)
+        with self._lock:
+            self.requests[key + (str(status),)] += 1
+            self.seconds[key] += elapsed
+            for index, bound in enumerate(REQUEST_BUCKETS):
+                if elapsed <= bound:
+                    self.buckets[key][index] += 1
+            self.queries[key] += stats.queries
+            self.db_seconds[key] += stats.db_seconds
+            self.serialize_seconds[key] += stats.serialize_seconds
+            self.slow_queries[key] += slow_queries
+            self.n_plus_one[key] += n_plus_one
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'buckets': {key: list(counts) for key, counts in self.buckets.items()},
+                'seconds': dict(self.seconds),
+                'queries': dict(self.queries),
+                'db_seconds': dict(self.db_seconds),
+                'serialize_seconds': dict(self.serialize_seconds),
+                'slow_queries': dict(self.slow_queries),
+                'n_plus_one': dict(self.n_plus_one),
+            }
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram(lines, name, bounds, buckets, total, count, **labels):
+    # Both HashMetrics and RequestMetrics already count an observation in every
+    # bucket at or above it, which is Prometheus' cumulative `le` convention.
+    for bound, bucket in zip(bounds, buckets):
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {bucket}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {total}')
+    lines.append(f'{name}_count{_labels(**labels)} {count}')
+
+
+class Instrumentation:
+    """Flask extension that measures every request's database and serialization work.
+
+    Engine hooks count each SQL statement run during a request, its time and
+    its shape. At the end of the request:
+
+    * statements slower than SLOW_QUERY_MS are logged,
+    * a statement shape run N_PLUS_ONE_THRESHOLD or more times is logged as
+      a likely N+1 (and raised as NPlusOneDetected when N_PLUS_ONE_RAISE is
+      set, which is what tests want),
+    * with INSTRUMENTATION_HEADERS (on in debug) the numbers are returned as
+      X-Query-Count / X-DB-Time-ms / X-Serialize-Time-ms / X-N-Plus-One and
+      a Server-Timing header,
+    * totals per endpoint are added to the metrics served at /metrics in
+      the Prometheus text format, next to the password hashing metrics.
+
+    Serialization time is the time flask-restx spends encoding the response
+    body. Metrics are per process; scrape every worker.
+    """
+
+    def __init__(self, app=None, api=None):
+        self.metrics = RequestMetrics()
+        if app is not None:
+            self.init_app(app, api)
+
+    def init_app(self, app, api=None):
+        app.config.setdefault('INSTRUMENTATION_ENABLED', True)
+        app.config.setdefault('INSTRUMENTATION_HEADERS', app.debug)
+        app.config.setdefault('INSTRUMENTATION_SLOWEST', 5)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+        app.config.setdefault('N_PLUS_ONE_RAISE', False)
+        app.config.setdefault('METRICS_ENDPOINT', '/metrics')
+        app.extensions['instrumentation'] = self
+
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if app.config['METRICS_ENDPOINT']:
+            app.add_url_rule(app.config['METRICS_ENDPOINT'], 'metrics', self.metrics_view)
+        representation = api.representations.get('application/json', output_json) if api is not None else None
+        if representation is not None and not getattr(representation, 'instrumented', False):
+            api.representations['application/json'] = self._timed(representation)
+
+    def _timed(self, representation):
+        def timed_representation(data, code, headers=None):
+            started = time.perf_counter()
+            response = representation(data, code, headers)
+            stats = g.get('request_stats')
+            if stats is not None:
+                stats.serialize_seconds += time.perf_counter() - started
+            return response
+        timed_representation.instrumented = True
+        return timed_representation
+
+    def _start(self):
+        g.request_stats = RequestStats()
+
+    def _finish(self, response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        if response.is_streamed:
+            # The body is generated after this hook (stream_with_context keeps `g`, so its
+            # queries are still recorded): report once it has been sent. Headers are gone
+            # by then, and raising would only cut the stream short, so N+1s are logged.
+            config, method = current_app.config, request.method
+            response.call_on_close(lambda: self._report(config, stats, endpoint, method, response.status_code))
+            return response
+        g.pop('request_stats')
+        config = current_app.config
+        elapsed, repeated = self._report(config, stats, endpoint, request.method, response.status_code)
+
+        if config['INSTRUMENTATION_HEADERS']:
+            response.headers['X-Query-Count'] = str(stats.queries)
+            response.headers['X-DB-Time-ms'] = f'{stats.db_seconds * 1000:.1f}'
+            response.headers['X-Serialize-Time-ms'] = f'{stats.serialize_seconds * 1000:.1f}'
+            response.headers['X-N-Plus-One'] = str(len(repeated))
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_seconds * 1000:.1f}, serialize;dur={stats.serialize_seconds * 1000:.1f}, '
+                f'total;dur={elapsed * 1000:.1f}'
+            )
+        if repeated and config['N_PLUS_ONE_RAISE']:
+            shape, count = repeated[0]
+            raise NPlusOneDetected(f"{request.method} {endpoint} ran the same statement {count} times: {shape}")
+        return response
+
+    def _report(self, config, stats, endpoint, method, status):
+        """Log slow statements and likely N+1s and add the request to the metrics; returns (elapsed, repeated)."""
+        elapsed = time.perf_counter() - stats.started
+        slow_seconds = config['SLOW_QUERY_MS'] / 1000
+        slow = [(seconds, statement) for seconds, statement in stats.slowest() if seconds >= slow_seconds]
+        for seconds, statement in slow:
+            logger.warning("Slow query (%.1f ms) in %s %s: %s", seconds * 1000, method, endpoint, statement)
+        repeated = stats.repeated(config['N_PLUS_ONE_THRESHOLD'])
+        for shape, count in repeated:
+            logger.warning("Possible N+1 in %s %s: statement ran %d times: %s", method, endpoint, count, shape)
+
+        self.metrics.observe(endpoint, method, status, elapsed, stats, len(slow), len(repeated))
+        return elapsed, repeated
+
+    def render_metrics(self):
+        """All metrics in the Prometheus text exposition format."""
+        snapshot = self.metrics.snapshot()
+        lines = [
+            '# HELP shiloh_http_requests_total Requests handled, by endpoint, method and status.',
+            '# TYPE shiloh_http_requests_total counter',
+        ]
+        for (endpoint, method, status), count in sorted(snapshot['requests'].items()):
+            lines.append(f'shiloh_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        lines += ['# HELP shiloh_http_request_duration_seconds Request latency.',
+                  '# TYPE shiloh_http_request_duration_seconds histogram']
+        for (endpoint, method), buckets in sorted(snapshot['buckets'].items()):
+            count = sum(value for (e, m, _), value in snapshot['requests'].items() if (e, m) == (endpoint, method))
+            _histogram(lines, 'shiloh_http_request_duration_seconds', REQUEST_BUCKETS, buckets,
+                       snapshot['seconds'][(endpoint, method)], count, endpoint=endpoint, method=method)
+
+        for name, kind, description in (
+            ('queries', 'shiloh_db_queries_total', 'SQL statements run while handling requests.'),
+            ('db_seconds', 'shiloh_db_seconds_total', 'Time spent executing SQL while handling requests.'),
+            ('serialize_seconds', 'shiloh_serialize_seconds_total', 'Time spent encoding response bodies.'),
+            ('slow_queries', 'shiloh_db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.'),
+            ('n_plus_one', 'shiloh_db_n_plus_one_total', 'Statement shapes repeated N_PLUS_ONE_THRESHOLD or more times in one request.'),
+        ):
+            lines += [f'# HELP {kind} {description}', f'# TYPE {kind} counter']
+            for (endpoint, method), value in sorted(snapshot[name].items()):
+                lines.append(f'{kind}{_labels(endpoint=endpoint, method=method)} {value}')
+
+        hasher = current_app.extensions.get('password_hasher')
+        if hasher is not None:
+            hashing = hasher.metrics.snapshot()
+            lines += ['# HELP shiloh_password_hash_seconds bcrypt hash and verify latency.',
+                      '# TYPE shiloh_password_hash_seconds histogram']
+            for operation, calls in hashing['calls'].items():
+                _histogram(lines, 'shiloh_password_hash_seconds', LATENCY_BUCKETS, hashing['buckets'][operation],
+                           hashing['seconds'][operation], calls, operation=operation)
+            lines += ['# HELP shiloh_password_hash_rejected_total Hash calls shed with PasswordHashingBusy.',
+                      '# TYPE shiloh_password_hash_rejected_total counter',
+                      f"shiloh_password_hash_rejected_total {hashing['rejected']}",
+                      '# HELP shiloh_password_rehashed_total Hashes upgraded to the current work factor on login.',
+                      '# TYPE shiloh_password_rehashed_total counter',
+                      f"shiloh_password_rehashed_total {hashing['rehashed']}"]
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_failed_statement(exception_context):
+    if exception_context.connection is not None:
+        started = exception_context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if not has_request_context():
+        return
+    stats = g.get('request_stats')
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started, current_app.config['INSTRUMENTATION_SLOWEST'])
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,94 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, func, or_, select, update
+
+from app import db
+from app.models import Invoice, Payment
+
+
+def outstanding_balances():
+    """Per-student invoice totals as one `SUM ... GROUP BY student_id` query."""
+    open_invoice = Invoice.status != 'paid'
+    return db.session.query(
+        Invoice.student_id,
+        func.count(Invoice.id).label('invoices'),
+        func.sum(case((open_invoice, 1), else_=0)).label('open_invoices'),
+        func.sum(case((Invoice.status == 'overdue', 1), else_=0)).label('overdue_invoices'),
+        func.sum(Invoice.amount).label('invoiced'),
+        func.sum(Invoice.amount_paid).label('paid'),
+        func.sum(Invoice.amount - Invoice.amount_paid).label('outstanding'),
+        func.min(case((open_invoice, Invoice.due_date))).label('next_due_date'),
+    ).group_by(Invoice.student_id)
+
+
+def balance_to_dict(row):
+    return {
+        'student_id': row.student_id,
+        'invoices': row.invoices,
+        'open_invoices': row.open_invoices,
+        'overdue_invoices': row.overdue_invoices,
+        'invoiced': row.invoiced,
+        'paid': row.paid,
+        'outstanding': row.outstanding,
+        'next_due_date': row.next_due_date.isoformat() if row.next_due_date else None,
+    }
+
+
+def reconcile_invoices(connection, batch_size=1000, start_after=0, on_batch=None):
+    """Recompute `amount_paid` and `status` of every invoice from its payments.
+
+    Invoices are walked in id order, `batch_size` at a time; each batch is a
+    single UPDATE with a correlated SUM over payments that only touches rows
+    whose stored values are wrong, so memory stays bounded and a clean
+    ledger costs no writes. Statuses also move from unpaid/partial to
+    overdue as due dates pass. `on_batch(last_id, fixed)` is called after
+    each batch; the CLI uses it to commit. Returns `(last_id, fixed)`.
+    """
+    invoices = Invoice.__table__
+    paid = (
+        select(func.coalesce(func.sum(Payment.amount), 0))
+        .where(Payment.invoice_id == invoices.c.id)
+        .scalar_subquery()
+    )
+    status = Invoice.status_for(paid)
+
+    last_id = start_after
+    fixed = 0
+    while True:
+        upper = connection.execute(
+            select(func.max(invoices.c.id)).where(invoices.c.id.in_(
+                select(invoices.c.id).where(invoices.c.id > last_id).order_by(invoices.c.id).limit(batch_size)
+            ))
+        ).scalar()
+        if upper is None:
+            return last_id, fixed
+
+        result = connection.execute(
+            update(invoices)
+            .where(invoices.c.id > last_id, invoices.c.id <= upper)
+            .where(or_(invoices.c.amount_paid != paid, invoices.c.status.is_(None), invoices.c.status != status))
+            .values(amount_paid=paid, status=status)
+        )
+        fixed += result.rowcount
+        last_id = upper
+        if on_batch:
+            on_batch(last_id, fixed)
+
+
+@click.command('reconcile-invoices')
+@click.option('--batch-size', default=1000, show_default=True, help='Invoices per committed batch.')
+@click.option('--start-after', default=0, show_default=True, help='Resume after this invoice id.')
+@with_appcontext
+def reconcile_invoices_command(batch_size, start_after):
+    """Bring invoice paid totals and statuses in line with recorded payments.
+
+    Meant to run nightly (cron or the reconcile_invoices_task Celery task);
+    it also marks invoices overdue once their due date has passed.
+    """
+    with db.engine.connect() as connection:
+        def commit(last_id, fixed):
+            connection.commit()
+            click.echo(f"Reconciled invoices up to id {last_id} ({fixed} corrected)")
+
+        _, fixed = reconcile_invoices(connection, batch_size, start_after, on_batch=commit)
+    click.echo(f"Invoice reconciliation complete, {fixed} invoices corrected.")
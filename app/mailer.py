@@ -0,0 +1,145 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app
+from flask_mail import Connection
+
+logger = logging.getLogger(__name__)
+
+
+def is_connection_error(exc):
+    """True when the SMTP session itself is gone, as opposed to one message being refused.
+
+    smtplib.SMTPException subclasses OSError, so socket errors have to be told
+    apart from SMTP replies explicitly.
+    """
+    if isinstance(exc, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(exc, OSError) and not isinstance(exc, smtplib.SMTPException)
+
+
+class MailPoolExhausted(Exception):
+    """Raised when no SMTP connection frees up within MAIL_POOL_TIMEOUT seconds."""
+
+
+class PooledConnection(Connection):
+    """A Flask-Mail connection that stays open between checkouts."""
+
+    def __init__(self, mail):
+        super().__init__(mail)
+        self.host = None if mail.suppress else self.configure_host()
+        self.last_used = time.monotonic()
+
+    def is_alive(self):
+        if self.host is None:
+            return True
+        try:
+            return self.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def close(self):
+        if self.host is not None:
+            try:
+                self.host.quit()
+            except (smtplib.SMTPException, OSError):
+                self.host.close()
+            self.host = None
+
+
+class MailTransport:
+    """Flask extension that sends mail over a per-process pool of SMTP sessions.
+
+    Opening an SMTP session (TCP, STARTTLS, AUTH) costs far more than sending
+    a message over it, so up to MAIL_POOL_SIZE authenticated sessions are kept
+    open and reused by every sender in the process: the Celery email tasks,
+    notification chunks and the welcome email. Sessions idle for more than
+    MAIL_POOL_KEEPALIVE seconds are checked with NOOP before reuse, those idle
+    longer than MAIL_POOL_MAX_IDLE are replaced, and a session that drops
+    mid-send is discarded and the message retried once on a fresh one.
+    Settings are read from Flask-Mail's MAIL_* configuration.
+    """
+
+    def __init__(self, app=None):
+        self._idle = deque()
+        self._slots = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_POOL_SIZE', 4)
+        app.config.setdefault('MAIL_POOL_TIMEOUT', 30)
+        app.config.setdefault('MAIL_POOL_KEEPALIVE', 30)
+        app.config.setdefault('MAIL_POOL_MAX_IDLE', 240)
+        app.extensions['mail_transport'] = self
+
+    def _pool(self):
+        # Sockets do not survive fork, so each gunicorn/celery worker builds its own pool.
+        with self._lock:
+            if self._pool_pid != os.getpid():
+                self._idle = deque()
+                self._slots = threading.BoundedSemaphore(current_app.config['MAIL_POOL_SIZE'])
+                self._pool_pid = os.getpid()
+            return self._idle, self._slots
+
+    def _checkout(self, idle):
+        config = current_app.config
+        while True:
+            try:
+                connection = idle.pop()
+            except IndexError:
+                return PooledConnection(current_app.extensions['mail'])
+
+            idle_for = time.monotonic() - connection.last_used
+            if idle_for > config['MAIL_POOL_MAX_IDLE']:
+                connection.close()
+            elif idle_for > config['MAIL_POOL_KEEPALIVE'] and not connection.is_alive():
+                connection.close()
+            else:
+                return connection
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; it goes back to the pool unless the session broke."""
+        idle, slots = self._pool()
+        if not slots.acquire(timeout=current_app.config['MAIL_POOL_TIMEOUT']):
+            raise MailPoolExhausted("No SMTP connection became available, please retry shortly.")
+        connection = None
+        try:
+            connection = self._checkout(idle)
+            yield connection
+        except Exception as exc:
+            if connection is not None and is_connection_error(exc):
+                connection.close()
+                connection = None
+            raise
+        finally:
+            if connection is not None:
+                connection.last_used = time.monotonic()
+                idle.append(connection)
+            slots.release()
+
+    def send(self, message):
+        """Send one message, reconnecting once if the pooled session has dropped."""
+        try:
+            with self.connection() as connection:
+                connection.send(message)
+        except Exception as exc:
+            if not is_connection_error(exc):
+                raise
+            logger.info("SMTP session dropped, retrying on a fresh connection", exc_info=True)
+            with self.connection() as connection:
+                connection.send(message)
+
+    def close(self):
+        """Close every idle connection, e.g. when a worker shuts down."""
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
@@ -1,10 +1,9 @@
-import base64
-from app import db, bcrypt
+from app import db, mail_transport, password_hasher
 from sqlalchemy_serializer import SerializerMixin
-from datetime import datetime
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import Table, func
-from flask_mail import Mail, Message
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, Table, and_, case, event, func, or_
+from sqlalchemy.orm import selectinload
+from flask_mail import Message
 
 
 class Student(db.Model, SerializerMixin):
@@ -40,6 +39,7 @@ class Student(db.Model, SerializerMixin):
     
     finances = db.relationship('Finance', back_populates='student')
     enrollments = db.relationship('Enrollment', back_populates='student', cascade='all, delete-orphan')
+    balance_summary = db.relationship('StudentBalance', uselist=False, viewonly=True)
 
     
     @staticmethod
@@ -52,39 +52,24 @@ class Student(db.Model, SerializerMixin):
     def create_with_unique_id(cls, first_name, middle_name, last_name, phone_number, email, country_name, password):
         """Create a student with a unique ID based on the country."""
             
-        available_countries = Country.query.all()
-        country_names = [country.name for country in available_countries]
-        country_name = country_name.strip().lower()
+        from app.countries import country_registry
 
-        
-        country = Country.query.filter(Country.name.ilike(country_name)).first()  
-        
-        
-        if country:
-            print(f"Found country: {country.name}")
-        else:
-            print(f"Country not found for: {country_name}")
+        # Resolved from the in-process registry, by name or ISO code in any case.
+        country = country_registry.resolve(country_name)
         if not country:
             
-            raise ValueError(f"Invalid country name provided. Available countries are: {', '.join(country_names)}")
+            raise ValueError(f"Invalid country name provided. Available countries are: {', '.join(country_registry.names())}")
             
         
-        counter = StudentIDCounter.query.filter_by(country_id=country.id).first()
-        if not counter:
-            counter = StudentIDCounter(country_id=country.id, count=1)
-            db.session.add(counter)
-        else:
-            counter.count += 1
-
-        
-        try:
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-            raise ValueError("Failed to generate a unique student ID.")
+        # Claimed atomically on a connection of its own and committed right away,
+        # so the counter row is not held locked while the user and student are
+        # written and the caller's pending changes are not committed with it. A
+        # failed registration leaves a gap in the numbering, never a duplicate.
+        with db.engine.begin() as connection:
+            number = StudentIDCounter.reserve(country.id, 1, connection)
 
         
-        student_id = cls.generate_student_id(country.code, counter.count)
+        student_id = cls.generate_student_id(country.code, number)
 
         
         user = User(
@@ -93,10 +78,8 @@ class Student(db.Model, SerializerMixin):
             password=password,  
             role='student'  
         )
-        print(user)
         
         db.session.add(user)
-        db.session.commit()  
 
         
         new_student = cls(
@@ -107,7 +90,7 @@ class Student(db.Model, SerializerMixin):
             phone_number=phone_number,
             email=email,
             student_id=student_id,
-            country=country,
+            country_id=country.id,
             user=user  
         )
 
@@ -116,25 +99,60 @@ class Student(db.Model, SerializerMixin):
 
         return new_student
     
-    def to_dict(self):
-        """Convert the Student object to a dictionary."""
-        return {
-            'id': self.id,
-            'name': self.name,
-            'first_name': self.first_name,
-            'middle_name': self.middle_name,
-            'last_name': self.last_name,
-            'phone_number': self.phone_number,
-            'email': self.email,
-            'student_id': self.student_id,
-            'enrolled_date': self.enrolled_date.isoformat() if self.enrolled_date else None,
-            'country': self.country.name if self.country else None,
-            'user_id': self.user_id,
-            'teacher_id': self.teacher_id,
-            'teacher': self.teacher.name if self.teacher else None,  
-            'finances': [finance.to_dict() for finance in self.finances],  
-            'enrollments': [enrollment.to_dict() for enrollment in self.enrollments]  
+    SERIALIZABLE_FIELDS = (
+        'id', 'name', 'first_name', 'middle_name', 'last_name', 'phone_number', 'email',
+        'student_id', 'enrolled_date', 'country', 'user_id', 'teacher_id', 'teacher',
+        'finances', 'enrollments', 'balance'
+    )
+    # Default projection for lookups that only need to identify students.
+    SUMMARY_FIELDS = ('id', 'student_id', 'name', 'email')
+
+    @classmethod
+    def loader_options(cls, fields=None):
+        """Eager-loading plan for `to_dict(fields)`.
+
+        Every relationship the serializer touches is fetched with one
+        SELECT ... IN per level, so serializing a page costs a fixed number of
+        queries no matter how many students it holds.
+        """
+        fields = fields or cls.SERIALIZABLE_FIELDS
+        options = []
+        if 'country' in fields:
+            options.append(selectinload(cls.country))
+        if 'teacher' in fields:
+            options.append(selectinload(cls.teacher))
+        if 'finances' in fields:
+            options.append(selectinload(cls.finances))
+        if 'balance' in fields:
+            options.append(selectinload(cls.balance_summary))
+        if 'enrollments' in fields:
+            options.append(selectinload(cls.enrollments).options(*Enrollment.loader_options()))
+        return options
+
+    def to_dict(self, fields=None):
+        """Convert the Student object to a dictionary, optionally limited to `fields`."""
+        serializers = {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'first_name': lambda: self.first_name,
+            'middle_name': lambda: self.middle_name,
+            'last_name': lambda: self.last_name,
+            'phone_number': lambda: self.phone_number,
+            'email': lambda: self.email,
+            'student_id': lambda: self.student_id,
+            'enrolled_date': lambda: self.enrolled_date.isoformat() if self.enrolled_date else None,
+            'country': lambda: self.country.name if self.country else None,
+            'user_id': lambda: self.user_id,
+            'teacher_id': lambda: self.teacher_id,
+            'teacher': lambda: self.teacher.name if self.teacher else None,
+            'finances': lambda: [finance.to_dict() for finance in self.finances],
+            'enrollments': lambda: [enrollment.to_dict() for enrollment in self.enrollments],
+            'balance': lambda: (
+                self.balance_summary.to_dict() if self.balance_summary
+                else {'invoiced': 0, 'paid': 0, 'balance': 0}
+            )
         }
+        return {field: serializers[field]() for field in (fields or self.SERIALIZABLE_FIELDS)}
 
 
 
@@ -169,6 +187,24 @@ class StudentIDCounter(db.Model, SerializerMixin):
     
     country = db.relationship('Country')
 
+    @classmethod
+    def reserve(cls, country_id, n, connection=None):
+        """Atomically claim the next `n` numbers for a country; returns the first one.
+
+        A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING creates the
+        counter if needed and bumps it by `n`, so concurrent importers get
+        disjoint blocks without locking the table. Runs in the session's
+        transaction unless a `connection` is given.
+        """
+        executor = connection if connection is not None else db.session
+        insert = dialect_insert(connection if connection is not None else db.session.get_bind())
+        statement = insert(cls.__table__).values(country_id=country_id, count=n)
+        statement = statement.on_conflict_do_update(
+            index_elements=['country_id'],
+            set_={'count': cls.__table__.c.count + n}
+        ).returning(cls.__table__.c.count)
+        return executor.execute(statement).scalar_one() - n + 1
+
     def __repr__(self):
         return f"<StudentIDCounter {self.country.code} - {self.count}>"
 
@@ -183,7 +219,12 @@ class User(db.Model):
     username = db.Column(db.String(50), nullable=False, unique=True)
     _password = db.Column('password', db.String(255), nullable=False)
     role = db.Column(db.String(50), nullable=False)
-    user_profile_picture = db.Column(db.LargeBinary)
+    # Legacy inline picture; new pictures live in the blob store under profile_picture_key.
+    # Deferred so listing users never pulls the bytes; has_legacy_picture is enough for to_dict.
+    user_profile_picture = db.deferred(db.Column(db.LargeBinary), group='blobs')
+    has_legacy_picture = db.column_property(user_profile_picture.columns[0].isnot(None))
+    profile_picture_key = db.Column(db.String(64))
+    profile_picture_type = db.Column(db.String(100))
 
     @property
     def password(self):
@@ -191,15 +232,20 @@ class User(db.Model):
 
     @password.setter
     def password(self, password):
-        self._password = bcrypt.generate_password_hash(password).decode('utf-8')
+        self._password = password_hasher.hash(password)
 
     def check_password(self, password):
-        
-        return bcrypt.check_password_hash(self._password, password)
+        """Verify `password`, upgrading the stored hash if BCRYPT_LOG_ROUNDS changed."""
+        if not password_hasher.verify(self._password, password):
+            return False
+        if password_hasher.needs_rehash(self._password):
+            self.password = password
+            password_hasher.metrics.count_rehashed()
+        return True
     
     def generate_password_hash(self, password):
         
-        return bcrypt.generate_password_hash(password).decode('utf-8')
+        return password_hasher.hash(password)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -216,8 +262,8 @@ class User(db.Model):
         }
         
         
-        if self.user_profile_picture:
-            user_data['profile_picture'] = base64.b64encode(self.user_profile_picture).decode('utf-8')
+        if self.profile_picture_key or self.has_legacy_picture:
+            user_data['profile_picture'] = f'/users/{self.id}/profile_picture'
         else:
             user_data['profile_picture'] = None
 
@@ -232,7 +278,7 @@ class Finance(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
 
     
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     student = db.relationship('Student', back_populates='finances')
 
     
@@ -249,43 +295,6 @@ class Finance(db.Model, SerializerMixin):
         return f'<Finance Record: {self.transaction_type} - Amount: {self.amount} for Student ID: {self.student_id}>'
 
 
-class Enrollment(db.Model, SerializerMixin):
-    __tablename__ = 'enrollments'
-    serialize_rules = ('-student',)  
-
-    
-    id = db.Column(db.Integer, primary_key=True)
-
-    
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
-    student = db.relationship('Student', back_populates='enrollments')
-    courses = db.Column(db.String(255), nullable=False) 
-
-    
-    teachers = db.relationship(
-        'Teacher', 
-        secondary='enrollment_teacher_association', 
-        back_populates='enrollments'
-    )
-
-    
-    phone_number = db.Column(db.String(15), nullable=False)
-    enrollment_date = db.Column(db.DateTime, default=func.now())
-    document_file = db.Column(db.LargeBinary)
-
-    def __repr__(self):
-        return f'<Enrollment {self.id} for Student ID {self.student_id}>'
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'student_id': self.student_id,
-            'teachers': [teacher.to_dict() for teacher in self.teachers],
-            'phone_number': self.phone_number,
-            'enrollment_date': self.enrollment_date.isoformat(),
-        }
-
-
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
 
@@ -346,36 +355,146 @@ class FileUpload(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)  
     file_type = db.Column(db.String(50), nullable=False)  
-    file_data = db.Column(db.LargeBinary, nullable=False)  
+    # Legacy inline contents; new uploads live in the blob store under file_key.
+    file_data = db.deferred(db.Column(db.LargeBinary, nullable=True), group='blobs')
+    file_key = db.Column(db.String(64))
+    file_size = db.Column(db.Integer)
     upload_time = db.Column(db.DateTime, default=func.now())  
     
-    def __init__(self, filename, file_type, file_data):
+    def __init__(self, filename, file_type, file_data=None, file_key=None, file_size=None):
         self.filename = filename
         self.file_type = file_type
         self.file_data = file_data
+        self.file_key = file_key
+        self.file_size = file_size
     
     def to_dict(self):
         return {
             'id': self.id,
             'filename': self.filename,
             'file_type': self.file_type,
+            'file_size': self.file_size,
             'upload_time': self.upload_time
         }
 
+class ImportJob(db.Model):
+    """Progress and row errors of a background roster import (see app.imports)."""
+    __tablename__ = 'import_jobs'
+
+    # Only the first MAX_ERRORS row errors are kept; error_count is always exact.
+    MAX_ERRORS = 500
+
+    id = db.Column(db.Integer, primary_key=True)
+    file_upload_id = db.Column(db.Integer, db.ForeignKey('file_uploads.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False, default='students')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    imported_rows = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=False, default=list)
+    message = db.Column(db.String(255))
+    # Hash of the uploader's default password for the imported accounts, if one was given.
+    password_hash = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=func.now())
+    finished_at = db.Column(db.DateTime)
+    # Set when a worker claims the job and after every chunk it commits.
+    heartbeat_at = db.Column(db.DateTime)
+
+    file_upload = db.relationship('FileUpload')
+
+    @classmethod
+    def claim(cls, job_id, stale_after):
+        """Atomically take the job for this worker; returns False if another worker holds it.
+
+        A queued job can always be claimed. A running one can be claimed once
+        its heartbeat is older than `stale_after` seconds: its worker died, and
+        the task was redelivered.
+        """
+        now = datetime.utcnow()
+        return db.session.execute(
+            db.update(cls)
+            .where(cls.id == job_id)
+            .where(or_(
+                cls.status == 'queued',
+                and_(cls.status == 'running', or_(
+                    cls.heartbeat_at.is_(None), cls.heartbeat_at < now - timedelta(seconds=stale_after)
+                )),
+            ))
+            .values(status='running', heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+    def add_errors(self, errors):
+        self.error_count += len(errors)
+        room = self.MAX_ERRORS - len(self.errors)
+        if room > 0:
+            # Reassign so the JSON column is flagged as changed.
+            self.errors = self.errors + errors[:room]
+
+    def to_dict(self, include_errors=True):
+        data = {
+            'id': self.id,
+            'file_upload_id': self.file_upload_id,
+            'kind': self.kind,
+            'status': self.status,
+            'processed_rows': self.processed_rows,
+            'imported_rows': self.imported_rows,
+            'error_count': self.error_count,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_errors:
+            data['errors'] = self.errors
+        return data
+
 class Invoice(db.Model, SerializerMixin):
     __tablename__ = 'invoices'
+
+    STATUSES = ('unpaid', 'partial', 'paid', 'overdue')
+    # Float amounts: anything within half a cent of the total counts as settled.
+    TOLERANCE = 0.005
+
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
+    amount_paid = db.Column(db.Float, nullable=False, default=0, server_default='0')
     due_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(50), default='unpaid')
     student = db.relationship('Student', backref='invoices')
 
+    @classmethod
+    def status_for(cls, paid):
+        """SQL CASE giving the status an invoice should have once `paid` has been paid against it."""
+        return case(
+            (paid >= cls.amount - cls.TOLERANCE, 'paid'),
+            (cls.due_date < func.current_date(), 'overdue'),
+            (paid > 0, 'partial'),
+            else_='unpaid'
+        )
+
+    @classmethod
+    def record_payment(cls, invoice_id, amount):
+        """Add `amount` to the invoice's paid total and status in one UPDATE; returns (amount_paid, status)."""
+        paid = cls.amount_paid + amount
+        return db.session.execute(
+            db.update(cls)
+            .where(cls.id == invoice_id)
+            .values(amount_paid=paid, status=cls.status_for(paid))
+            .returning(cls.amount_paid, cls.status)
+        ).one_or_none()
+
+    @property
+    def balance(self):
+        return self.amount - (self.amount_paid or 0)
+
     def to_dict(self):
         return {
             'id': self.id,
             'student_id': self.student_id,
             'amount': self.amount,
+            'amount_paid': self.amount_paid,
+            'balance': self.balance,
             'due_date': self.due_date.isoformat(),
             'status': self.status
         }
@@ -383,7 +502,7 @@ class Invoice(db.Model, SerializerMixin):
 class Payment(db.Model, SerializerMixin):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.Date, nullable=False)
     invoice = db.relationship('Invoice', backref='payments')
@@ -421,17 +540,49 @@ class Notification(db.Model, SerializerMixin):
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=func.now())
 
+    # Fan-out progress: queued -> dispatching -> sending -> completed (or failed to queue).
+    status = db.Column(db.String(20), default='queued')
+    total_recipients = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    sent_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    failed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_at = db.Column(db.DateTime)
+
+    @classmethod
+    def record_progress(cls, notification_id, sent, failed):
+        """Add one chunk's outcome; the chunk that accounts for the last recipient completes the job."""
+        done = cls.sent_count + cls.failed_count + sent + failed
+        # The total is only final once the fan-out has finished dispatching ('sending').
+        finished = and_(cls.status == 'sending', done >= cls.total_recipients)
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == notification_id)
+            .values(
+                sent_count=cls.sent_count + sent,
+                failed_count=cls.failed_count + failed,
+                status=case((finished, 'completed'), else_=cls.status),
+                completed_at=case((finished, func.now()), else_=cls.completed_at),
+            )
+        )
+
     def to_dict(self):
         return {
             'id': self.id,
             'type': self.type,
             'subject': self.subject,
             'message': self.message,
-            'timestamp': self.timestamp.isoformat()
+            'timestamp': self.timestamp.isoformat(),
+            'status': self.status,
+            'total_recipients': self.total_recipients,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
         }
 
 class Grade(db.Model, SerializerMixin):
     __tablename__ = 'grades'
+    __table_args__ = (
+        db.Index('ix_grades_student_id_course', 'student_id', 'course'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     course = db.Column(db.String(255), nullable=False)
@@ -450,12 +601,104 @@ class Grade(db.Model, SerializerMixin):
         }
 
 class Attendance(db.Model):
+    __table_args__ = (
+        db.Index('ix_attendance_student_id_date', 'student_id', 'date'),
+        db.Index('ix_attendance_date', 'date'),
+        db.Index('ix_attendance_course_student_id', 'course', 'student_id'),
+        # ilike '%course%' on Postgres; needs the pg_trgm extension created below.
+        db.Index(
+            'ix_attendance_course_trgm', 'course',
+            postgresql_using='gin', postgresql_ops={'course': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+        # One mark per student, course and day; the upsert key for bulk marking. On SQLite
+        # it also lets substring course searches run as an index-only scan.
+        db.Index('uq_attendance_student_id_course_date', 'student_id', 'course', 'date', unique=True),
+    )
+
+    STATUSES = ('Present', 'Absent', 'Late')
+    # Statuses that count as attending when computing an attendance rate.
+    ATTENDED_STATUSES = ('Present', 'Late')
+
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     course = db.Column(db.String(255), nullable=False)  
     date = db.Column(db.Date, default=func.now(), nullable=False)
     status = db.Column(db.String(20), nullable=False)  
 
+    @classmethod
+    def upsert_many(cls, rows):
+        """Insert or update attendance `rows` (dicts), keeping CourseAttendanceSummary in step.
+
+        Core statements skip the ORM flush hooks, so the summary deltas are
+        worked out here, from what the database says each row was:
+
+        1. INSERT ... ON CONFLICT DO NOTHING RETURNING the keys it inserted.
+           Only one of several concurrent writers can insert a given key, so
+           only that writer counts it as new.
+        2. SELECT ... FOR UPDATE the rows that already existed. This locks
+           them and reads their latest committed status.
+        3. UPDATE the rows whose status changed, by id.
+        """
+        # The last row for a key wins, as it would with sequential upserts.
+        rows = list({(row['student_id'], row['course'], row['date']): row for row in rows}.values())
+        if not rows:
+            return
+        table = cls.__table__
+        insert = dialect_insert(db.session.get_bind())
+
+        inserted = set(db.session.execute(
+            insert(table).on_conflict_do_nothing(index_elements=['student_id', 'course', 'date'])
+            .returning(table.c.student_id, table.c.course, table.c.date),
+            rows
+        ).tuples())
+        changes = [(None, (row['course'], row['status'])) for row in rows
+                   if (row['student_id'], row['course'], row['date']) in inserted]
+
+        wanted = {(row['student_id'], row['course'], row['date']): row['status'] for row in rows}
+        for key in inserted:
+            wanted.pop(key)
+        updates = []
+        if wanted:
+            existing = db.session.execute(
+                db.select(table.c.id, table.c.student_id, table.c.course, table.c.date, table.c.status).where(
+                    table.c.student_id.in_({key[0] for key in wanted}),
+                    table.c.course.in_({key[1] for key in wanted}),
+                    table.c.date.in_({key[2] for key in wanted}),
+                ).with_for_update()
+            )
+            for row_id, student_id, course, day, old_status in existing:
+                new_status = wanted.get((student_id, course, day))
+                if new_status is not None and new_status != old_status:
+                    updates.append({'row_id': row_id, 'new_status': new_status})
+                    changes.append(((course, old_status), (course, new_status)))
+        if updates:
+            db.session.execute(
+                db.update(table).where(table.c.id == db.bindparam('row_id')).values(status=db.bindparam('new_status')),
+                updates
+            )
+        CourseAttendanceSummary.apply(db.session.connection(), CourseAttendanceSummary.deltas(changes))
+
+    @classmethod
+    def status_count_columns(cls):
+        """`total` plus one SUM(CASE ...) column per status, for use with GROUP BY."""
+        return [func.count(cls.id).label('total')] + [
+            func.sum(case((cls.status == status, 1), else_=0)).label(status.lower())
+            for status in cls.STATUSES
+        ]
+
+    @classmethod
+    def summarize_counts(cls, total, counts):
+        """Counts and rates for one aggregated row; `counts` maps lowercased status to count."""
+        total = total or 0
+        counts = {status.lower(): int(counts.get(status.lower()) or 0) for status in cls.STATUSES}
+        attended = sum(counts[status.lower()] for status in cls.ATTENDED_STATUSES)
+        return {
+            'total': total,
+            **counts,
+            'rates': {status: round(count / total, 4) if total else 0.0 for status, count in counts.items()},
+            'attendance_rate': round(attended / total, 4) if total else 0.0,
+        }
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -466,15 +709,152 @@ class Attendance(db.Model):
         }
 
 
+event.listen(
+    Attendance.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+# Databases whose INSERT supports ON CONFLICT ... RETURNING; create_app refuses any other.
+UPSERT_DIALECTS = ('postgresql', 'sqlite')
+
+
+def dialect_insert(bind):
+    """The INSERT construct with ON CONFLICT support for `bind`'s dialect."""
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert
+
+
+def increment_rows(connection, table, key_columns, rows):
+    """Add each row's non-key values onto the existing summary row, creating it if missing."""
+    if not rows:
+        return
+    statement = dialect_insert(connection)(table)
+    value_columns = [column for column in rows[0] if column not in key_columns]
+    statement = statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            **{column: table.c[column] + statement.excluded[column] for column in value_columns},
+            'updated_at': func.now(),
+        }
+    )
+    connection.execute(statement, rows)
+
+
+class StudentBalance(db.Model):
+    """Running invoiced/paid totals per student, kept in step by app.summaries."""
+    __tablename__ = 'student_balances'
+
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    invoiced = db.Column(db.Float, nullable=False, default=0)
+    paid = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    @classmethod
+    def apply(cls, connection, deltas):
+        """Apply `{student_id: {'invoiced': x, 'paid': y}}` increments."""
+        increment_rows(connection, cls.__table__, ['student_id'], [
+            {'student_id': student_id, 'invoiced': delta.get('invoiced', 0), 'paid': delta.get('paid', 0)}
+            for student_id, delta in deltas.items()
+            if student_id is not None and any(delta.values())
+        ])
+
+    def to_dict(self):
+        return {
+            'invoiced': self.invoiced,
+            'paid': self.paid,
+            'balance': self.invoiced - self.paid,
+        }
+
+
+class CourseAttendanceSummary(db.Model):
+    """Attendance mark counts per course, kept in step by app.summaries and Attendance.upsert_many."""
+    __tablename__ = 'course_attendance_summaries'
+
+    course = db.Column(db.String(255), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    present = db.Column(db.Integer, nullable=False, default=0)
+    absent = db.Column(db.Integer, nullable=False, default=0)
+    late = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    @staticmethod
+    def deltas(changes):
+        """Per-course count increments for `(old, new)` pairs of `(course, status)` (None when absent)."""
+        deltas = {}
+        for old, new in changes:
+            for key, sign in ((old, -1), (new, 1)):
+                if key is None:
+                    continue
+                course, status = key
+                delta = deltas.setdefault(course, dict.fromkeys(('total',) + tuple(s.lower() for s in Attendance.STATUSES), 0))
+                delta['total'] += sign
+                if status in Attendance.STATUSES:
+                    delta[status.lower()] += sign
+        return deltas
+
+    @classmethod
+    def apply(cls, connection, deltas):
+        increment_rows(connection, cls.__table__, ['course'], [
+            {'course': course, **delta} for course, delta in deltas.items() if any(delta.values())
+        ])
+
+    def to_dict(self):
+        return {
+            'course': self.course,
+            **Attendance.summarize_counts(self.total, {'present': self.present, 'absent': self.absent, 'late': self.late}),
+        }
+
+
+class CourseGradeSummary(db.Model):
+    """How many times each grade was awarded per course, kept in step by app.summaries."""
+    __tablename__ = 'course_grade_summaries'
+
+    course = db.Column(db.String(255), primary_key=True)
+    grade = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    @classmethod
+    def apply(cls, connection, deltas):
+        """Apply `{(course, grade): n}` increments."""
+        increment_rows(connection, cls.__table__, ['course', 'grade'], [
+            {'course': course, 'grade': grade, 'count': count}
+            for (course, grade), count in deltas.items() if count
+        ])
+
+    @staticmethod
+    def stats(rows):
+        """Distribution, total and (for numeric grades) mean over one course's summary rows."""
+        grades = {row.grade: row.count for row in rows if row.count}
+        numeric = []
+        for grade, count in grades.items():
+            try:
+                numeric.append((float(grade), count))
+            except ValueError:
+                pass
+        numeric_count = sum(count for _, count in numeric)
+        return {
+            'total': sum(grades.values()),
+            'grades': grades,
+            'average': round(sum(value * count for value, count in numeric) / numeric_count, 2) if numeric_count else None,
+        }
+
+
 def send_email(recipient, message):
-    mail = Mail()
     msg = Message(
         subject="Notification",
         sender="noreply@shilohproject.com",
         recipients=[recipient]
     )
     msg.body = message
-    mail.send(msg)
+    mail_transport.send(msg)
 
 def send_sms(recipient, message):
     
@@ -513,6 +893,34 @@ class Course(db.Model, SerializerMixin):
     def __repr__(self):
         return f'<Course {self.name}>'
 
+    @staticmethod
+    def parse_names(courses):
+        """Split a comma-separated course string into clean, de-duplicated names."""
+        names = []
+        for name in (courses or '').split(','):
+            name = name.strip()
+            if name and name.lower() not in {existing.lower() for existing in names}:
+                names.append(name)
+        return names
+
+    @classmethod
+    def get_or_create_many(cls, names):
+        """Resolve course names case-insensitively in one query, adding any that are missing."""
+        existing = {}
+        if names:
+            rows = cls.query.filter(func.lower(cls.name).in_([name.lower() for name in names])).order_by(cls.id)
+            for course in rows:
+                existing.setdefault(course.name.lower(), course)
+
+        courses = []
+        for name in names:
+            course = existing.get(name.lower())
+            if course is None:
+                course = existing[name.lower()] = cls(name=name)
+                db.session.add(course)
+            courses.append(course)
+        return courses
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -523,14 +931,22 @@ class Course(db.Model, SerializerMixin):
 
 
 
+db.Index('ix_courses_name_lower', func.lower(Course.name))
+
+
 enrollment_teacher_association = db.Table('enrollment_teacher_association',
     db.Column('enrollment_id', db.Integer, db.ForeignKey('enrollments.id'), primary_key=True),
     db.Column('teacher_id', db.Integer, db.ForeignKey('teachers.id'), primary_key=True)
 )
 
+enrollment_course_association = db.Table('enrollment_course_association',
+    db.Column('enrollment_id', db.Integer, db.ForeignKey('enrollments.id'), primary_key=True),
+    db.Column('course_id', db.Integer, db.ForeignKey('courses.id'), primary_key=True),
+    db.Index('ix_enrollment_course_association_course_id', 'course_id', 'enrollment_id')
+)
+
 class Enrollment(db.Model, SerializerMixin):
     __tablename__ = 'enrollments'
-    __table_args__ = {'extend_existing': True}
 
     serialize_rules = ('-student',)  
 
@@ -538,7 +954,7 @@ class Enrollment(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
 
     
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     student = db.relationship('Student', back_populates='enrollments')
 
     
@@ -552,20 +968,62 @@ class Enrollment(db.Model, SerializerMixin):
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=True)
     course = db.relationship('Course', back_populates='enrollments')
 
+    # Every course this enrollment covers (formerly a comma-separated string column).
+    courses = db.relationship('Course', secondary=enrollment_course_association)
+
     
     phone_number = db.Column(db.String(15), nullable=False)
     enrollment_date = db.Column(db.DateTime, default=func.now())
-    document_file = db.Column(db.LargeBinary)
+    # Legacy inline document; new documents live in the blob store under document_key.
+    document_file = db.deferred(db.Column(db.LargeBinary), group='blobs')
+    document_key = db.Column(db.String(64))
+    document_name = db.Column(db.String(255))
 
     def __repr__(self):
         return f'<Enrollment {self.id} for Student ID {self.student_id}>'
 
+    @classmethod
+    def enrolled_course_name(cls, student_id, course_name):
+        """The stored name of the course `course_name` (matched case-insensitively) if
+        the student is enrolled in it, else None. Save this name, not the request's spelling."""
+        return db.session.query(Course.name).join(
+            enrollment_course_association, enrollment_course_association.c.course_id == Course.id
+        ).join(
+            cls, cls.id == enrollment_course_association.c.enrollment_id
+        ).filter(
+            cls.student_id == student_id,
+            func.lower(Course.name) == course_name.strip().lower()
+        ).limit(1).scalar()
+
+    @classmethod
+    def enrolled_course_names(cls, student_ids, course_name):
+        """`{student_id: stored course name}` for those of `student_ids` enrolled in `course_name`, in a single query."""
+        rows = db.session.query(cls.student_id, Course.name).distinct().join(
+            enrollment_course_association, enrollment_course_association.c.enrollment_id == cls.id
+        ).join(
+            Course, Course.id == enrollment_course_association.c.course_id
+        ).filter(
+            cls.student_id.in_(student_ids),
+            func.lower(Course.name) == course_name.strip().lower()
+        )
+        return dict(rows.all())
+
+    @classmethod
+    def loader_options(cls):
+        """Eager-loading plan for `to_dict()`: courses, teachers and course, each with their nested lists."""
+        return (
+            selectinload(cls.courses),
+            selectinload(cls.teachers).selectinload(Teacher.courses).selectinload(Course.teachers),
+            selectinload(cls.course).selectinload(Course.teachers).selectinload(Teacher.courses),
+        )
+
     def to_dict(self):
         return {
             'id': self.id,
             'student_id': self.student_id,
             'teachers': [teacher.to_dict() for teacher in self.teachers],
             'course': self.course.to_dict() if self.course else None,
+            'courses': [course.name for course in self.courses],
             'phone_number': self.phone_number,
             'enrollment_date': self.enrollment_date.isoformat(),
         }
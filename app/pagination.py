@@ -0,0 +1,68 @@
+from urllib.parse import urlencode
+
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def parse_page_args(default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+    """Read `limit` and `cursor` from the query string.
+
+    `cursor` is the id of the last row seen on the previous page. Raises
+    ValueError on malformed values so callers can turn it into a 400.
+    """
+    try:
+        limit = int(request.args.get('limit', default_limit))
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("limit and cursor must be integers")
+
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, max_limit), cursor
+
+
+def parse_fields(allowed):
+    """Return the requested `fields=` projection, or None for all fields."""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed fields are: {', '.join(allowed)}")
+    return fields
+
+
+def keyset_paginate(query, column, cursor, limit):
+    """Fetch one page of `query` ordered by `column`, starting after `cursor`.
+
+    Returns `(rows, next_cursor)`. One extra row is fetched to know whether
+    another page exists, so no COUNT(*) is needed and the cost of a page does
+    not depend on how deep into the table it is.
+    """
+    if cursor is not None:
+        query = query.filter(column > cursor)
+    rows = query.order_by(column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = getattr(rows[-1], column.key)
+    return rows, next_cursor
+
+
+def page_headers(next_cursor):
+    """Response headers that advertise the next page, if there is one."""
+    if next_cursor is None:
+        return {}
+
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return {
+        'X-Next-Cursor': str(next_cursor),
+        'Link': f'<{request.base_url}?{urlencode(args)}>; rel="next"',
+    }
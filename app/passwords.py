@@ -0,0 +1,240 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+
+import bcrypt as bcrypt_lib
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing queue is full; routes answer with 429."""
+
+
+def _hash_password(password, rounds):
+    return bcrypt_lib.hashpw(password.encode('utf-8'), bcrypt_lib.gensalt(rounds)).decode('utf-8')
+
+
+def _hash_passwords(passwords, rounds):
+    return [_hash_password(password, rounds) for password in passwords]
+
+
+def _check_password(pw_hash, password):
+    return bcrypt_lib.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+def hash_cost(pw_hash):
+    """Work factor encoded in a bcrypt hash (`$2b$<cost>$...`)."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _release_when_done(futures, slots):
+    """Give the admission slot back once every future has finished or been cancelled.
+
+    A caller that times out stops waiting, but the work it queued keeps a
+    worker busy; holding the slot until then keeps the in-flight limit strict.
+    """
+    if not futures:
+        slots.release()
+        return
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            finished = not remaining[0]
+        if finished:
+            slots.release()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+class HashMetrics:
+    """Latency histogram and counters for hash/verify calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {'hash': 0, 'verify': 0}
+            self.seconds = {'hash': 0.0, 'verify': 0.0}
+            self.buckets = {op: [0] * len(LATENCY_BUCKETS) for op in self.calls}
+            self.rejected = 0
+            self.rehashed = 0
+
+    def observe(self, operation, elapsed):
+        with self._lock:
+            self.calls[operation] += 1
+            self.seconds[operation] += elapsed
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    self.buckets[operation][index] += 1
+
+    def count_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def count_rehashed(self):
+        with self._lock:
+            self.rehashed += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': dict(self.calls),
+                'seconds': dict(self.seconds),
+                'buckets': {op: list(counts) for op, counts in self.buckets.items()},
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+            }
+
+
+class PasswordHasher:
+    """Flask extension that runs bcrypt off the request thread.
+
+    Hash work goes to a per-process pool of `PASSWORD_HASH_WORKERS` processes.
+    At most `PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE` calls may be in
+    flight; beyond that PasswordHashingBusy is raised so a login spike is
+    shed with 429s instead of piling up on saturated workers. Batches from
+    hash_many use at most `PASSWORD_HASH_BULK_WORKERS` workers at a time, so
+    logins keep the rest. With zero workers hashing runs inline, which is
+    what scripts and tests want.
+    """
+
+    def __init__(self, app=None):
+        self.metrics = HashMetrics()
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.config.setdefault('PASSWORD_HASH_BULK_WORKERS', 1)
+        app.extensions['password_hasher'] = self
+
+    @property
+    def rounds(self):
+        return current_app.config['BCRYPT_LOG_ROUNDS']
+
+    def _executor(self):
+        # Pools do not survive fork, so each gunicorn/celery worker builds its own.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Imported on first use: it pulls in multiprocessing, which processes
+                # that never hash (beat, most Celery workers) need not load.
+                from concurrent.futures import ProcessPoolExecutor
+
+                workers = current_app.config['PASSWORD_HASH_WORKERS']
+                self._pool = ProcessPoolExecutor(max_workers=workers)
+                self._pool_pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(workers + current_app.config['PASSWORD_HASH_QUEUE_SIZE'])
+            return self._pool, self._slots
+
+    def _run(self, operation, func, *args):
+        started = time.perf_counter()
+        if not current_app.config['PASSWORD_HASH_WORKERS']:
+            result = func(*args)
+        else:
+            pool, slots = self._executor()
+            if not slots.acquire(blocking=False):
+                self.metrics.count_rejected()
+                raise PasswordHashingBusy("Too many password operations in progress, please retry shortly.")
+            futures = []
+            try:
+                futures.append(pool.submit(func, *args))
+            finally:
+                _release_when_done(futures, slots)
+            try:
+                result = futures[0].result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+            except FutureTimeout:
+                futures[0].cancel()
+                self.metrics.count_rejected()
+                raise PasswordHashingBusy("Password hashing timed out, please retry shortly.")
+
+        elapsed = time.perf_counter() - started
+        self.metrics.observe(operation, elapsed)
+        logger.debug("password %s took %.3fs", operation, elapsed)
+        return result
+
+    def hash(self, password):
+        return self._run('hash', _hash_password, password, self.rounds)
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords without starving interactive hashing.
+
+        Passwords are submitted one at a time, with at most
+        `PASSWORD_HASH_BULK_WORKERS` of them in the pool at once, so the
+        pool's FIFO queue never holds more than that many bulk jobs: a login
+        arriving mid-batch waits for at most one hash, and the remaining
+        workers stay free for it. The batch takes a single admission slot,
+        held until its last job has left the pool, and fails with
+        PasswordHashingBusy if no hash finishes within PASSWORD_HASH_TIMEOUT.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return []
+        started = time.perf_counter()
+        workers = current_app.config['PASSWORD_HASH_WORKERS']
+        if not workers:
+            hashes = _hash_passwords(passwords, self.rounds)
+        else:
+            pool, slots = self._executor()
+            if not slots.acquire(blocking=False):
+                self.metrics.count_rejected()
+                raise PasswordHashingBusy("Too many password operations in progress, please retry shortly.")
+            share = max(1, min(workers, current_app.config['PASSWORD_HASH_BULK_WORKERS']))
+            timeout = current_app.config['PASSWORD_HASH_TIMEOUT']
+            hashes = [None] * len(passwords)
+            in_flight = {}
+            try:
+                submitted = 0
+                while submitted < len(passwords) or in_flight:
+                    while submitted < len(passwords) and len(in_flight) < share:
+                        in_flight[pool.submit(_hash_password, passwords[submitted], self.rounds)] = submitted
+                        submitted += 1
+                    done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        for future in in_flight:
+                            future.cancel()
+                        self.metrics.count_rejected()
+                        raise PasswordHashingBusy("Password hashing timed out, please retry shortly.")
+                    for future in done:
+                        hashes[in_flight.pop(future)] = future.result()
+            finally:
+                _release_when_done(list(in_flight), slots)
+
+        # Individual timings are not visible from here; record the mean per hash.
+        elapsed = (time.perf_counter() - started) / len(passwords)
+        for _ in passwords:
+            self.metrics.observe('hash', elapsed)
+        return hashes
+
+    def verify(self, pw_hash, password):
+        return self._run('verify', _check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return hash_cost(pw_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
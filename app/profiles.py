@@ -0,0 +1,168 @@
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from app.cache import make_cache
+from app.models import (
+    Course, Enrollment, Finance, Invoice, Payment, Student, Teacher, User,
+    enrollment_course_association, enrollment_teacher_association,
+)
+
+PENDING_KEYS = 'profile_cache_pending'
+
+
+def student_key(email):
+    return f'profile:student:{email}'
+
+
+def teacher_key(user_id):
+    return f'profile:teacher:{user_id}'
+
+
+class ProfileCache:
+    """Caches the role payload (`student.to_dict()` / `teacher.to_dict()`) per user.
+
+    Entries expire after PROFILE_CACHE_TTL seconds and are dropped as soon as a
+    transaction that touched the underlying Student, Teacher, Finance,
+    Enrollment, Invoice, Payment, Course or User rows commits; a student's
+    entry also goes when their teacher or one of their courses changes, since
+    both are embedded in it. Only profiles that exist are cached, so students
+    created with Core inserts (imports, seed_scaled) show up immediately.
+
+    That eviction only reaches every worker with the shared 'redis' backend.
+    The 'memory' backend lives in one process, so commits made by other
+    gunicorn or Celery workers cannot evict its entries; its TTL is capped at
+    PROFILE_CACHE_MEMORY_MAX_TTL, which bounds how stale a profile can be.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PROFILE_CACHE_TTL', 300)
+        app.config.setdefault('PROFILE_CACHE_SIZE', 4096)
+        app.config.setdefault('PROFILE_CACHE_REDIS_URL', 'redis://localhost:6379/1')
+        app.config.setdefault('PROFILE_CACHE_MEMORY_MAX_TTL', 15)
+        ttl = app.config['PROFILE_CACHE_TTL']
+        if app.config['PROFILE_CACHE_BACKEND'] == 'memory':
+            ttl = min(ttl, app.config['PROFILE_CACHE_MEMORY_MAX_TTL'])
+        app.extensions['profile_cache'] = make_cache(
+            app.config['PROFILE_CACHE_BACKEND'],
+            ttl=ttl,
+            max_size=app.config['PROFILE_CACHE_SIZE'],
+            redis_url=app.config['PROFILE_CACHE_REDIS_URL'],
+            prefix='shiloh:profile:',
+        )
+
+    @property
+    def cache(self):
+        return current_app.extensions['profile_cache']
+
+    def role_details(self, user):
+        """`to_dict()` of the Student or Teacher behind `user`, or None."""
+        if user.role == 'student':
+            key = student_key(user.email)
+            query = Student.query.options(*Student.loader_options()).filter_by(email=user.email)
+        elif user.role == 'teacher':
+            key = teacher_key(user.id)
+            query = Teacher.query.filter_by(user_id=user.id)
+        else:
+            return None
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached['details']
+
+        profile = query.first()
+        if profile is None:
+            # Not cached: the profile may yet be created by a Core insert, which no hook sees.
+            return None
+        details = profile.to_dict()
+        self.cache.set(key, {'details': details})
+        return details
+
+    def invalidate(self, *keys):
+        self.cache.delete(*keys)
+
+
+def _old_values(obj, attr):
+    return inspect(obj).attrs[attr].history.deleted or ()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_profile_keys(session, flush_context):
+    keys = session.info.setdefault(PENDING_KEYS, set())
+    student_ids = set()
+    invoice_ids = set()
+    teacher_ids = set()
+    course_ids = set()
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Student):
+            keys.update(student_key(email) for email in chain([obj.email], _old_values(obj, 'email')))
+        elif isinstance(obj, (Finance, Enrollment, Invoice)):
+            student_ids.update(chain([obj.student_id], _old_values(obj, 'student_id')))
+        elif isinstance(obj, Payment):
+            invoice_ids.update(chain([obj.invoice_id], _old_values(obj, 'invoice_id')))
+        elif isinstance(obj, Teacher):
+            keys.update(teacher_key(user_id) for user_id in chain([obj.user_id], _old_values(obj, 'user_id')))
+            teacher_ids.add(obj.id)
+        elif isinstance(obj, Course):
+            if obj not in session.deleted:
+                keys.update(teacher_key(teacher.user_id) for teacher in obj.teachers)
+                teacher_ids.update(teacher.id for teacher in obj.teachers)
+            course_ids.add(obj.id)
+        elif isinstance(obj, User):
+            keys.add(teacher_key(obj.id))
+            keys.update(student_key(email) for email in chain([obj.email], _old_values(obj, 'email')))
+
+    invoice_ids.discard(None)
+    if invoice_ids:
+        student_ids.update(session.connection().execute(
+            select(Invoice.student_id).where(Invoice.id.in_(invoice_ids))
+        ).scalars())
+
+    # Students embed their teacher and each enrollment's teachers and courses.
+    teacher_ids.discard(None)
+    if teacher_ids:
+        student_ids.update(session.connection().execute(
+            select(Student.id).where(Student.teacher_id.in_(teacher_ids))
+            .union(select(Enrollment.student_id).join(
+                enrollment_teacher_association, enrollment_teacher_association.c.enrollment_id == Enrollment.id
+            ).where(enrollment_teacher_association.c.teacher_id.in_(teacher_ids)))
+        ).scalars())
+    course_ids.discard(None)
+    if course_ids:
+        student_ids.update(session.connection().execute(
+            select(Enrollment.student_id).outerjoin(
+                enrollment_course_association, enrollment_course_association.c.enrollment_id == Enrollment.id
+            ).where(or_(
+                Enrollment.course_id.in_(course_ids), enrollment_course_association.c.course_id.in_(course_ids)
+            )).distinct()
+        ).scalars())
+
+    student_ids.discard(None)
+    if student_ids:
+        emails = session.connection().execute(select(Student.email).where(Student.id.in_(student_ids))).scalars()
+        keys.update(student_key(email) for email in emails)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_profiles(session):
+    keys = session.info.pop(PENDING_KEYS, None)
+    if keys and has_app_context() and 'profile_cache' in current_app.extensions:
+        current_app.extensions['profile_cache'].delete(*keys)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_profiles(session, previous_transaction):
+    # A savepoint rollback leaves the outer transaction's changes pending.
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEYS, None)
+
+
+profile_cache = ProfileCache()
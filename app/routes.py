@@ -1,35 +1,42 @@
-import pandas as pd
-from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required
-from flask_bcrypt import Bcrypt
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, get_jwt_identity, jwt_required
 from flask_restx import Namespace, Resource, reqparse
 from datetime import datetime
-from app import db
-from app.models import Attendance, FileUpload, Student, User, Teacher, Finance, Enrollment, Event, Quiz, Question, ClassSchedule, Invoice, Payment, Notification, Grade, send_sms
+from app import api, celery, db, blob_storage, mail_transport, password_hasher
+from app.mailer import MailPoolExhausted, is_connection_error
+from app.passwords import PasswordHashingBusy
+from app.profiles import profile_cache
+from app.analytics import VIEWS as ANALYTICS_VIEWS, analytics
+from app.ledger import balance_to_dict, outstanding_balances, reconcile_invoices
+from app.streaming import stream_query, wants_stream
+from app.pagination import keyset_paginate, page_headers, parse_fields, parse_page_args
+from app.models import Attendance, FileUpload, Student, User, Teacher, Finance, Enrollment, Event, Quiz, Question, ClassSchedule, Invoice, Payment, Notification, Grade, Course, StudentBalance, CourseAttendanceSummary, CourseGradeSummary, ImportJob, enrollment_course_association, send_sms
 from marshmallow import ValidationError
 
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import BadRequest
 
 import os
+import logging
+import mimetypes
+from smtplib import SMTPException
 from io import BytesIO
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, send_file
 from sqlalchemy.exc import IntegrityError, OperationalError
-from flask_mail import Mail, Message
-from celery import Celery
+from sqlalchemy import case, distinct, exists, func
+from sqlalchemy.orm import undefer_group
+from flask_mail import Message
 
-# Initialize Celery
-celery = Celery(__name__, broker='redis://localhost:6379/0')
+logger = logging.getLogger(__name__)
 
 # Define the send_email function
 def send_email(recipient, subject, message):
-    mail = Mail()
     msg = Message(
         subject=subject,
         sender=current_app.config['MAIL_DEFAULT_SENDER'],
         recipients=[recipient]
     )
     msg.body = message
-    mail.send(msg)
+    mail_transport.send(msg)
 
 # Define the send_sms function````
 def send_sms(recipient, message):
@@ -46,9 +53,102 @@ def send_email_task(recipient, subject, message):
 def send_sms_task(recipient, message):
     send_sms(recipient, message)
 
-import time
+# Notification fan-out: stream recipients a page at a time and hand them to
+# chunk tasks, so no single task or broker message grows with the user count
+@celery.task
+def fan_out_notification_task(notification_id):
+    notification = db.session.get(Notification, notification_id)
+    if notification is None or notification.status != 'queued':
+        return
+    notification.status = 'dispatching'
+    db.session.commit()
+
+    chunk_size = current_app.config['NOTIFICATION_CHUNK_SIZE']
+    page_size = current_app.config['NOTIFICATION_PAGE_SIZE']
+    dispatched = 0
+    chunk = []
+    last_id = 0
+    while True:
+        page = db.session.query(User.id, User.email).filter(User.id > last_id).order_by(User.id).limit(page_size).all()
+        if not page:
+            break
+        last_id = page[-1].id
+        for _, email in page:
+            chunk.append(email)
+            if len(chunk) == chunk_size:
+                send_notification_chunk_task.delay(notification_id, chunk)
+                dispatched += len(chunk)
+                chunk = []
+    if chunk:
+        send_notification_chunk_task.delay(notification_id, chunk)
+        dispatched += len(chunk)
+
+    # Chunks may already have finished; completion is decided against the final total.
+    Notification.query.filter_by(id=notification_id).update({
+        Notification.total_recipients: dispatched,
+        Notification.status: case(
+            (Notification.sent_count + Notification.failed_count >= dispatched, 'completed'), else_='sending'
+        ),
+        Notification.completed_at: case(
+            (Notification.sent_count + Notification.failed_count >= dispatched, func.now()), else_=None
+        ),
+    }, synchronize_session=False)
+    db.session.commit()
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=30)
+def send_notification_chunk_task(self, notification_id, recipients):
+    notification = db.session.get(Notification, notification_id)
+    if notification is None:
+        return
+    sent = failed = 0
+
+    if notification.type == 'email':
+        try:
+            # One pooled SMTP session for the whole chunk instead of one per recipient
+            with mail_transport.connection() as connection:
+                for recipient in recipients:
+                    try:
+                        connection.send(Message(subject=notification.subject, recipients=[recipient], body=notification.message))
+                        sent += 1
+                    except SMTPException as exc:
+                        if is_connection_error(exc):
+                            raise
+                        logger.warning("Notification %s: could not deliver to %s", notification_id, recipient, exc_info=True)
+                        failed += 1
+        except (SMTPException, OSError, MailPoolExhausted) as exc:
+            remaining = recipients[sent + failed:]
+            if self.request.retries < self.max_retries:
+                Notification.record_progress(notification_id, sent, failed)
+                db.session.commit()
+                raise self.retry(args=(notification_id, remaining), exc=exc)
+            logger.error("Notification %s: giving up on %d recipients", notification_id, len(remaining), exc_info=True)
+            failed += len(remaining)
+    else:
+        for recipient in recipients:
+            send_sms(recipient, notification.message)
+            sent += 1
+
+    Notification.record_progress(notification_id, sent, failed)
+    db.session.commit()
+
+# Roster imports run chunk by chunk; progress is committed on the ImportJob row,
+# so a task redelivered after its worker died picks up where that worker stopped
+@celery.task(bind=True, max_retries=5)
+def import_students_task(self, job_id):
+    # app.imports pulls in pandas; only import workers and bulk requests pay for it
+    from app.imports import ImportInProgress, run_import
+    try:
+        run_import(job_id)
+    except ImportInProgress as exc:
+        raise self.retry(exc=exc, countdown=current_app.config['IMPORT_STALE_AFTER'])
+
+# Nightly invoice reconciliation; each batch commits on its own
+@celery.task
+def reconcile_invoices_task(batch_size=1000):
+    with db.engine.connect() as connection:
+        return reconcile_invoices(connection, batch_size, on_batch=lambda last_id, fixed: connection.commit())
 
-bcrypt = Bcrypt()
+import time
 
 students_ns = Namespace('students', description='Student management operations')
 users_ns = Namespace('users', description='User management operations')
@@ -121,24 +221,30 @@ grade_parser.add_argument('grade', type=str, required=True, help='Grade')
 #     user = User.query.get(user_id)  
 #     return user and user.role == 'admin'
 def is_admin():
-    claims = get_jwt_identity()  # Get all claims from the JWT token
-    print(claims)
-    return claims.get('role') == 'admin'
+    # The role is an additional claim of the access token; the identity is the user id
+    return get_jwt().get('role') == 'admin'
 
 def send_welcome_email(user):
-    mail = Mail()
     msg = Message(
         subject="Welcome to Shiloh Project",
         sender="noreply@shilohproject.com",
         recipients=[user.email]
     )
     msg.body = f"Hello {user.username},\n\nWelcome to Shiloh Project! We're excited to have you on board."
-    mail.send(msg)
+    mail_transport.send(msg)
 @students_ns.route('')
 class StudentListResource(Resource):
     def get(self):
-        students = Student.query.all()
-        return [student.to_dict() for student in students], 200
+        """List students one keyset page at a time (`limit`, `cursor`, `fields`)."""
+        try:
+            limit, cursor = parse_page_args()
+            fields = parse_fields(Student.SERIALIZABLE_FIELDS)
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        query = Student.query.options(*Student.loader_options(fields))
+        students, next_cursor = keyset_paginate(query, Student.id, cursor, limit)
+        return [student.to_dict(fields) for student in students], 200, page_headers(next_cursor)
 
     def post(self):
         data = request.get_json()
@@ -152,7 +258,6 @@ class StudentListResource(Resource):
         email = data.get('email')
         country_name = data.get('country_name')
         password=data.get('password')
-        print(data)
 
         required_fields = ["first_name", "middle_name", "last_name", "phone_number", "email", "country_name", "password"]
         missing_fields = [field for field in required_fields if not data.get(field)]
@@ -178,9 +283,43 @@ class StudentListResource(Resource):
             return new_student.to_dict(), 201
         except ValidationError as e:
             return {'error': str(e)}, 400
+        except IntegrityError:
+            # The email, phone or username was registered by a concurrent request
+            db.session.rollback()
+            return {'message': 'Student with this email or phone number already exists.'}, 409
+        except PasswordHashingBusy as e:
+            return {'message': str(e)}, 429, {'Retry-After': '1'}
         except Exception as e:
             return {'message': str(e)}, 500
 
+@students_ns.route('/bulk')
+class BulkStudentResource(Resource):
+    def post(self):
+        """Create many students at once: {students: [{first_name, ..., country_name, password}]}."""
+        data = request.get_json(silent=True)
+        items = data.get('students') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return {'message': 'A non-empty list of students is required'}, 400
+        max_items = current_app.config['BULK_STUDENTS_MAX_ITEMS']
+        if len(items) > max_items:
+            return {'message': f'At most {max_items} students per request; '
+                               'upload larger rosters to /users/upload?import=students'}, 413
+
+        from app.imports import create_students
+        try:
+            results = create_students(items, current_app.config['BULK_STUDENTS_BATCH_SIZE'])
+            db.session.commit()
+        except PasswordHashingBusy as e:
+            db.session.rollback()
+            return {'message': str(e)}, 429, {'Retry-After': '1'}
+        except IntegrityError:
+            # Another request registered one of these students meanwhile; nothing was created
+            db.session.rollback()
+            return {'message': 'Some students were registered concurrently, please retry.'}, 409
+
+        created = sum(result['result'] == 'created' for result in results)
+        return {'created': created, 'failed': len(results) - created, 'results': results}, 200
+
 @students_ns.route('/<int:student_id>')
 class StudentResource(Resource):
     def get(self, student_id):
@@ -209,15 +348,16 @@ class StudentResource(Resource):
 @users_ns.route('')
 class UserListResource(Resource):
     def get(self):
-        users = User.query.all()
-        return [user.to_dict() for user in users], 200
+        query = User.query
+        if wants_stream():
+            return stream_query(query)
+        return [user.to_dict() for user in query.all()], 200
 
     def post(self):
         data = user_parser.parse_args()
         email = data.get('email')
         username = data.get('username')
         password = data.get('password')
-        print(data)
 
         if not email or not username or not password:
             return {'message': 'Missing required fields'}, 400
@@ -284,11 +424,14 @@ class UserLoginResource(Resource):
         data = login_parser.parse_args()
         email = data['email']
         password = data['password']
-        print(data)
         
         # Fetch the user by username
         user = User.query.filter_by(email=email).first_or_404(description="email not found")
         if user and user.check_password(password):
+            if db.session.is_modified(user):
+                # check_password upgraded the hash to the current work factor
+                db.session.commit()
+
             # Generate both access token and refresh token
             access_token = create_access_token(identity=user.id, additional_claims={"role": user.role})
             refresh_token = create_refresh_token(identity=user.id)
@@ -301,19 +444,10 @@ class UserLoginResource(Resource):
                 'role': user.role,
             }
             
-            # Check if the user is a student and add the student data if role is "student"
-            if user.role == 'student':
-                student = Student.query.filter_by(email=user.email).first()
-                if student:
-                    # Include student data in the response
-                    response['student'] = student.to_dict()
-            
-            # Check if the user is a teacher and add the teacher data if role is "teacher"
-            if user.role == 'teacher':
-                teacher = Teacher.query.filter_by(user_id=user.id).first()
-                if teacher:
-                    # Include teacher data in the response
-                    response['teacher'] = teacher.to_dict()
+            # Include the cached student/teacher profile for those roles
+            details = profile_cache.role_details(user)
+            if details:
+                response[user.role] = details
             
             return response, 200
         else:
@@ -333,21 +467,12 @@ class UserResource(Resource):
         }
 
         # Add role-specific data
-        if user.role == 'student':
-            student = Student.query.filter_by(email=user.email).first()
-            if student:
-                response['role_data'] = {
-                    'role': 'student',
-                    'details': student.to_dict()  # Convert student object to dictionary
-                }
-        
-        elif user.role == 'teacher':
-            teacher = Teacher.query.filter_by(user_id=user.id).first()
-            if teacher:
-                response['role_data'] = {
-                    'role': 'teacher',
-                    'details': teacher.to_dict()  # Convert teacher object to dictionary
-                }
+        details = profile_cache.role_details(user)
+        if details:
+            response['role_data'] = {
+                'role': user.role,
+                'details': details
+            }
 
         return response, 200
 
@@ -366,7 +491,7 @@ class UserResource(Resource):
         if 'role' in data:
             user.role = data['role']
         if 'password' in data and data['password']:
-            user.password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+            user.password = data['password']
         try:
             db.session.commit()
             return user.to_dict(), 200
@@ -435,8 +560,10 @@ class FinanceListResource(Resource):
 
     @jwt_required()   
     def get(self):
-        finances = Finance.query.all()
-        return [finance.to_dict() for finance in finances], 200
+        query = Finance.query
+        if wants_stream():
+            return stream_query(query)
+        return [finance.to_dict() for finance in query.all()], 200
     
     @jwt_required()
     def post(self):
@@ -449,8 +576,10 @@ class FinanceListResource(Resource):
 @enrollments_ns.route('')
 class EnrollmentListResource(Resource):
     def get(self):
-        enrollments = Enrollment.query.all()
-        return [enrollment.to_dict() for enrollment in enrollments], 200
+        query = Enrollment.query.options(*Enrollment.loader_options())
+        if wants_stream():
+            return stream_query(query)
+        return [enrollment.to_dict() for enrollment in query.all()], 200
 
     def post(self):
         data = enrollment_parser.parse_args()
@@ -470,16 +599,20 @@ class EnrollmentListResource(Resource):
             if '.' not in document.filename or document.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
                 return {"message": "Invalid file type, allowed types are: pdf, docx, pptx"}, 400
 
+            course_names = Course.parse_names(data['courses'])
+            if not course_names:
+                return {"message": "Missing required fields: courses or phone_number"}, 400
+
             filename = secure_filename(document.filename)
-            file_data = document.read()
-            courses = data['courses']
+            document_key, _ = blob_storage.save(document.stream)
 
             new_enrollment = Enrollment(
                 student_id=student.id,
-                courses=courses,
+                courses=Course.get_or_create_many(course_names),
                 phone_number=data['phone_number'],
                 enrollment_date=data.get('enrollment_date', datetime.now()),
-                document_file=file_data
+                document_key=document_key,
+                document_name=filename
             )
 
             db.session.add(new_enrollment)
@@ -489,15 +622,22 @@ class EnrollmentListResource(Resource):
             db.session.rollback()
             return {"message": f"Error saving enrollment with document: {str(e)}"}, 500
 
+@enrollments_ns.route('/<int:enrollment_id>/document')
+class EnrollmentDocumentResource(Resource):
+    def get(self, enrollment_id):
+        """Download the document attached to an enrollment (supports Range requests)."""
+        enrollment = Enrollment.query.options(undefer_group('blobs')).get_or_404(enrollment_id)
+        return send_blob(enrollment.document_key, enrollment.document_file, enrollment.document_name)
+
 @enrollments_ns.route('/courses')
 class EnrollmentCoursesResource(Resource):
     def get(self):
         try:
-            enrollments = Enrollment.query.all()
-            all_courses = set()
-            for enrollment in enrollments:
-                all_courses.update(enrollment.courses.split(", "))
-            return {"courses": list(all_courses)}, 200
+            # Names of courses that have at least one enrollment
+            course_names = db.session.query(Course.name).join(
+                enrollment_course_association, enrollment_course_association.c.course_id == Course.id
+            ).distinct()
+            return {"courses": [name for (name,) in course_names]}, 200
         except Exception as e:
             return {"message": f"Error retrieving courses: {str(e)}"}, 500
 
@@ -661,6 +801,16 @@ class SubmitQuizResource(Resource):
 
 
 # Helper function to validate and save the file
+def send_blob(key, legacy_data, filename=None, mimetype=None, as_attachment=False):
+    """Serve a stored file, falling back to bytes still held in a legacy BYTEA column."""
+    mimetype = mimetype or (mimetypes.guess_type(filename)[0] if filename else None)
+    if key:
+        return blob_storage.send(key, mimetype=mimetype, download_name=filename, as_attachment=as_attachment)
+    if legacy_data:
+        return send_file(BytesIO(legacy_data), mimetype=mimetype or 'application/octet-stream',
+                         download_name=filename, as_attachment=as_attachment)
+    return {"message": "File not found"}, 404
+
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'xls', 'xlsx', 'csv'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -687,23 +837,81 @@ class FileUploadResource(Resource):
         filename = secure_filename(file.filename)
         file_type = filename.rsplit('.', 1)[1].lower()  # Get the file extension (type)
         
-        # Read the file data into memory as binary
-        file_data = file.read()  # Store the file's content in binary form
+        # import=students queues the file as a student roster import
+        import_kind = request.form.get('import') or request.args.get('import')
+        if import_kind not in (None, '', 'students'):
+            return {"message": "Only 'students' imports are supported"}, 400
+        if import_kind:
+            from app.imports import IMPORTABLE_TYPES
+            if file_type not in IMPORTABLE_TYPES:
+                return {"message": "Rosters must be uploaded as .csv or .xlsx"}, 400
+        # Only the hash is stored on the job; the password never reaches the broker
+        default_password = request.form.get('default_password')
+        password_hash = password_hasher.hash(default_password) if import_kind and default_password else None
 
         try:
-            # Create a new FileUpload instance to store the file data
-            new_file = FileUpload(filename=filename, file_type=file_type, file_data=file_data)
+            # Stream the upload into the blob store; the row only keeps its key
+            file_key, file_size = blob_storage.save(file.stream)
+            new_file = FileUpload(filename=filename, file_type=file_type, file_key=file_key, file_size=file_size)
             
             # Add the new file record to the database session
             db.session.add(new_file)
             db.session.commit()
             file.close()
-            return {"message": f"File '{filename}' uploaded successfully."}, 201
+            if not import_kind:
+                return {"message": f"File '{filename}' uploaded successfully."}, 201
+
+            job = ImportJob(file_upload_id=new_file.id, kind=import_kind, password_hash=password_hash)
+            db.session.add(job)
+            db.session.commit()
+            import_students_task.delay(job.id)
+            return {
+                "message": f"File '{filename}' uploaded, import queued.",
+                "job_id": job.id,
+                "status_url": api.url_for(ImportJobResource, job_id=job.id),
+            }, 202
 
         except Exception as e:
             db.session.rollback()  # Rollback the transaction if there's an error
             return {"message": f"Error processing file: {str(e)}"}, 500
 
+@users_ns.route('/imports/<int:job_id>')
+class ImportJobResource(Resource):
+    def get(self, job_id):
+        """Progress of a roster import, with the first row errors (`errors=0` leaves them out)."""
+        job = db.session.get(ImportJob, job_id)
+        if not job:
+            return {'message': 'Import job not found'}, 404
+        return job.to_dict(include_errors=request.args.get('errors') != '0'), 200
+
+@users_ns.route('/upload/<int:upload_id>')
+class FileDownloadResource(Resource):
+    def get(self, upload_id):
+        """Download a previously uploaded spreadsheet."""
+        upload = FileUpload.query.options(undefer_group('blobs')).get_or_404(upload_id)
+        return send_blob(upload.file_key, upload.file_data, upload.filename, as_attachment=True)
+
+@users_ns.route('/<int:user_id>/profile_picture')
+class UserProfilePictureResource(Resource):
+    def get(self, user_id):
+        user = User.query.options(undefer_group('blobs')).get_or_404(user_id)
+        return send_blob(user.profile_picture_key, user.user_profile_picture, mimetype=user.profile_picture_type)
+
+    @jwt_required()
+    def put(self, user_id):
+        if str(get_jwt_identity()) != str(user_id) and not is_admin():
+            return {"message": "You can only change your own profile picture."}, 403
+        user = User.query.get_or_404(user_id)
+        picture = request.files.get('profile_picture')
+        if not picture or not picture.mimetype.startswith('image/'):
+            return {"message": "Missing or invalid profile_picture image"}, 400
+
+        user.profile_picture_key, _ = blob_storage.save(picture.stream)
+        user.profile_picture_type = picture.mimetype
+        user.user_profile_picture = None
+        db.session.commit()
+        return user.to_dict(), 200
+
 def retry_on_operational_error(retries=3, delay=2):
     def decorator(func):
         def wrapper(*args, **kwargs):
@@ -729,16 +937,21 @@ class TeacherResource(Resource):
 @fees_ns.route('/invoices')
 class InvoiceResource(Resource):
     def get(self):
-        invoices = Invoice.query.all()
-        return [invoice.to_dict() for invoice in invoices], 200
+        query = Invoice.query
+        if wants_stream():
+            return stream_query(query)
+        return [invoice.to_dict() for invoice in query.all()], 200
 
     def post(self):
         data = request.get_json()
+        due_date = datetime.strptime(data['due_date'], '%Y-%m-%d').date()
+        # Status is derived from payments and the due date, never taken from the client.
         new_invoice = Invoice(
             student_id=data['student_id'],
             amount=data['amount'],
-            due_date=datetime.strptime(data['due_date'], '%Y-%m-%d'),
-            status=data.get('status', 'unpaid')
+            amount_paid=0,
+            due_date=due_date,
+            status='overdue' if due_date < datetime.utcnow().date() else 'unpaid'
         )
         db.session.add(new_invoice)
         db.session.commit()
@@ -747,19 +960,62 @@ class InvoiceResource(Resource):
 @fees_ns.route('/payments')
 class PaymentResource(Resource):
     def get(self):
-        payments = Payment.query.all()
-        return [payment.to_dict() for payment in payments], 200
+        query = Payment.query
+        if wants_stream():
+            return stream_query(query)
+        return [payment.to_dict() for payment in query.all()], 200
 
     def post(self):
         data = request.get_json()
+        try:
+            amount = float(data['amount'])
+        except (TypeError, ValueError):
+            return {'message': 'Payment amount must be a number'}, 400
+        if amount <= 0:
+            return {'message': 'Payment amount must be positive'}, 400
+
+        # The invoice total and status move in the same transaction, in one UPDATE, so
+        # concurrent payments against the same invoice cannot overwrite each other.
+        invoice = Invoice.record_payment(data['invoice_id'], amount)
+        if invoice is None:
+            db.session.rollback()
+            return {'message': 'Invoice not found'}, 404
+
         new_payment = Payment(
             invoice_id=data['invoice_id'],
-            amount=data['amount'],
+            amount=amount,
             payment_date=datetime.strptime(data['payment_date'], '%Y-%m-%d')
         )
         db.session.add(new_payment)
         db.session.commit()
-        return new_payment.to_dict(), 201
+        return {**new_payment.to_dict(), 'invoice_amount_paid': float(invoice.amount_paid), 'invoice_status': invoice.status}, 201
+
+@fees_ns.route('/balances')
+class OutstandingBalanceListResource(Resource):
+    def get(self):
+        """Outstanding balance per student, one keyset page at a time; `all=1` includes settled students."""
+        try:
+            limit, cursor = parse_page_args()
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+        query = outstanding_balances()
+        if request.args.get('all') not in ('1', 'true'):
+            query = query.having(func.sum(Invoice.amount - Invoice.amount_paid) > Invoice.TOLERANCE)
+        rows, next_cursor = keyset_paginate(query, Invoice.student_id, cursor, limit)
+        return [balance_to_dict(row) for row in rows], 200, page_headers(next_cursor)
+
+@fees_ns.route('/balances/<int:student_id>')
+class OutstandingBalanceResource(Resource):
+    def get(self, student_id):
+        """A student's balance totals and their unpaid invoices."""
+        row = outstanding_balances().filter(Invoice.student_id == student_id).one_or_none()
+        if row is None:
+            return {'message': 'No invoices for this student'}, 404
+        open_invoices = Invoice.query.filter(
+            Invoice.student_id == student_id, Invoice.status != 'paid'
+        ).order_by(Invoice.due_date).all()
+        return {**balance_to_dict(row), 'open': [invoice.to_dict() for invoice in open_invoices]}, 200
 
 @timetable_ns.route('/classes')
 class ClassScheduleResource(Resource):
@@ -784,47 +1040,98 @@ class NotificationResource(Resource):
     @retry_on_operational_error()
     def get(self):
         # Fetch all notifications from the database
-        notifications = Notification.query.all()
-        return [notification.to_dict() for notification in notifications], 200
+        query = Notification.query
+        if wants_stream():
+            return stream_query(query)
+        return [notification.to_dict() for notification in query.all()], 200
 
     @retry_on_operational_error()
     def post(self):
+        """Queue a notification to every user; delivery runs in the background.
+
+        Returns 202 with a job id whose progress is served by
+        /communication/notifications/<job id>.
+        """
         data = request.get_json()
         notification_type = data['type']
         subject = data.get('subject', 'Notification')
         message = data['message']
 
-        # Fetch all users
-        users = User.query.all()
-        recipients = [user.email for user in users]
-
-        if notification_type == 'email':
-            for recipient in recipients:
-                send_email_task.delay(recipient, subject, message)
-        elif notification_type == 'sms':
-            for recipient in recipients:
-                send_sms_task.delay(recipient, message)
-        else:
+        if notification_type not in ('email', 'sms'):
             return {'message': 'Invalid notification type'}, 400
 
-        # Save the notification to the database
-        new_notification = Notification(type=notification_type, subject=subject, message=message)
+        # Save the notification first; it is the job record the delivery tasks report into
+        new_notification = Notification(type=notification_type, subject=subject, message=message, status='queued')
         db.session.add(new_notification)
         db.session.commit()
 
-        return {'message': 'Notifications sent'}, 200
+        try:
+            fan_out_notification_task.delay(new_notification.id)
+        except Exception:
+            logger.exception("Could not queue notification %s", new_notification.id)
+            new_notification.status = 'failed'
+            db.session.commit()
+            return {'message': 'Notification could not be queued, please retry later.', 'job_id': new_notification.id}, 503
+
+        return {
+            'message': 'Notification queued',
+            'job_id': new_notification.id,
+            'status': new_notification.status,
+            'status_url': api.url_for(NotificationJobResource, notification_id=new_notification.id),
+        }, 202
+
+@communication_ns.route('/notifications/<int:notification_id>')
+class NotificationJobResource(Resource):
+    def get(self, notification_id):
+        """A notification and its delivery progress."""
+        notification = db.session.get(Notification, notification_id)
+        if not notification:
+            return {'message': 'Notification not found'}, 404
+        return notification.to_dict(), 200
 
 @reporting_ns.route('/analytics')
 class AnalyticsResource(Resource):
     def get(self):
-        # Implement analytics logic here
-        return {'message': 'Analytics data'}, 200
+        """Aggregated enrollment, fees, grades and attendance figures (`views=` picks a subset)."""
+        requested = request.args.get('views')
+        names = [name.strip() for name in requested.split(',') if name.strip()] if requested else list(ANALYTICS_VIEWS)
+        unknown = [name for name in names if name not in ANALYTICS_VIEWS]
+        if unknown:
+            return {'message': f"Unknown views: {', '.join(unknown)}. Available views are: {', '.join(ANALYTICS_VIEWS)}"}, 400
+
+        return {name: analytics.view(name) for name in names}, 200
+
+@reporting_ns.route('/students/<int:student_id>/balance')
+class StudentBalanceResource(Resource):
+    def get(self, student_id):
+        """Invoiced, paid and outstanding totals for one student, from the balance summary."""
+        if not db.session.get(Student, student_id):
+            return {'message': 'Student not found'}, 404
+        summary = db.session.get(StudentBalance, student_id)
+        balance = summary.to_dict() if summary else {'invoiced': 0, 'paid': 0, 'balance': 0}
+        return {'student_id': student_id, **balance}, 200
+
+@reporting_ns.route('/courses/<string:course>')
+class CourseSummaryResource(Resource):
+    def get(self, course):
+        """Attendance rates and grade statistics for one course, from the summary tables."""
+        attendance = db.session.get(CourseAttendanceSummary, course)
+        grades = CourseGradeSummary.query.filter_by(course=course).all()
+        if not (attendance and attendance.total) and not grades:
+            return {'message': 'No attendance or grades recorded for this course'}, 404
+        return {
+            'course': course,
+            'attendance': attendance.to_dict() if attendance else None,
+            'grades': CourseGradeSummary.stats(grades),
+        }, 200
 
 @grades_ns.route('')
 class GradeListResource(Resource):
     def get(self):
-        grades = Grade.query.all()
-        return [grade.to_dict() for grade in grades], 200
+        query = Grade.query
+        if wants_stream():
+            return stream_query(query)
+        return [grade.to_dict() for grade in query.all()], 200
 
     def post(self):
         data = grade_parser.parse_args()
@@ -892,70 +1199,200 @@ class AttendanceResource(Resource):
         student_id = data['student_id']
         course = data['course']
 
-        enrollment = Enrollment.query.filter_by(student_id=student_id).filter(Enrollment.courses.contains(course)).first()
-        if not enrollment:
+        enrolled_course = Enrollment.enrolled_course_name(student_id, course)
+        if enrolled_course is None:
             return {'message': f'Student ID {student_id} is not enrolled in course {course}'}, 404
+        # Store the course as it is named, so 'physics' and 'Physics' are one course
+        course = enrolled_course
 
         try:
-            attendance = Attendance(
-                student_id=student_id,
-                course=course,
-                date=datetime.utcnow().date(),
-                status=data['status']
-            )
-            db.session.add(attendance)
+            # Marking the same student, course and day again updates the status
+            today = datetime.utcnow().date()
+            Attendance.upsert_many([{'student_id': student_id, 'course': course, 'date': today, 'status': data['status']}])
             db.session.commit()
+            attendance = Attendance.query.filter_by(student_id=student_id, course=course, date=today).one()
             return {'message': 'Attendance marked', 'attendance': attendance.to_dict()}, 201
         except Exception as e:
             db.session.rollback()
             return {'message': f'Error marking attendance: {str(e)}'}, 500
 
 
+@attendance_ns.route('/bulk')
+class BulkAttendanceResource(Resource):
+    def post(self):
+        """Mark attendance for a whole class: {course, date, records: [{student_id, status}]}."""
+        data = request.get_json(silent=True)
+        if not data or not data.get('course') or not isinstance(data.get('records'), list):
+            return {'message': 'course and a list of records are required'}, 400
+
+        course = data['course'].strip()
+        try:
+            date = datetime.strptime(data['date'], '%Y-%m-%d').date() if data.get('date') else datetime.utcnow().date()
+        except (TypeError, ValueError):
+            return {'message': "date must be in 'YYYY-MM-DD' format"}, 400
+
+        # Validate shapes first so the database sees only well-formed rows
+        results, candidates = [], {}
+        for index, record in enumerate(data['records']):
+            record = record if isinstance(record, dict) else {}
+            student_id, status = record.get('student_id'), record.get('status')
+            if not isinstance(student_id, int) or isinstance(student_id, bool) or status not in Attendance.STATUSES:
+                results.append({'index': index, 'student_id': student_id, 'result': 'error',
+                                'message': f"student_id must be an integer and status one of {', '.join(Attendance.STATUSES)}"})
+            elif student_id in candidates:
+                results.append({'index': index, 'student_id': student_id, 'result': 'error',
+                                'message': 'Duplicate student_id in request'})
+            else:
+                candidates[student_id] = (index, status)
+                results.append(None)
+
+        enrolled = Enrollment.enrolled_course_names(list(candidates), course) if candidates else {}
+        if enrolled:
+            # Store the course as it is named, so 'physics' and 'Physics' are one course
+            course = next(iter(enrolled.values()))
+
+        rows = []
+        for student_id, (index, status) in candidates.items():
+            if student_id in enrolled:
+                rows.append({'student_id': student_id, 'course': enrolled[student_id], 'date': date, 'status': status})
+                results[index] = {'index': index, 'student_id': student_id, 'result': 'marked', 'status': status}
+            else:
+                results[index] = {'index': index, 'student_id': student_id, 'result': 'error',
+                                  'message': f'Student ID {student_id} is not enrolled in course {course}'}
+
+        try:
+            Attendance.upsert_many(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return {'message': f'Error marking attendance: {str(e)}'}, 500
+
+        return {
+            'course': course,
+            'date': date.isoformat(),
+            'marked': len(rows),
+            'failed': len(results) - len(rows),
+            'results': results
+        }, 200
+
+
 @attendance_ns.route('/report')
 class AttendanceReportResource(Resource):
+    GROUP_COLUMNS = {
+        'student': Attendance.student_id,
+        'course': Attendance.course,
+        'day': Attendance.date,
+    }
+
     def get(self):
-        """Generate attendance reports within a specified date range."""
+        """Attendance within a date range: raw rows, per-group counts (`group_by`) or totals (`summary=1`).
+
+        Grouped and summary modes are aggregated with GROUP BY in the
+        database. Raw rows and `group_by=student` are keyset-paginated with
+        `limit`/`cursor`.
+        """
         args = reqparse.RequestParser()
         args.add_argument('start_date', type=str, required=False, help="Start date in 'YYYY-MM-DD' format.")
         args.add_argument('end_date', type=str, required=False, help="End date in 'YYYY-MM-DD' format.")
+        args.add_argument('group_by', type=str, required=False, choices=tuple(self.GROUP_COLUMNS), help="One of: student, course, day.")
+        args.add_argument('summary', type=str, required=False, help="Set to 1 for totals over the whole range.")
         parsed_args = args.parse_args()
 
-        start_date = (
-            datetime.strptime(parsed_args.get('start_date'), '%Y-%m-%d') 
-            if parsed_args.get('start_date') else None
-        )
-        end_date = (
-            datetime.strptime(parsed_args.get('end_date'), '%Y-%m-%d') 
-            if parsed_args.get('end_date') else None
-        )
+        try:
+            start_date = (
+                datetime.strptime(parsed_args.get('start_date'), '%Y-%m-%d').date()
+                if parsed_args.get('start_date') else None
+            )
+            end_date = (
+                datetime.strptime(parsed_args.get('end_date'), '%Y-%m-%d').date()
+                if parsed_args.get('end_date') else None
+            )
+        except ValueError:
+            return {'message': "Dates must be in 'YYYY-MM-DD' format."}, 400
 
-        query = Attendance.query
+        filters = []
         if start_date:
-            query = query.filter(Attendance.date >= start_date)
+            filters.append(Attendance.date >= start_date)
         if end_date:
-            query = query.filter(Attendance.date <= end_date)
+            filters.append(Attendance.date <= end_date)
+
+        if parsed_args.get('summary') in ('1', 'true'):
+            row = db.session.query(
+                *Attendance.status_count_columns(),
+                func.count(distinct(Attendance.student_id)).label('students'),
+                func.count(distinct(Attendance.course)).label('courses')
+            ).filter(*filters).one()
+            return {
+                'start_date': start_date.isoformat() if start_date else None,
+                'end_date': end_date.isoformat() if end_date else None,
+                'students': row.students,
+                'courses': row.courses,
+                **Attendance.summarize_counts(row.total, row._mapping)
+            }, 200
+
+        group_by = parsed_args.get('group_by')
+        if group_by:
+            column = self.GROUP_COLUMNS[group_by]
+            query = db.session.query(column, *Attendance.status_count_columns()).filter(*filters).group_by(column)
+
+            headers = {}
+            if group_by == 'student':
+                try:
+                    limit, cursor = parse_page_args()
+                except ValueError as e:
+                    return {'message': str(e)}, 400
+                rows, next_cursor = keyset_paginate(query, column, cursor, limit)
+                headers = page_headers(next_cursor)
+            else:
+                rows = query.order_by(column).all()
+
+            return [
+                {group_by: row[0].isoformat() if group_by == 'day' else row[0],
+                 **Attendance.summarize_counts(row.total, row._mapping)}
+                for row in rows
+            ], 200, headers
+
+        query = Attendance.query.filter(*filters)
+        if wants_stream():
+            return stream_query(query.order_by(Attendance.id))
 
-        attendance_records = query.all()
-        return [record.to_dict() for record in attendance_records], 200
+        try:
+            limit, cursor = parse_page_args()
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        attendance_records, next_cursor = keyset_paginate(query, Attendance.id, cursor, limit)
+        return [record.to_dict() for record in attendance_records], 200, page_headers(next_cursor)
 
 
 @attendance_ns.route('/students_by_course')
 class StudentsByCourseResource(Resource):
     def get(self):
-        """Get all students who have attendance records for a specific course."""
+        """Students with attendance records for a course, one keyset page at a time.
+
+        Matches course names containing `course` (case-insensitive) unless
+        `match=exact`, which compares the whole name and can be answered from
+        the (course, student_id) index. Returns Student.SUMMARY_FIELDS unless
+        `fields=` asks for more.
+        """
         args = reqparse.RequestParser()
         args.add_argument('course', type=str, required=True, help="Course name is required.")
+        args.add_argument('match', type=str, required=False, default='contains', choices=('contains', 'exact'), help="One of: contains, exact.")
         parsed_args = args.parse_args()
         course_name = parsed_args.get('course')
 
-        # Fetch attendance records for the specific course
-        attendance_records = Attendance.query.filter(Attendance.course.ilike(f'%{course_name}%')).all()
-        
-        # Extract unique student IDs from attendance records
-        student_ids = {record.student_id for record in attendance_records}
+        try:
+            limit, cursor = parse_page_args()
+            fields = parse_fields(Student.SERIALIZABLE_FIELDS) or Student.SUMMARY_FIELDS
+        except ValueError as e:
+            return {'message': str(e)}, 400
 
-        # Query students by the extracted IDs
-        students = Student.query.filter(Student.id.in_(student_ids)).all()
+        if parsed_args.get('match') == 'exact':
+            course_filter = Attendance.course == course_name
+        else:
+            course_filter = Attendance.course.icontains(course_name, autoescape=True)
 
-        # Return the student data as a list of dictionaries
-        return [student.to_dict() for student in students], 200
+        # Semi-join: each student is returned once however many attendance rows match.
+        attended = exists().where(Attendance.student_id == Student.id, course_filter)
+        query = Student.query.options(*Student.loader_options(fields)).filter(attended)
+        students, next_cursor = keyset_paginate(query, Student.id, cursor, limit)
+        return [student.to_dict(fields) for student in students], 200, page_headers(next_cursor)
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from flask import current_app, send_file
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LocalBlobBackend:
+    """Content-addressed blobs on the local filesystem.
+
+    A blob lives at `<root>/<key[:2]>/<key[2:4]>/<key>` where the key is the
+    SHA-256 of its bytes, so identical uploads are stored once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, stream, chunk_size=CHUNK_SIZE):
+        """Copy `stream` to disk chunk by chunk; returns `(key, size)`."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+
+            key = digest.hexdigest()
+            target = self.path(key)
+            if os.path.exists(target):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+            return key, size
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def send(self, key, mimetype=None, download_name=None, as_attachment=False):
+        """Serve a blob with conditional and Range request support."""
+        return send_file(
+            self.path(key),
+            mimetype=mimetype or 'application/octet-stream',
+            download_name=download_name,
+            as_attachment=as_attachment,
+            conditional=True,
+            etag=key,
+        )
+
+
+BACKENDS = {
+    'local': LocalBlobBackend,
+}
+
+
+class BlobStorage:
+    """Flask extension exposing the configured blob backend."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('BLOB_STORAGE_BACKEND', 'local')
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown blob storage backend '{backend}'. Available backends are: {', '.join(BACKENDS)}")
+        app.extensions['blob_storage'] = BACKENDS[backend](app.config['BLOB_STORAGE_PATH'])
+
+    @property
+    def backend(self):
+        return current_app.extensions['blob_storage']
+
+    def save(self, stream, chunk_size=CHUNK_SIZE):
+        return self.backend.save(stream, chunk_size)
+
+    def save_bytes(self, data):
+        return self.backend.save(BytesIO(data))
+
+    def exists(self, key):
+        return self.backend.exists(key)
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def read(self, key):
+        with self.backend.open(key) as blob:
+            return blob.read()
+
+    def send(self, key, mimetype=None, download_name=None, as_attachment=False):
+        return self.backend.send(key, mimetype, download_name, as_attachment)
@@ -0,0 +1,29 @@
+import json
+
+from flask import Response, request, stream_with_context
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = 1000
+
+
+def wants_stream():
+    """True when the client asked for NDJSON via `?stream=1` or the Accept header."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def stream_query(query, serialize=None, batch_size=STREAM_BATCH_SIZE):
+    """Stream the rows of `query` as newline-delimited JSON.
+
+    Rows are fetched `batch_size` at a time with `yield_per` (a server-side
+    cursor on Postgres) and written out as soon as they are serialized, so
+    memory per request stays flat however large the table is.
+    """
+    serialize = serialize or (lambda row: row.to_dict())
+
+    def generate():
+        for row in query.yield_per(batch_size):
+            yield json.dumps(serialize(row), default=str) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
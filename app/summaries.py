@@ -0,0 +1,141 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Attendance, CourseAttendanceSummary, CourseGradeSummary, Grade, Invoice, Payment, StudentBalance,
+)
+
+
+def _old_value(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+def _before_after(session, obj, attrs):
+    """`(old, new)` tuples of `attrs` for a flushed object; None for the side that does not exist."""
+    before = None if obj in session.new else tuple(_old_value(obj, attr) for attr in attrs)
+    after = None if obj in session.deleted else tuple(getattr(obj, attr) for attr in attrs)
+    return before, after
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_summaries(session, flush_context):
+    """Fold this flush's Attendance, Grade, Invoice and Payment changes into the summary tables.
+
+    The increments run on the flush's connection, so they commit or roll
+    back together with the rows that caused them. Attendance written with
+    Attendance.upsert_many bypasses the flush and updates its summary there.
+    """
+    attendance_changes = []
+    grade_deltas = {}
+    balance_deltas = {}
+    payment_changes = []
+    # Invoices in this flush, so payments deleted along with their invoice still find the student.
+    invoice_students = {}
+
+    def add_balance(student_id, column, amount):
+        balance_deltas.setdefault(student_id, {}).setdefault(column, 0)
+        balance_deltas[student_id][column] += amount
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Attendance):
+            old, new = _before_after(session, obj, ('course', 'status'))
+            if old != new:
+                attendance_changes.append((old, new))
+        elif isinstance(obj, Grade):
+            old, new = _before_after(session, obj, ('course', 'grade'))
+            if old != new:
+                for key, sign in ((old, -1), (new, 1)):
+                    if key is not None:
+                        grade_deltas[key] = grade_deltas.get(key, 0) + sign
+        elif isinstance(obj, Invoice):
+            old, new = _before_after(session, obj, ('student_id', 'amount'))
+            invoice_students[obj.id] = (old or new)[0]
+            if old != new:
+                for values, sign in ((old, -1), (new, 1)):
+                    if values is not None:
+                        add_balance(values[0], 'invoiced', sign * (values[1] or 0))
+                if old is not None and new is not None and old[0] != new[0]:
+                    # Payments follow their invoice to the new student.
+                    payment_changes.append(('invoice', obj.id, old[0], new[0]))
+        elif isinstance(obj, Payment):
+            old, new = _before_after(session, obj, ('invoice_id', 'amount'))
+            if old != new:
+                for values, sign in ((old, -1), (new, 1)):
+                    if values is not None:
+                        payment_changes.append(('payment', values[0], sign * (values[1] or 0)))
+
+    if not (attendance_changes or grade_deltas or balance_deltas or payment_changes):
+        return
+
+    connection = session.connection()
+    invoice_ids = {change[1] for change in payment_changes}
+    if invoice_ids:
+        students = {**invoice_students, **dict(connection.execute(
+            select(Invoice.id, Invoice.student_id).where(Invoice.id.in_(invoice_ids))
+        ).all())}
+        moved = [change for change in payment_changes if change[0] == 'invoice']
+        moved_paid = dict(connection.execute(
+            select(Payment.invoice_id, func.sum(Payment.amount))
+            .where(Payment.invoice_id.in_([change[1] for change in moved]))
+            .group_by(Payment.invoice_id)
+        ).all()) if moved else {}
+        for change in payment_changes:
+            if change[0] == 'payment':
+                _, invoice_id, amount = change
+                add_balance(students.get(invoice_id), 'paid', amount)
+            else:
+                _, invoice_id, old_student_id, new_student_id = change
+                paid = moved_paid.get(invoice_id) or 0
+                add_balance(old_student_id, 'paid', -paid)
+                add_balance(new_student_id, 'paid', paid)
+
+    CourseAttendanceSummary.apply(connection, CourseAttendanceSummary.deltas(attendance_changes))
+    CourseGradeSummary.apply(connection, grade_deltas)
+    StudentBalance.apply(connection, balance_deltas)
+
+
+def rebuild_summaries(connection):
+    """Recompute every summary table from the source rows in three INSERT ... SELECT statements."""
+    for model in (StudentBalance, CourseAttendanceSummary, CourseGradeSummary):
+        connection.execute(delete(model.__table__))
+
+    paid = (
+        select(Payment.invoice_id, func.sum(Payment.amount).label('paid'))
+        .group_by(Payment.invoice_id)
+        .subquery()
+    )
+    connection.execute(insert(StudentBalance.__table__).from_select(
+        ['student_id', 'invoiced', 'paid'],
+        select(Invoice.student_id, func.sum(Invoice.amount), func.coalesce(func.sum(paid.c.paid), 0))
+        .outerjoin(paid, paid.c.invoice_id == Invoice.id)
+        .group_by(Invoice.student_id)
+    ))
+    connection.execute(insert(CourseAttendanceSummary.__table__).from_select(
+        ['course', 'total'] + [status.lower() for status in Attendance.STATUSES],
+        select(
+            Attendance.course, func.count(Attendance.id),
+            *(func.sum(case((Attendance.status == status, 1), else_=0)) for status in Attendance.STATUSES)
+        ).group_by(Attendance.course)
+    ))
+    connection.execute(insert(CourseGradeSummary.__table__).from_select(
+        ['course', 'grade', 'count'],
+        select(Grade.course, Grade.grade, func.count(Grade.id)).group_by(Grade.course, Grade.grade)
+    ))
+
+
+@click.command('rebuild-summaries')
+@with_appcontext
+def rebuild_summaries_command():
+    """Recompute the reporting summary tables from scratch.
+
+    The tables are kept current incrementally; this is for repairing drift,
+    e.g. after rows were changed by hand outside the application.
+    """
+    from app import db
+
+    with db.engine.begin() as connection:
+        rebuild_summaries(connection)
+    click.echo("Reporting summaries rebuilt.")
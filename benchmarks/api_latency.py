@@ -0,0 +1,279 @@
+"""Latency percentiles and queries per request for the read endpoints of the REST API.
+
+Seeds a scratch database with seed.seed_scaled (scale 1.0 is 100k students,
+1M attendance rows and 500k finance rows), then calls every benchmarked
+endpoint of the students, attendance, fees, grades and quizzes namespaces
+through the Flask test client and records latency percentiles, SQL
+statements per request (from app.instrumentation) and response sizes.
+--workers adds a load phase: that many processes hit a random mix of the
+endpoints for --duration seconds and the combined throughput and latencies
+are reported.
+
+    DATABASE_URI=sqlite:////tmp/bench.db python benchmarks/api_latency.py --scale 0.1 --output before.json
+    DATABASE_URI=postgresql://localhost/bench python benchmarks/api_latency.py --skip-seed --workers 4 \\
+        --output after.json --compare before.json
+
+Results are written as JSON (--output) so runs on different commits can be
+compared; --compare prints the change against an earlier file. Endpoints
+that return a whole table are marked heavy and run --heavy-requests times.
+Streamed (NDJSON) responses report 0 queries, as their rows are read after
+the instrumentation has closed the request. DATABASE_URI must point at a
+database you can throw away: unless --skip-seed is given, all tables are
+dropped and recreated.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+
+from sqlalchemy import func, select  # noqa: E402
+
+import seed  # noqa: E402
+from app import db  # noqa: E402
+from app.models import Attendance, Course, Grade, Quiz, Student  # noqa: E402
+
+# seed builds the app on import; reuse it rather than building a second one.
+app = seed.app
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Dataset:
+    """Ids and names the endpoint paths are filled in from."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.student_ids = db.session.execute(select(func.min(Student.id), func.max(Student.id))).one()
+        self.grade_ids = db.session.execute(select(func.min(Grade.id), func.max(Grade.id))).one()
+        self.quiz_ids = db.session.execute(select(func.min(Quiz.id), func.max(Quiz.id))).one()
+        self.courses = db.session.execute(select(Course.name).order_by(Course.id)).scalars().all()
+        self.first_day, self.last_day = db.session.execute(select(func.min(Attendance.date), func.max(Attendance.date))).one()
+        if None in self.student_ids or not self.courses or self.first_day is None:
+            raise SystemExit("The database has no students or attendance; run without --skip-seed.")
+
+    def student(self):
+        return self.rng.randint(*self.student_ids)
+
+    def grade(self):
+        return self.rng.randint(*self.grade_ids)
+
+    def quiz(self):
+        return self.rng.randint(*self.quiz_ids)
+
+    def course(self):
+        return self.rng.choice(self.courses)
+
+    def week(self):
+        start = self.first_day.toordinal() + self.rng.randrange(max(1, (self.last_day - self.first_day).days - 7))
+        return datetime.fromordinal(start).date().isoformat(), datetime.fromordinal(start + 7).date().isoformat()
+
+
+def _week_rows(data):
+    start, end = data.week()
+    return f'/attendance/report?start_date={start}&end_date={end}&limit=100'
+
+
+# (name, path builder, heavy)
+ENDPOINTS = [
+    ('students.list', lambda data: '/students?limit=50', False),
+    ('students.list_page', lambda data: f'/students?limit=50&cursor={data.student()}', False),
+    ('students.list_fields', lambda data: '/students?limit=50&fields=id,name,country,enrollments', False),
+    ('students.detail', lambda data: f'/students/{data.student()}', False),
+    ('attendance.report_rows', _week_rows, False),
+    ('attendance.report_summary', lambda data: '/attendance/report?summary=1', False),
+    ('attendance.report_by_course', lambda data: '/attendance/report?group_by=course', False),
+    ('attendance.report_by_student', lambda data: '/attendance/report?group_by=student&limit=50', False),
+    ('attendance.students_by_course', lambda data: f'/attendance/students_by_course?course={data.course()}&match=exact', False),
+    ('attendance.students_by_course_contains', lambda data: f'/attendance/students_by_course?course={data.course()[:4]}', False),
+    ('fees.balances', lambda data: '/fees/balances?limit=50', False),
+    ('fees.balance', lambda data: f'/fees/balances/{data.student()}', False),
+    ('fees.invoices', lambda data: '/fees/invoices', True),
+    ('fees.invoices_stream', lambda data: '/fees/invoices?stream=1', True),
+    ('fees.payments', lambda data: '/fees/payments', True),
+    ('grades.list', lambda data: '/grades', True),
+    ('grades.list_stream', lambda data: '/grades?stream=1', True),
+    ('grades.detail', lambda data: f'/grades/{data.grade()}', False),
+    ('quizzes.list', lambda data: '/quizzes', True),
+    ('quizzes.questions', lambda data: f'/quizzes/{data.quiz()}/questions', False),
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    summary = {f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 3) for pct in PERCENTILES}
+    summary.update(
+        mean_ms=round(sum(latencies) / len(latencies) * 1000, 3),
+        max_ms=round(latencies[-1] * 1000, 3),
+    )
+    return summary
+
+
+def call(client, path):
+    started = time.perf_counter()
+    response = client.get(path)
+    body = response.get_data()  # drains streamed responses too
+    elapsed = time.perf_counter() - started
+    return elapsed, response.status_code, int(response.headers.get('X-Query-Count', -1)), len(body)
+
+
+def measure(client, data, builder, requests, warmup):
+    for _ in range(warmup):
+        call(client, builder(data))
+    latencies, queries, sizes, statuses = [], [], [], {}
+    for _ in range(requests):
+        elapsed, status, query_count, size = call(client, builder(data))
+        latencies.append(elapsed)
+        queries.append(query_count)
+        sizes.append(size)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': requests,
+        **summarize(latencies),
+        'queries_per_request': {'min': min(queries), 'max': max(queries), 'mean': round(sum(queries) / len(queries), 2)},
+        'mean_response_bytes': int(sum(sizes) / len(sizes)),
+        'status': statuses,
+    }
+
+
+def _load_worker(args):
+    index, names, duration, random_seed = args
+    # Connections must not be shared with the parent after fork.
+    with app.app_context():
+        db.engine.dispose(close=False)
+        data = Dataset(random.Random(random_seed + index))
+        builders = [builder for name, builder, _ in ENDPOINTS if name in names]
+        client = app.test_client()
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            elapsed, status, _, _ = call(client, data.rng.choice(builders)(data))
+            latencies.append(elapsed)
+            errors += status >= 500
+        db.session.remove()
+    return latencies, errors
+
+
+def load(names, workers, duration, random_seed):
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        results = pool.map(_load_worker, [(index, names, duration, random_seed) for index in range(workers)])
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    return {
+        'workers': workers,
+        'duration_s': duration,
+        'endpoints': sorted(names),
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / duration, 1),
+        'server_errors': sum(errors for _, errors in results),
+        **summarize(latencies),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+    print(f"\nChange against {previous_path} ({previous['meta'].get('commit')}):")
+    for name, current in results['endpoints'].items():
+        before = previous['endpoints'].get(name)
+        if not before:
+            continue
+        ratio = current['p95_ms'] / before['p95_ms'] if before['p95_ms'] else float('inf')
+        queries = current['queries_per_request']['mean'] - before['queries_per_request']['mean']
+        print(f"  {name:<40} p95 {before['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({ratio:5.2f}x)"
+              f"  queries {queries:+.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.1, help='Dataset size; 1.0 is 100k students.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the dataset and the request mix.')
+    parser.add_argument('--skip-seed', action='store_true', help='Benchmark the data already in DATABASE_URI.')
+    parser.add_argument('--requests', type=int, default=100, help='Measured requests per endpoint.')
+    parser.add_argument('--heavy-requests', type=int, default=5, help='Measured requests per whole-table endpoint.')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--endpoints', nargs='*', help='Only endpoints whose name starts with one of these.')
+    parser.add_argument('--workers', type=int, default=0, help='Processes for the load phase; 0 skips it.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds the load phase runs.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--compare', help='Earlier results file to compare against.')
+    args = parser.parse_args()
+
+    app.config.update(INSTRUMENTATION_HEADERS=True, N_PLUS_ONE_RAISE=False)
+    selected = [
+        endpoint for endpoint in ENDPOINTS
+        if not args.endpoints or any(endpoint[0].startswith(prefix) for prefix in args.endpoints)
+    ]
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'scale': args.scale,
+            'seed': args.seed,
+        },
+        'endpoints': {},
+    }
+    with app.app_context():
+        results['meta']['database'] = db.engine.dialect.name
+        if not args.skip_seed:
+            db.drop_all()
+            db.create_all()
+            started = time.perf_counter()
+            results['meta']['rows'] = seed.seed_scaled(args.scale, args.seed)
+            results['meta']['seed_seconds'] = round(time.perf_counter() - started, 2)
+        data = Dataset(random.Random(args.seed))
+        db.session.remove()
+
+        client = app.test_client()
+        for name, builder, heavy in selected:
+            requests = args.heavy_requests if heavy else args.requests
+            result = measure(client, data, builder, requests, min(args.warmup, requests))
+            results['endpoints'][name] = result
+            print(f"{name:<40} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                  f"p99 {result['p99_ms']:>9.2f} ms  queries {result['queries_per_request']['mean']:>6.1f}")
+        db.session.remove()
+
+    if args.workers:
+        light = {name for name, _, heavy in selected if not heavy}
+        results['load'] = load(light, args.workers, args.duration, args.seed)
+        print(f"load: {results['load']['requests_per_s']} req/s over {args.workers} workers, "
+              f"p50 {results['load']['p50_ms']:.2f} ms, p99 {results['load']['p99_ms']:.2f} ms, "
+              f"{results['load']['server_errors']} server errors")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Cold-start budget for web and worker processes, measured with `python -X importtime`.
+
+Imports wsgi in a fresh interpreter, which is exactly what a new gunicorn or
+Celery worker does: every module is imported and the app is built once
+through create_app. The run fails (exit status 1) when
+
+  * any module in FORBIDDEN is imported at startup; those belong in the
+    code paths that use them (app.imports, seed.seed_scaled), or
+  * the best of --runs startups takes longer than --budget-ms.
+
+    SECRET_KEY=x JWT_SECRET_KEY=x DATABASE_URI=sqlite:////tmp/boot.db python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 1500 --top 15 --output import-time.json
+
+The slowest top-level packages are listed so a regression can be traced to
+the module that caused it. tests/test_startup.py runs the same two checks
+under pytest.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy libraries the app must not load until a request or task needs them
+# (concurrent.futures.process is the bcrypt pool of app.passwords).
+FORBIDDEN = ('pandas', 'numpy', 'openpyxl', 'concurrent.futures.process')
+STARTUP_BUDGET_MS = 2000
+
+# `import time:  self [us] | cumulative | imported package`
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\S+)$')
+STARTUP = (
+    "import time\n"
+    "started = time.perf_counter()\n"
+    "import wsgi\n"
+    "print((time.perf_counter() - started) * 1000)\n"
+)
+
+
+def boot():
+    """Start wsgi in a new interpreter; returns (wall ms, {module: (self us, cumulative us)})."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode:
+        raise SystemExit(f"Starting the app failed:\n{completed.stderr[-2000:]}")
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, name = match.groups()
+            modules[name] = (int(own), int(cumulative))
+    return float(completed.stdout.strip().splitlines()[-1]), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                        help='Longest acceptable import-and-build time of the app.')
+    parser.add_argument('--runs', type=int, default=3, help='Startups to measure; the fastest counts.')
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level packages to list.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    args = parser.parse_args()
+
+    runs = [boot() for _ in range(max(1, args.runs))]
+    wall_ms, modules = min(runs, key=lambda run: run[0])
+    # Packages by the time their first import took, including everything it pulled in.
+    top_level = sorted(
+        ((name, cumulative) for name, (_, cumulative) in modules.items() if '.' not in name and name != 'wsgi'),
+        key=lambda item: item[1], reverse=True,
+    )
+    forbidden = sorted(name for name in modules if name in FORBIDDEN)
+
+    print(f"startup {wall_ms:.0f} ms (budget {args.budget_ms:.0f} ms), "
+          f"{len(modules)} modules, best of {len(runs)}")
+    for name, cumulative in top_level[:args.top]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    failures = []
+    if forbidden:
+        failures.append(f"imported at startup: {', '.join(forbidden)}")
+    if wall_ms > args.budget_ms:
+        failures.append(f"startup took {wall_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'startup_ms': round(wall_ms, 1),
+                'runs_ms': [round(run[0], 1) for run in runs],
+                'budget_ms': args.budget_ms,
+                'modules': len(modules),
+                'forbidden': forbidden,
+                'top_level_ms': {name: round(cumulative / 1000, 1) for name, cumulative in top_level[:args.top]},
+            }, output, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Query plans and timings for the hot filter queries, before and after indexing.
+
+Fills a scratch database with synthetic rows, then runs each query with the
+indexes from migration 9c3e5d7a1b24 dropped and again with them created,
+printing the plan and the median latency of each run:
+
+    DATABASE_URI=sqlite:////tmp/bench.db python benchmarks/query_plans.py --rows 200000
+
+DATABASE_URI must point at a database you can throw away.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import (  # noqa: E402
+    Attendance, Country, Course, Enrollment, Finance, Grade, Invoice, Payment, Student, enrollment_course_association
+)
+
+app = create_app()
+
+COURSES = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'History', 'Geography', 'English', 'Kiswahili']
+STATUSES = ['Present', 'Absent', 'Late']
+BATCH = 10000
+START = date(2024, 1, 8)
+
+HOT_TABLES = [Attendance, Grade, Finance, Enrollment, Invoice, Payment]
+
+
+def insert_batched(table, rows):
+    for offset in range(0, len(rows), BATCH):
+        db.session.execute(insert(table), rows[offset:offset + BATCH])
+    db.session.commit()
+
+
+def populate(rows):
+    rng = random.Random(42)
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(Country.__table__), [{'id': 1, 'name': 'Kenya', 'code': 'KE'}])
+
+    students = max(rows // 50, 10)
+    insert_batched(Student.__table__, [
+        {'id': i, 'name': f'Student {i}', 'phone_number': f'07{i:08d}', 'email': f's{i}@example.com',
+         'student_id': f'KE{i:06d}', 'country_id': 1}
+        for i in range(1, students + 1)
+    ])
+    # Lessons three days apart keep (student, course, date) unique, as in seed.seed_scaled.
+    per_student = max(1, rows // students)
+    insert_batched(Attendance.__table__, [
+        {'student_id': student_id, 'course': rng.choice(COURSES),
+         'date': START + timedelta(days=lesson * 3 + rng.randint(0, 2)), 'status': rng.choice(STATUSES)}
+        for student_id in range(1, students + 1)
+        for lesson in range(per_student)
+    ])
+    insert_batched(Grade.__table__, [
+        {'student_id': rng.randint(1, students), 'course': rng.choice(COURSES), 'grade': rng.choice('ABCDE')}
+        for _ in range(rows // 4)
+    ])
+    insert_batched(Finance.__table__, [
+        {'student_id': rng.randint(1, students), 'user_id': 1, 'amount': 100.0, 'transaction_type': 'fee'}
+        for _ in range(rows // 4)
+    ])
+    insert_batched(Course.__table__, [{'id': i, 'name': name} for i, name in enumerate(COURSES, 1)])
+    enrollment_courses = [rng.randint(1, len(COURSES)) for _ in range(students * 2)]
+    insert_batched(Enrollment.__table__, [
+        {'id': i, 'student_id': i % students + 1, 'course_id': course_id, 'phone_number': '0700000000'}
+        for i, course_id in enumerate(enrollment_courses, 1)
+    ])
+    insert_batched(enrollment_course_association, [
+        {'enrollment_id': i, 'course_id': course_id} for i, course_id in enumerate(enrollment_courses, 1)
+    ])
+    insert_batched(Invoice.__table__, [
+        {'id': i, 'student_id': i % students + 1, 'amount': 500.0, 'due_date': START}
+        for i in range(1, students * 2 + 1)
+    ])
+    insert_batched(Payment.__table__, [
+        {'invoice_id': rng.randint(1, students * 2), 'amount': 100.0, 'payment_date': START}
+        for _ in range(students * 4)
+    ])
+    return students
+
+
+def hot_queries(students):
+    student_id = students // 2
+    attendance, grades = Attendance.__table__, Grade.__table__
+    # Core tables rather than ORM entities, so timings measure the database and not object loading.
+    return {
+        'attendance report (date range)': select(attendance).where(
+            Attendance.date.between(START + timedelta(days=30), START + timedelta(days=37))),
+        'attendance for student since date': select(attendance).where(
+            Attendance.student_id == student_id, Attendance.date >= START + timedelta(days=90)),
+        'students by course (substring)': select(Attendance.student_id).distinct().where(
+            Attendance.course.ilike('%hysic%')),
+        'grades for student and course': select(grades).where(
+            Grade.student_id == student_id, Grade.course == 'Physics'),
+        'finances for student': select(Finance.__table__).where(Finance.student_id == student_id),
+        'enrollments for student': select(Enrollment.id).where(Enrollment.student_id == student_id),
+        'invoices for student': select(Invoice.__table__).where(Invoice.student_id == student_id),
+        'payments for invoice': select(func.sum(Payment.amount)).where(Payment.invoice_id == student_id),
+    }
+
+
+def explain(statement):
+    sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + sql)).all()
+    return '\n'.join('      ' + ' '.join(str(col) for col in row) for row in rows)
+
+
+def median_ms(statement, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        db.session.execute(statement).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def set_indexes(enabled):
+    bind = db.engine
+    for model in HOT_TABLES:
+        for index in model.__table__.indexes:
+            if enabled:
+                index.create(bind, checkfirst=True)
+            else:
+                index.drop(bind, checkfirst=True)
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='attendance rows to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per query')
+    parser.add_argument('--skip-populate', action='store_true', help='reuse data from a previous run')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.skip_populate:
+            students = db.session.query(func.max(Student.id)).scalar()
+        else:
+            students = populate(args.rows)
+        queries = hot_queries(students)
+        results = {}
+        for label, enabled in (('before', False), ('after', True)):
+            set_indexes(enabled)
+            print(f'\n=== {label} ({"with" if enabled else "without"} indexes) ===')
+            for name, statement in queries.items():
+                elapsed = median_ms(statement, args.repeat)
+                results.setdefault(name, {})[label] = elapsed
+                print(f'\n  {name}: {elapsed:.2f} ms\n{explain(statement)}')
+
+        print('\n=== summary (median ms) ===')
+        for name, timing in results.items():
+            print(f"  {name:<36} {timing['before']:>9.2f} -> {timing['after']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Messages per second over a fresh SMTP session per message vs. the pooled transport.
+
+Starts DebugSMTPServer, a local SMTP stand-in that accepts and counts every
+message, points the app's mail settings at it and sends the same batch both
+ways:
+
+    python benchmarks/smtp_throughput.py --messages 2000 --threads 4 --connect-delay 0.05
+
+--connect-delay makes the stand-in stall before its greeting, standing in for
+the TCP + TLS + AUTH round trips a real relay costs. DebugSMTPServer can also
+be started on its own (it is a context manager) to point a dev instance or a
+test at.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_mail import Message  # noqa: E402
+
+from app import create_app, mail, mail_transport  # noqa: E402
+
+app = create_app()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.connect_delay)
+        with server.lock:
+            server.connections += 1
+        self.reply('220 debug-smtp ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('latin-1').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-debug-smtp')
+                self.reply('250 8BITMIME')
+            elif command.startswith('DATA'):
+                self.reply('354 end data with <CR><LF>.<CR><LF>')
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP: accept everything.
+                self.reply('250 ok')
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """In-process SMTP sink that counts connections and messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.messages = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+def run(send, messages, threads):
+    def send_one(index):
+        with app.app_context():
+            send(Message(subject='Benchmark', recipients=[f'user{index}@example.com'], body='hello'))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send_one, range(messages)))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--connect-delay', type=float, default=0.02, help='Seconds the stand-in stalls per new session.')
+    args = parser.parse_args()
+
+    with DebugSMTPServer(connect_delay=args.connect_delay) as server:
+        app.config.update(
+            MAIL_SERVER='127.0.0.1', MAIL_PORT=server.port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+            MAIL_USERNAME=None, MAIL_PASSWORD=None, MAIL_SUPPRESS_SEND=False,
+            MAIL_DEFAULT_SENDER='bench@example.com', MAIL_POOL_SIZE=args.pool_size,
+        )
+        mail.init_app(app)
+
+        for label, send in (('fresh session per message', mail.send), ('pooled transport', mail_transport.send)):
+            server.reset()
+            elapsed = run(send, args.messages, args.threads)
+            print(f"{label:>26}: {server.messages} messages over {server.connections} connections "
+                  f"in {elapsed:.2f}s ({server.messages / elapsed:.0f} msg/s)")
+
+        with app.app_context():
+            mail_transport.close()
+
+
+if __name__ == '__main__':
+    main()
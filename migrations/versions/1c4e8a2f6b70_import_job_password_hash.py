@@ -0,0 +1,26 @@
+"""import job password hash
+
+Revision ID: 1c4e8a2f6b70
+Revises: e7b2c4a9d013
+Create Date: 2025-02-12 09:26:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c4e8a2f6b70'
+down_revision = 'e7b2c4a9d013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('password_hash', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.drop_column('password_hash')
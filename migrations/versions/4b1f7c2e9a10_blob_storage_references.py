@@ -0,0 +1,166 @@
+"""move uploaded files into the blob store
+
+Revision ID: 4b1f7c2e9a10
+Revises: 236630c7734b
+Create Date: 2025-01-20 10:12:31.482915
+
+"""
+import hashlib
+import os
+import tempfile
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f7c2e9a10'
+down_revision = '236630c7734b'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 100
+
+# Leading bytes of the image formats browsers display; anything else is served as JPEG.
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def _image_type(data):
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+# (table, legacy bytes column, blob key column, {extra column: value computed from the bytes})
+BLOB_COLUMNS = [
+    ('enrollments', 'document_file', 'document_key', {}),
+    ('file_uploads', 'file_data', 'file_key', {'file_size': len}),
+    ('users', 'user_profile_picture', 'profile_picture_key', {'profile_picture_type': _image_type}),
+]
+
+
+def _blob_path(key):
+    """Where app.storage.LocalBlobBackend keeps `key`; kept in step with it by hand."""
+    root = os.environ.get('BLOB_STORAGE_PATH') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'instance', 'blobs'
+    )
+    return os.path.join(root, key[:2], key[2:4], key)
+
+
+def _save_blob(data):
+    """Write `data` under its SHA-256, as the app's local blob store does; returns the key."""
+    key = hashlib.sha256(data).hexdigest()
+    path = _blob_path(key)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return key
+
+
+def _read_blob(key):
+    with open(_blob_path(key), 'rb') as blob:
+        return blob.read()
+
+
+def _table(table_name, *columns):
+    return sa.table(table_name, sa.column('id'), *(sa.column(column) for column in columns))
+
+
+def _move_blobs_out(bind, table_name, data_column, key_column, extra_columns):
+    """Copy legacy bytes into the blob store in id-ordered batches, then null them.
+
+    Only BATCH_SIZE blobs are held in memory at a time. Rows that already have
+    a key are skipped and blob writes are content-addressed, so a failed run
+    can simply be re-run. The blob store is written directly rather than
+    through the app, so the migration runs without an app context.
+    """
+    table = _table(table_name, data_column, key_column, *extra_columns)
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, table.c[data_column])
+            .where(table.c.id > last_id, table.c[data_column].isnot(None), table.c[key_column].is_(None))
+            .order_by(table.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        for row_id, data in rows:
+            values = {column: compute(data) for column, compute in extra_columns.items()}
+            values.update({key_column: _save_blob(data), data_column: None})
+            bind.execute(table.update().where(table.c.id == row_id).values(values))
+        last_id = rows[-1][0]
+
+
+def _move_blobs_back(bind, table_name, data_column, key_column):
+    """Read blobs back into the legacy column, BATCH_SIZE rows at a time."""
+    table = _table(table_name, data_column, key_column)
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, table.c[key_column])
+            .where(table.c.id > last_id, table.c[key_column].isnot(None))
+            .order_by(table.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        for row_id, key in rows:
+            bind.execute(table.update().where(table.c.id == row_id).values({data_column: _read_blob(key)}))
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('document_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('document_name', sa.String(length=255), nullable=True))
+
+    with op.batch_alter_table('file_uploads', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('file_size', sa.Integer(), nullable=True))
+        batch_op.alter_column('file_data', existing_type=sa.LargeBinary(), nullable=True)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_picture_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('profile_picture_type', sa.String(length=100), nullable=True))
+
+    bind = op.get_bind()
+    for table_name, data_column, key_column, extra_columns in BLOB_COLUMNS:
+        _move_blobs_out(bind, table_name, data_column, key_column, extra_columns)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table_name, data_column, key_column, _ in BLOB_COLUMNS:
+        _move_blobs_back(bind, table_name, data_column, key_column)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('profile_picture_type')
+        batch_op.drop_column('profile_picture_key')
+
+    with op.batch_alter_table('file_uploads', schema=None) as batch_op:
+        batch_op.alter_column('file_data', existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('file_key')
+
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.drop_column('document_name')
+        batch_op.drop_column('document_key')
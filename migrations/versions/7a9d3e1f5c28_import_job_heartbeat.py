@@ -0,0 +1,26 @@
+"""import job heartbeat
+
+Revision ID: 7a9d3e1f5c28
+Revises: 1c4e8a2f6b70
+Create Date: 2025-02-12 11:03:17.540926
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a9d3e1f5c28'
+down_revision = '1c4e8a2f6b70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
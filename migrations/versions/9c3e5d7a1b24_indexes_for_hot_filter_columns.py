@@ -0,0 +1,60 @@
+"""indexes for hot filter columns
+
+Revision ID: 9c3e5d7a1b24
+Revises: 4b1f7c2e9a10
+Create Date: 2025-01-22 09:41:07.113502
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e5d7a1b24'
+down_revision = '4b1f7c2e9a10'
+branch_labels = None
+depends_on = None
+
+# teachers.user_id is already covered by its unique constraint.
+INDEXES = [
+    ('ix_attendance_student_id_date', 'attendance', ['student_id', 'date']),
+    ('ix_attendance_date', 'attendance', ['date']),
+    ('ix_attendance_course_student_id', 'attendance', ['course', 'student_id']),
+    ('ix_grades_student_id_course', 'grades', ['student_id', 'course']),
+    ('ix_finances_student_id', 'finances', ['student_id']),
+    ('ix_enrollments_student_id', 'enrollments', ['student_id']),
+    ('ix_invoices_student_id', 'invoices', ['student_id']),
+    ('ix_payments_invoice_id', 'payments', ['invoice_id']),
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect != 'postgresql':
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+        if dialect == 'sqlite':
+            # No pg_trgm here: a covering index makes substring searches an index-only scan instead.
+            op.create_index('ix_attendance_student_id_course', 'attendance', ['student_id', 'course'])
+        return
+
+    # CONCURRENTLY keeps the tables writable while the indexes build, but it
+    # cannot run inside the migration transaction.
+    with op.get_context().autocommit_block():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(
+            'ix_attendance_course_trgm', 'attendance', ['course'],
+            postgresql_using='gin', postgresql_ops={'course': 'gin_trgm_ops'},
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_attendance_course_trgm', table_name='attendance')
+    elif dialect == 'sqlite':
+        op.drop_index('ix_attendance_student_id_course', table_name='attendance')
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,98 @@
+"""reporting summary tables
+
+Revision ID: a83e61d7c5f0
+Revises: f2c9b8e4a6d3
+Create Date: 2025-01-29 10:17:52.630148
+
+Creates the per-student balance, per-course attendance and per-course grade
+summaries and fills them from the existing rows. From here on they are
+maintained incrementally by app.summaries.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83e61d7c5f0'
+down_revision = 'f2c9b8e4a6d3'
+branch_labels = None
+depends_on = None
+
+# The schema as of this revision; the migration must not depend on the app's models.
+invoices = sa.table('invoices', sa.column('id'), sa.column('student_id'), sa.column('amount'))
+payments = sa.table('payments', sa.column('invoice_id'), sa.column('amount'))
+attendance = sa.table('attendance', sa.column('id'), sa.column('course'), sa.column('status'))
+grades = sa.table('grades', sa.column('id'), sa.column('course'), sa.column('grade'))
+student_balances = sa.table(
+    'student_balances', sa.column('student_id'), sa.column('invoiced'), sa.column('paid'), sa.column('updated_at')
+)
+course_attendance_summaries = sa.table(
+    'course_attendance_summaries', sa.column('course'), sa.column('total'), sa.column('present'),
+    sa.column('absent'), sa.column('late'), sa.column('updated_at')
+)
+course_grade_summaries = sa.table(
+    'course_grade_summaries', sa.column('course'), sa.column('grade'), sa.column('count'), sa.column('updated_at')
+)
+
+
+def _fill_summaries():
+    now = sa.func.current_timestamp()
+    paid = (
+        sa.select(payments.c.invoice_id, sa.func.sum(payments.c.amount).label('paid'))
+        .group_by(payments.c.invoice_id)
+        .subquery()
+    )
+    op.execute(student_balances.insert().from_select(
+        ['student_id', 'invoiced', 'paid', 'updated_at'],
+        sa.select(invoices.c.student_id, sa.func.sum(invoices.c.amount), sa.func.coalesce(sa.func.sum(paid.c.paid), 0), now)
+        .select_from(invoices.outerjoin(paid, paid.c.invoice_id == invoices.c.id))
+        .group_by(invoices.c.student_id)
+    ))
+    op.execute(course_attendance_summaries.insert().from_select(
+        ['course', 'total', 'present', 'absent', 'late', 'updated_at'],
+        sa.select(
+            attendance.c.course, sa.func.count(attendance.c.id),
+            *(sa.func.sum(sa.case((attendance.c.status == status, 1), else_=0)) for status in ('Present', 'Absent', 'Late')),
+            now,
+        ).group_by(attendance.c.course)
+    ))
+    op.execute(course_grade_summaries.insert().from_select(
+        ['course', 'grade', 'count', 'updated_at'],
+        sa.select(grades.c.course, grades.c.grade, sa.func.count(grades.c.id), now)
+        .group_by(grades.c.course, grades.c.grade)
+    ))
+
+
+def upgrade():
+    op.create_table('student_balances',
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('invoiced', sa.Float(), nullable=False),
+    sa.Column('paid', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['student_id'], ['students.id'], ),
+    sa.PrimaryKeyConstraint('student_id')
+    )
+    op.create_table('course_attendance_summaries',
+    sa.Column('course', sa.String(length=255), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('present', sa.Integer(), nullable=False),
+    sa.Column('absent', sa.Integer(), nullable=False),
+    sa.Column('late', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('course')
+    )
+    op.create_table('course_grade_summaries',
+    sa.Column('course', sa.String(length=255), nullable=False),
+    sa.Column('grade', sa.String(length=10), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('course', 'grade')
+    )
+
+    _fill_summaries()
+
+
+def downgrade():
+    op.drop_table('course_grade_summaries')
+    op.drop_table('course_attendance_summaries')
+    op.drop_table('student_balances')
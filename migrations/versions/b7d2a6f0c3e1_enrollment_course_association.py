@@ -0,0 +1,41 @@
+"""enrollment course association
+
+Revision ID: b7d2a6f0c3e1
+Revises: 9c3e5d7a1b24
+Create Date: 2025-01-24 14:05:52.730118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2a6f0c3e1'
+down_revision = '9c3e5d7a1b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('enrollment_course_association',
+    sa.Column('enrollment_id', sa.Integer(), nullable=False),
+    sa.Column('course_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['course_id'], ['courses.id'], ),
+    sa.ForeignKeyConstraint(['enrollment_id'], ['enrollments.id'], ),
+    sa.PrimaryKeyConstraint('enrollment_id', 'course_id')
+    )
+    op.create_index('ix_enrollment_course_association_course_id', 'enrollment_course_association', ['course_id', 'enrollment_id'])
+    op.create_index('ix_courses_name_lower', 'courses', [sa.text('lower(name)')])
+
+    # New code no longer writes the text column; it is dropped once backfilled.
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.alter_column('courses', existing_type=sa.String(length=255), nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.alter_column('courses', existing_type=sa.String(length=255), nullable=False)
+
+    op.drop_index('ix_courses_name_lower', table_name='courses')
+    op.drop_index('ix_enrollment_course_association_course_id', table_name='enrollment_course_association')
+    op.drop_table('enrollment_course_association')
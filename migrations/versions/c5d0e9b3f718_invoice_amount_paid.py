@@ -0,0 +1,53 @@
+"""invoice amount_paid and derived status
+
+Revision ID: c5d0e9b3f718
+Revises: a83e61d7c5f0
+Create Date: 2025-01-31 16:05:24.771930
+
+Adds the running paid total that payments now update, then reconciles every
+invoice's total and status from the payments already recorded.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d0e9b3f718'
+down_revision = 'a83e61d7c5f0'
+branch_labels = None
+depends_on = None
+
+# The schema as of this revision; the migration must not depend on the app's models.
+invoices = sa.table(
+    'invoices', sa.column('id'), sa.column('amount'), sa.column('amount_paid'), sa.column('due_date'), sa.column('status')
+)
+payments = sa.table('payments', sa.column('invoice_id'), sa.column('amount'))
+# Anything within half a cent of the total counts as settled.
+TOLERANCE = 0.005
+
+
+def _reconcile_invoices():
+    paid = (
+        sa.select(sa.func.coalesce(sa.func.sum(payments.c.amount), 0))
+        .where(payments.c.invoice_id == invoices.c.id)
+        .scalar_subquery()
+    )
+    status = sa.case(
+        (paid >= invoices.c.amount - TOLERANCE, 'paid'),
+        (invoices.c.due_date < sa.func.current_date(), 'overdue'),
+        (paid > 0, 'partial'),
+        else_='unpaid'
+    )
+    op.execute(invoices.update().values(amount_paid=paid, status=status))
+
+
+def upgrade():
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('amount_paid', sa.Float(), server_default='0', nullable=False))
+
+    _reconcile_invoices()
+
+
+def downgrade():
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.drop_column('amount_paid')
@@ -0,0 +1,37 @@
+"""notification delivery progress
+
+Revision ID: d8a4f1c2b6e9
+Revises: c5d0e9b3f718
+Create Date: 2025-02-03 11:26:09.348517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a4f1c2b6e9'
+down_revision = 'c5d0e9b3f718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('total_recipients', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('sent_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('failed_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('completed_at', sa.DateTime(), nullable=True))
+
+    # Notifications saved before this were fanned out inside the request.
+    op.execute("UPDATE notifications SET status = 'completed' WHERE status IS NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_column('completed_at')
+        batch_op.drop_column('failed_count')
+        batch_op.drop_column('sent_count')
+        batch_op.drop_column('total_recipients')
+        batch_op.drop_column('status')
@@ -0,0 +1,121 @@
+"""drop enrollments.courses text column
+
+Revision ID: e41a8c9d2f57
+Revises: b7d2a6f0c3e1
+Create Date: 2025-01-24 14:31:18.402266
+
+Links whatever `flask backfill-enrollment-courses` has not already linked,
+then drops the comma-separated column. That command runs
+link_enrollment_courses from this file, so there is one implementation.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a8c9d2f57'
+down_revision = 'b7d2a6f0c3e1'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# The schema as of this revision; the migration must not depend on the app's models.
+enrollments_table = sa.table('enrollments', sa.column('id'), sa.column('courses'))
+courses_table = sa.table('courses', sa.column('id'), sa.column('name'))
+association_table = sa.table('enrollment_course_association', sa.column('enrollment_id'), sa.column('course_id'))
+
+
+def _parse_names(courses):
+    names = []
+    for name in (courses or '').split(','):
+        name = name.strip()
+        if name and name.lower() not in {existing.lower() for existing in names}:
+            names.append(name)
+    return names
+
+
+def link_enrollment_courses(bind, batch_size=BATCH_SIZE, start_after=0, on_batch=None):
+    """Link every enrollment to Course rows parsed from its comma-separated `courses` text.
+
+    Enrollments are walked in id order, `batch_size` at a time. Links that
+    already exist are skipped, so the job can be stopped and re-run (or
+    resumed with `start_after`) safely. `on_batch(last_id)` is called after
+    each batch; the CLI uses it to commit. Returns the last enrollment id
+    processed.
+    """
+    course_ids = {}
+    for course_id, name in bind.execute(
+            sa.select(courses_table.c.id, courses_table.c.name).order_by(courses_table.c.id)):
+        course_ids.setdefault(name.strip().lower(), course_id)
+
+    last_id = start_after
+    while True:
+        rows = bind.execute(
+            sa.select(enrollments_table.c.id, enrollments_table.c.courses)
+            .where(enrollments_table.c.id > last_id)
+            .order_by(enrollments_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return last_id
+
+        linked = set(bind.execute(
+            sa.select(association_table.c.enrollment_id, association_table.c.course_id)
+            .where(association_table.c.enrollment_id.in_([row.id for row in rows]))
+        ).all())
+
+        links = []
+        for enrollment_id, courses in rows:
+            for name in _parse_names(courses):
+                key = name.lower()
+                if key not in course_ids:
+                    course_ids[key] = bind.execute(
+                        sa.insert(courses_table).values(name=name).returning(courses_table.c.id)
+                    ).scalar_one()
+                if (enrollment_id, course_ids[key]) not in linked:
+                    linked.add((enrollment_id, course_ids[key]))
+                    links.append({'enrollment_id': enrollment_id, 'course_id': course_ids[key]})
+
+        if links:
+            bind.execute(sa.insert(association_table), links)
+        last_id = rows[-1].id
+        if on_batch:
+            on_batch(last_id)
+
+
+def upgrade():
+    link_enrollment_courses(op.get_bind())
+
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.drop_column('courses')
+
+
+def downgrade():
+    with op.batch_alter_table('enrollments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('courses', sa.String(length=255), nullable=True))
+
+    # Rebuild the text from the association rows, one batch of enrollments at a time.
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        ids = bind.execute(
+            sa.select(enrollments_table.c.id).where(enrollments_table.c.id > last_id)
+            .order_by(enrollments_table.c.id).limit(BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+
+        names = {}
+        for enrollment_id, name in bind.execute(
+                sa.select(association_table.c.enrollment_id, courses_table.c.name)
+                .join(courses_table, courses_table.c.id == association_table.c.course_id)
+                .where(association_table.c.enrollment_id.in_(ids))
+                .order_by(association_table.c.enrollment_id, courses_table.c.id)):
+            names.setdefault(enrollment_id, []).append(name)
+        for enrollment_id in ids:
+            bind.execute(
+                enrollments_table.update().where(enrollments_table.c.id == enrollment_id)
+                .values(courses=', '.join(names.get(enrollment_id, []))[:255])
+            )
+        last_id = ids[-1]
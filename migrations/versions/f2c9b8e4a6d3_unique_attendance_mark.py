@@ -0,0 +1,34 @@
+"""unique attendance mark per student, course and day
+
+Revision ID: f2c9b8e4a6d3
+Revises: e41a8c9d2f57
+Create Date: 2025-01-27 08:52:40.915337
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c9b8e4a6d3'
+down_revision = 'e41a8c9d2f57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Repeated marks used to insert new rows; keep the latest one for each day.
+    op.execute(
+        'DELETE FROM attendance WHERE id NOT IN '
+        '(SELECT MAX(id) FROM attendance GROUP BY student_id, course, date)'
+    )
+    op.create_index('uq_attendance_student_id_course_date', 'attendance', ['student_id', 'course', 'date'], unique=True)
+
+    # The unique index starts with (student_id, course), so it supersedes SQLite's covering index.
+    if op.get_bind().dialect.name == 'sqlite':
+        op.drop_index('ix_attendance_student_id_course', table_name='attendance')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.create_index('ix_attendance_student_id_course', 'attendance', ['student_id', 'course'])
+    op.drop_index('uq_attendance_student_id_course_date', table_name='attendance')
@@ -1,10 +1,25 @@
-from app import db, app
-from app.models import Student, Finance, Teacher, User, Country, StudentIDCounter, Enrollment, Quiz, Question, Event
+import argparse
+import csv
+import io
+from itertools import islice, repeat
+
+from app import create_app, db, password_hasher
+from app.countries import country_registry
+from app.ledger import reconcile_invoices
+from app.summaries import rebuild_summaries
+from app.models import (
+    Student, Finance, Teacher, User, Country, StudentIDCounter, Enrollment, Quiz, Question, Event, Course,
+    Attendance, Grade, Invoice, Payment, enrollment_course_association
+)
 from faker import Faker
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, insert, select, text
 
+app = create_app()
 fake = Faker()
 
+COURSE_NAMES = ["Computer Science", "Psychology", "Philosophy", "Economics", "Political Science","Business Administration","Sociology", "Environmental Science", "Chemistry", "Physics", "Foreign Languages", "Music Theory","Engineering", "Linguistics", "Civics and Citizenship","Anthropology", "Health and Physical Education","Law and Legal Studies", "Theology/Religious Studies", "Social Studies", "Film Studies", "Architecture", "Journalism and Media Studies", "Psychiatry","Astronomy", "Mathematical Statistics", "Fashion Design", "Culinary Arts", "Graphic Design", "Cybersecurity"]
+
 def reset_database():
     with app.app_context():
         # db.drop_all()
@@ -46,6 +61,8 @@ def seed_users():
         {"email": fake.email(), "username": fake.user_name(), "role": "student"}
     ]
 
+    # bcrypt is deliberately slow; hash the shared default password once.
+    password_hash = password_hasher.hash("defaultpassword")
     for data in users_data:
         # Check if a user with the same email already exists
         existing_user = User.query.filter_by(email=data["email"]).first()
@@ -55,7 +72,7 @@ def seed_users():
                 email=data["email"],
                 username=data["username"],
                 role=data["role"],
-                password="defaultpassword"  # Ensure all users get a default password
+                _password=password_hash  # Ensure all users get a default password
             )
             db.session.add(new_user)
 
@@ -91,7 +108,7 @@ def seed_students():
     
     available_student_users = [user for user in student_users if user.id not in assigned_user_ids]
     
-    countries = Country.query.all()
+    countries = country_registry.all()
     teachers = Teacher.query.all()
     students = []
     
@@ -148,7 +165,7 @@ def seed_finance():
     print("Finance records seeded successfully.")
 
 def seed_student_id_counters():
-    countries = Country.query.all()
+    countries = country_registry.all()
 
     student_id_counters = []
     for country in countries:
@@ -168,22 +185,23 @@ def seed_student_id_counters():
 
 def seed_enrollments():
     students = Student.query.all()
-    courses_list = ["Computer Science", "Psychology", "Philosophy", "Economics", "Political Science","Business Administration","Sociology", "Environmental Science", "Chemistry", "Physics", "Foreign Languages", "Music Theory","Engineering", "Linguistics", "Civics and Citizenship","Anthropology", "Health and Physical Education","Law and Legal Studies", "Theology/Religious Studies", "Social Studies", "Film Studies", "Architecture", "Journalism and Media Studies", "Psychiatry","Astronomy", "Mathematical Statistics", "Fashion Design", "Culinary Arts", "Graphic Design", "Cybersecurity"]
 
     
+    courses_by_name = {course.name: course for course in Course.get_or_create_many(COURSE_NAMES)}
     enrollments = []
     
     for student in students:
+        # Course sets the student is already enrolled in
+        existing_enrollments = {frozenset(course.name for course in enrollment.courses) for enrollment in student.enrollments}
+
         for _ in range(fake.random_int(min=1, max=3)):
-            courses = ", ".join(fake.random_elements(courses_list, unique=True, length=fake.random_int(min=1, max=3)))
+            courses = fake.random_elements(COURSE_NAMES, unique=True, length=fake.random_int(min=1, max=3))
             
-            # Check if the student is already enrolled in these courses
-            existing_enrollment = Enrollment.query.filter_by(student_id=student.id, courses=courses).first()
-            
-            if existing_enrollment is None:
+            if frozenset(courses) not in existing_enrollments:
+                existing_enrollments.add(frozenset(courses))
                 enrollment = Enrollment(
                     student_id=student.id,
-                    courses=courses,
+                    courses=[courses_by_name[name] for name in courses],
                     phone_number=student.phone_number,
                     enrollment_date=fake.date_time_this_year()
                 )
@@ -193,6 +211,259 @@ def seed_enrollments():
     db.session.commit()
     print("Enrollments seeded successfully.")
 
+# Synthetic dataset at a configurable scale, for benchmarks (`python seed.py
+# --bulk`). scale=1.0 is 100k students, 1M attendance rows and 500k finance
+# rows; the same scale and random_seed always produce the same data.
+SCALED_ROWS = {
+    'students': 100_000,
+    'attendance': 1_000_000,
+    'finances': 500_000,
+    'grades': 300_000,
+    'invoices': 200_000,
+    'quizzes': 200,
+}
+QUESTIONS_PER_QUIZ = 10
+SCALED_BATCH_SIZE = 10_000
+SCALED_START = datetime(2024, 1, 8)
+SCALED_DAYS = 3650
+
+
+def write_rows(table, columns, rows, batch_size=SCALED_BATCH_SIZE):
+    """Bulk-load an iterable of row tuples (in `columns` order) into `table`.
+
+    On Postgres with psycopg2 each batch goes through COPY ... FROM STDIN.
+    Elsewhere the INSERT is compiled once and run with the DB-API
+    executemany, with SQLAlchemy's bind processors applied per column, which
+    skips the per-row parameter handling of session.execute(insert(...)).
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    dbapi_connection = connection.connection.dbapi_connection
+    rows = iter(rows)
+    inserted = 0
+
+    if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        copy = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        with dbapi_connection.cursor() as cursor:
+            while batch := list(islice(rows, batch_size)):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(
+                    ['\\N' if value is None else value for value in row] for row in batch
+                )
+                buffer.seek(0)
+                cursor.copy_expert(copy, buffer)
+                inserted += len(batch)
+        return inserted
+
+    compiled = insert(table).values({name: bindparam(name) for name in columns}).compile(dialect=dialect)
+    order = [columns.index(name) for name in compiled.positiontup] if compiled.positional else None
+    processors = [table.c[name].type.dialect_impl(dialect).bind_processor(dialect) for name in columns]
+    cursor = dbapi_connection.cursor()
+    try:
+        while batch := list(islice(rows, batch_size)):
+            # Column-wise, so only the columns that need conversion (dates on SQLite) pay for it.
+            values = list(zip(*batch))
+            for index, process in enumerate(processors):
+                if process is not None:
+                    values[index] = [None if value is None else process(value) for value in values[index]]
+            if order is not None:
+                parameters = list(zip(*(values[index] for index in order)))
+            else:
+                parameters = [dict(zip(columns, row)) for row in zip(*values)]
+            cursor.executemany(str(compiled), parameters)
+            inserted += len(batch)
+    finally:
+        cursor.close()
+    return inserted
+
+
+def _next_id(table):
+    return (db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _sync_sequences(tables):
+    # Rows were inserted with explicit ids; move Postgres' serial sequences past them.
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT max(id) FROM {table.name}))"
+        ))
+
+
+def _ranks_within(groups):
+    """Position of each element among the elements of the same group, in order."""
+    import numpy as np
+
+    order = np.argsort(groups, kind='stable')
+    starts = np.cumsum(np.bincount(groups)) - np.bincount(groups)
+    ranks = np.empty(len(groups), dtype=np.int64)
+    ranks[order] = np.arange(len(groups)) - starts[groups[order]]
+    return ranks
+
+
+def seed_scaled(scale=1.0, random_seed=42):
+    """Add a synthetic dataset of SCALED_ROWS x `scale` rows on top of whatever is there.
+
+    Every column is drawn as a numpy array from one seeded generator, rows
+    are bulk-loaded with write_rows using explicit ids, every user shares a
+    single password hash, and student numbers are reserved per country from
+    StudentIDCounter. Invoice totals and the reporting summaries are
+    recomputed at the end.
+    """
+    # Only the bulk path needs numpy; the demo seeders start without it.
+    import numpy as np
+
+    rng = np.random.default_rng(random_seed)
+    counts = {name: max(1, int(rows * scale)) for name, rows in SCALED_ROWS.items()}
+    students = counts['students']
+
+    if not country_registry.all():
+        seed_countries()
+    countries = country_registry.all()
+    courses = Course.get_or_create_many(COURSE_NAMES)
+    db.session.flush()
+    course_ids = np.array([course.id for course in courses])
+    course_names = {course.id: course.name for course in courses}
+    password = password_hasher.hash("defaultpassword")
+    days = [SCALED_START + timedelta(days=day) for day in range(-SCALED_DAYS, SCALED_DAYS)]
+    dates = [day.date() for day in days]
+
+    def day(offsets):
+        return [days[SCALED_DAYS + offset] for offset in offsets.tolist()]
+
+    def date(offsets):
+        return [dates[SCALED_DAYS + offset] for offset in offsets.tolist()]
+
+    users, teachers, students_table = User.__table__, Teacher.__table__, Student.__table__
+    first_user, first_teacher, first_student = _next_id(users), _next_id(teachers), _next_id(students_table)
+    teacher_count = max(1, students // 200)
+    admin_id = first_user
+    teacher_user_ids = range(first_user + 1, first_user + 1 + teacher_count)
+    student_user_ids = range(first_user + 1 + teacher_count, first_user + 1 + teacher_count + students)
+    student_ids = np.arange(first_student, first_student + students)
+
+    write_rows(users, ['id', 'email', 'username', 'password', 'role'], (
+        (user_id, f'{role}{user_id}@bench.example.com', f'{role}{user_id}', password, role)
+        for role, ids in (('admin', [admin_id]), ('teacher', teacher_user_ids), ('student', student_user_ids))
+        for user_id in ids
+    ))
+    write_rows(teachers, ['id', 'name', 'subject', 'hire_date', 'user_id'], zip(
+        range(first_teacher, first_teacher + teacher_count),
+        (f'Teacher {user_id}' for user_id in teacher_user_ids),
+        (COURSE_NAMES[index][:50] for index in rng.integers(len(COURSE_NAMES), size=teacher_count).tolist()),
+        day(-rng.integers(SCALED_DAYS, size=teacher_count)),
+        teacher_user_ids,
+    ))
+
+    # Student numbers: one StudentIDCounter block per country, handed out in id order.
+    country_index = rng.integers(len(countries), size=students)
+    allotted = np.bincount(country_index, minlength=len(countries))
+    firsts = np.array([
+        StudentIDCounter.reserve(country.id, int(n)) if n else 0 for country, n in zip(countries, allotted.tolist())
+    ])
+    numbers = firsts[country_index] + _ranks_within(country_index)
+    write_rows(students_table, [
+        'id', 'name', 'first_name', 'last_name', 'phone_number', 'email', 'student_id',
+        'enrolled_date', 'country_id', 'user_id', 'teacher_id',
+    ], (
+        (student_id, f'Student {student_id}', 'Student', str(student_id), f'+2547{student_id:08d}',
+         f'student{user_id}@bench.example.com', Student.generate_student_id(countries[index].code, number),
+         enrolled, countries[index].id, user_id, teacher_id)
+        for student_id, user_id, index, number, enrolled, teacher_id in zip(
+            student_ids.tolist(), student_user_ids, country_index.tolist(), numbers.tolist(),
+            day(-rng.integers(365, size=students)),
+            (first_teacher + rng.integers(teacher_count, size=students)).tolist(),
+        )
+    ))
+
+    # One enrollment of one to three distinct courses per student; attendance uses those courses.
+    course_count = rng.integers(1, 4, size=students)
+    first_course = rng.integers(len(course_ids), size=students)
+    half = len(course_ids) // 2
+    picks = np.stack([
+        first_course,
+        (first_course + rng.integers(1, half + 1, size=students)) % len(course_ids),
+        (first_course + rng.integers(half + 1, len(course_ids), size=students)) % len(course_ids),
+    ], axis=1)
+    first_enrollment = _next_id(Enrollment.__table__)
+    enrollment_ids = np.arange(first_enrollment, first_enrollment + students)
+    write_rows(Enrollment.__table__, ['id', 'student_id', 'course_id', 'phone_number', 'enrollment_date'], (
+        (enrollment_id, student_id, course_id, f'+2547{student_id:08d}', SCALED_START)
+        for enrollment_id, student_id, course_id in zip(
+            enrollment_ids.tolist(), student_ids.tolist(), course_ids[picks[:, 0]].tolist()
+        )
+    ))
+    taken = np.arange(3) < course_count[:, None]
+    write_rows(enrollment_course_association, ['enrollment_id', 'course_id'], zip(
+        np.repeat(enrollment_ids, course_count).tolist(), course_ids[picks[taken]].tolist()
+    ))
+
+    per_student = max(1, counts['attendance'] // students)
+    attendee = np.repeat(np.arange(students), per_student)
+    lesson = np.tile(np.arange(per_student), students)
+    # Lessons three days apart keep (student, course, date) unique.
+    write_rows(Attendance.__table__, ['student_id', 'course', 'date', 'status'], zip(
+        student_ids[attendee].tolist(),
+        (course_names[course_id] for course_id in course_ids[picks[attendee, lesson % course_count[attendee]]].tolist()),
+        date(lesson * 3 + rng.integers(3, size=len(lesson))),
+        (Attendance.STATUSES[status] for status in rng.choice(3, size=len(lesson), p=(0.8, 0.1, 0.1)).tolist()),
+    ))
+
+    grades = counts['grades']
+    write_rows(Grade.__table__, ['student_id', 'course', 'grade', 'date_recorded'], zip(
+        rng.choice(student_ids, size=grades).tolist(),
+        (COURSE_NAMES[index] for index in rng.integers(len(COURSE_NAMES), size=grades).tolist()),
+        ('ABCDE'[index] for index in rng.integers(5, size=grades).tolist()),
+        day(rng.integers(180, size=grades)),
+    ))
+    finances = counts['finances']
+    transaction_types = ('tuition', 'maintanance', 'fee')
+    write_rows(Finance.__table__, ['student_id', 'user_id', 'amount', 'transaction_type', 'date', 'description'], zip(
+        rng.choice(student_ids, size=finances).tolist(),
+        repeat(admin_id),
+        rng.integers(100, 10_000, size=finances).astype(float).tolist(),
+        (transaction_types[index] for index in rng.integers(3, size=finances).tolist()),
+        day(rng.integers(365, size=finances)),
+        repeat('Synthetic transaction'),
+    ))
+
+    invoices = counts['invoices']
+    first_invoice = _next_id(Invoice.__table__)
+    invoice_ids = np.arange(first_invoice, first_invoice + invoices)
+    amounts = rng.integers(50, 500, size=invoices) * 10.0
+    write_rows(Invoice.__table__, ['id', 'student_id', 'amount', 'amount_paid', 'due_date', 'status'], zip(
+        invoice_ids.tolist(),
+        rng.choice(student_ids, size=invoices).tolist(),
+        amounts.tolist(),
+        repeat(0.0),
+        date(rng.integers(-60, 240, size=invoices)),
+        repeat('unpaid'),
+    ))
+    # A third of the invoices untouched, a third half paid, a third paid in two halves.
+    payment_count = rng.integers(3, size=invoices)
+    paid = np.repeat(np.arange(invoices), payment_count)
+    write_rows(Payment.__table__, ['invoice_id', 'amount', 'payment_date'], zip(
+        invoice_ids[paid].tolist(), (amounts[paid] / 2).tolist(), date(rng.integers(120, size=len(paid))),
+    ))
+
+    quizzes = counts['quizzes']
+    first_quiz = _next_id(Quiz.__table__)
+    write_rows(Quiz.__table__, ['id', 'title'], ((quiz_id, f'Quiz {quiz_id}') for quiz_id in range(first_quiz, first_quiz + quizzes)))
+    write_rows(Question.__table__, ['quiz_id', 'text', 'options', 'correct_answer'], (
+        (quiz_id, f'Question {number} of quiz {quiz_id}', 'A, B, C, D', 'ABCD'[(quiz_id + number) % 4])
+        for quiz_id in range(first_quiz, first_quiz + quizzes)
+        for number in range(1, QUESTIONS_PER_QUIZ + 1)
+    ))
+
+    _sync_sequences((users, teachers, students_table, Enrollment.__table__, Invoice.__table__, Quiz.__table__))
+    connection = db.session.connection()
+    reconcile_invoices(connection, start_after=first_invoice - 1)
+    rebuild_summaries(connection)
+    db.session.commit()
+    print(f"Seeded {students} students at scale {scale} (seed {random_seed}).")
+    return counts
+
 # Seed quizzes
 def seed_quizzes():
     quizzes_data = [
@@ -214,7 +485,7 @@ def seed_quizzes():
         # Create a new quiz
         quiz = Quiz(title=quiz_data['title'])
         db.session.add(quiz)
-        db.session.commit()  # Commit to get the quiz ID for associating questions
+        db.session.flush()  # Flush to get the quiz ID for associating questions
 
         for question_data in quiz_data['questions']:
             question = Question(
@@ -224,8 +495,8 @@ def seed_quizzes():
                 quiz_id=quiz.id  # Link question to the quiz
             )
             db.session.add(question)
-        
-        db.session.commit()
+
+    db.session.commit()
 
     print("Quizzes seeded successfully.")
 
@@ -307,19 +578,36 @@ def test_delete_event(client):
     assert response.status_code == 404  # Event should no longer exist
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the database.")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Load the synthetic benchmark dataset (seed_scaled) instead of the demo rows.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Bulk dataset size; 1.0 is 100k students.")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data.")
+    parser.add_argument('--reset', action='store_true', help="Drop and recreate every table first.")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     with app.app_context():
-        # reset_database()
-        # seed_countries()
-        # seed_users()
-        # seed_teachers()
-        # seed_students()
-        # seed_finance()
-        # seed_student_id_counters() 
-        seed_enrollments()
-        # seed_quizzes()
-        # seed_events()
-        # test_create_event()
-        # test_get_all_events()
-        # test_get_event_by_id()
-        # test_delete_event()
\ No newline at end of file
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        if args.bulk:
+            seed_scaled(args.scale, args.seed)
+        else:
+            # reset_database()
+            # seed_countries()
+            # seed_users()
+            # seed_teachers()
+            # seed_students()
+            # seed_finance()
+            # seed_student_id_counters() 
+            seed_enrollments()
+            # seed_quizzes()
+            # seed_events()
+            # test_create_event()
+            # test_get_all_events()
+            # test_get_event_by_id()
+            # test_delete_event()
\ No newline at end of file
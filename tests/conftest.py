@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.config reads the environment on import, so it is set before anything imports app.
+_scratch = tempfile.mkdtemp(prefix='shiloh-tests-')
+os.environ['DATABASE_URI'] = os.environ.get('TEST_DATABASE_URI', f"sqlite:///{os.path.join(_scratch, 'test.db')}")
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('JWT_SECRET_KEY', 'test')
+os.environ.setdefault('BLOB_STORAGE_PATH', os.path.join(_scratch, 'blobs'))
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import celery, create_app, db
+
+    app = create_app()
+    # A statement repeated N_PLUS_ONE_THRESHOLD times in one request fails the test that made it.
+    app.config.update(TESTING=True, N_PLUS_ONE_RAISE=True)
+    # Tasks run inline, so a request that queues one has finished its work when it returns.
+    celery.conf.task_always_eager = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(autouse=True)
+def _empty_tables(request):
+    """Tests that use the database start from empty tables and cold caches."""
+    yield
+    if 'app' not in request.fixturenames:
+        return
+    from app import db
+
+    app = request.getfixturevalue('app')
+    with app.app_context():
+        db.session.remove()
+        with db.engine.begin() as connection:
+            for table in reversed(db.metadata.sorted_tables):
+                connection.execute(table.delete())
+        app.extensions['country_registry'].invalidate()
+        app.extensions['profile_cache'].clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def kenya(app):
+    """Id of a Kenya row, the country the tests register students in."""
+    from app import db
+    from app.models import Country
+
+    with app.app_context():
+        country = Country(name='Kenya', code='KE')
+        db.session.add(country)
+        db.session.commit()
+        return country.id
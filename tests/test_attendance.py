@@ -0,0 +1,146 @@
+"""Attendance upserts and the CourseAttendanceSummary rows they keep up to date."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app.models import Attendance, Course, CourseAttendanceSummary, Enrollment, Student
+
+THREADS = 8
+COURSES = ('Math', 'Physics', 'History')
+
+
+@pytest.fixture
+def students(app, kenya):
+    with app.app_context():
+        rows = [
+            Student(first_name=f'Student{i}', phone_number=f'+2547{i:08d}', email=f'student{i}@example.com',
+                    student_id=Student.generate_student_id('KE', i + 1), country_id=kenya)
+            for i in range(10)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [student.id for student in rows]
+
+
+@pytest.fixture
+def physics_class(app, students):
+    """The first three students, enrolled in Physics."""
+    with app.app_context():
+        physics = Course(name='Physics')
+        db.session.add_all([
+            Enrollment(student_id=student_id, phone_number='+254700000000', courses=[physics])
+            for student_id in students[:3]
+        ])
+        db.session.commit()
+    return students[:3]
+
+
+def marks(student_ids, seed, count):
+    rng = random.Random(seed)
+    return [
+        {'student_id': rng.choice(student_ids), 'course': rng.choice(COURSES),
+         'date': date(2024, 1, 1) + timedelta(days=rng.randrange(5)), 'status': rng.choice(Attendance.STATUSES)}
+        for _ in range(count)
+    ]
+
+
+def assert_summary_matches_attendance():
+    expected = {
+        row.course: (row.total, row.present, row.absent, row.late)
+        for row in db.session.execute(
+            select(Attendance.course, *Attendance.status_count_columns()).group_by(Attendance.course)
+        )
+    }
+    summary = {
+        row.course: (row.total, row.present, row.absent, row.late)
+        for row in CourseAttendanceSummary.query.filter(CourseAttendanceSummary.total > 0)
+    }
+    assert summary == expected
+
+
+def test_summary_matches_group_by_after_mixed_inserts_and_updates(app, students):
+    with app.app_context():
+        # Later batches hit the same keys as earlier ones, so most of them are updates,
+        # some to the status the row already has; batches also repeat keys within themselves.
+        for seed in range(6):
+            Attendance.upsert_many(marks(students, seed, 80))
+            db.session.commit()
+            assert_summary_matches_attendance()
+
+
+def test_summary_matches_group_by_after_concurrent_upserts(app, students):
+    def upsert(seed):
+        with app.app_context():
+            Attendance.upsert_many(marks(students, seed, 40))
+            db.session.commit()
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        list(executor.map(upsert, range(40)))
+
+    with app.app_context():
+        assert_summary_matches_attendance()
+
+
+def mark_class(client, records, course='physics', day='2024-03-04'):
+    return client.post('/attendance/bulk', json={'course': course, 'date': day, 'records': records})
+
+
+def stored_marks(app):
+    with app.app_context():
+        return {(row.student_id, row.course, row.date.isoformat(), row.status) for row in Attendance.query}
+
+
+def test_bulk_attendance_inserts_then_updates_marks(app, client, physics_class):
+    first, second, third = physics_class
+
+    response = mark_class(client, [{'student_id': student_id, 'status': 'Present'} for student_id in physics_class])
+    assert response.status_code == 200
+    assert response.json['course'] == 'Physics'  # the stored name, whatever the request's spelling
+    assert (response.json['marked'], response.json['failed']) == (3, 0)
+
+    response = mark_class(client, [{'student_id': first, 'status': 'Absent'}, {'student_id': second, 'status': 'Present'}])
+    assert (response.json['marked'], response.json['failed']) == (2, 0)
+    assert stored_marks(app) == {
+        (first, 'Physics', '2024-03-04', 'Absent'),
+        (second, 'Physics', '2024-03-04', 'Present'),
+        (third, 'Physics', '2024-03-04', 'Present'),
+    }
+    with app.app_context():
+        summary = db.session.get(CourseAttendanceSummary, 'Physics')
+        assert (summary.total, summary.present, summary.absent, summary.late) == (3, 2, 1, 0)
+
+
+def test_bulk_attendance_reports_a_result_per_record(app, client, students, physics_class):
+    first, second, _ = physics_class
+    not_enrolled = students[5]
+
+    response = mark_class(client, [
+        {'student_id': first, 'status': 'Late'},
+        {'student_id': True, 'status': 'Present'},
+        {'student_id': str(second), 'status': 'Present'},
+        {'student_id': second, 'status': 'Sleeping'},
+        'not a record',
+        {'student_id': not_enrolled, 'status': 'Present'},
+        {'student_id': first, 'status': 'Absent'},
+        {'student_id': second, 'status': 'Present'},
+    ])
+
+    assert response.status_code == 200
+    assert (response.json['marked'], response.json['failed']) == (2, 6)
+    assert [(result['index'], result['result']) for result in response.json['results']] == [
+        (0, 'marked'), (1, 'error'), (2, 'error'), (3, 'error'),
+        (4, 'error'), (5, 'error'), (6, 'error'), (7, 'marked'),
+    ]
+    assert response.json['results'][1]['message'].startswith('student_id must be an integer')
+    assert response.json['results'][5]['message'] == f'Student ID {not_enrolled} is not enrolled in course Physics'
+    assert response.json['results'][6]['message'] == 'Duplicate student_id in request'
+    assert stored_marks(app) == {(first, 'Physics', '2024-03-04', 'Late'), (second, 'Physics', '2024-03-04', 'Present')}
+
+
+def test_bulk_attendance_rejects_a_malformed_request(client, physics_class):
+    assert mark_class(client, None).status_code == 400
+    assert mark_class(client, [], day='04/03/2024').status_code == 400
@@ -0,0 +1,109 @@
+"""POST /students/bulk and the batch hashing behind it."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import db, password_hasher
+from app.models import Student, StudentIDCounter
+from app.passwords import _check_password
+
+
+def student(index, **fields):
+    return {'first_name': f'First{index}', 'last_name': f'Last{index}', 'phone_number': f'+2547{index:08d}',
+            'email': f'bulk{index}@example.com', 'country_name': 'Kenya', 'password': f'password{index}', **fields}
+
+
+def test_bulk_students_reports_a_result_per_item(app, client, kenya):
+    response = client.post('/students/bulk', json={'students': [
+        student(0),
+        student(1, email='not-an-email'),
+        student(2, country_name='Atlantis'),
+        student(3, password=''),
+        'not a student',
+        student(5),
+    ]})
+
+    assert response.status_code == 200
+    assert (response.json['created'], response.json['failed']) == (2, 4)
+    results = response.json['results']
+    assert [result['result'] for result in results] == ['created', 'error', 'error', 'error', 'error', 'created']
+    assert [result.get('message') for result in results[1:4]] == [
+        'Invalid email address', 'Unknown country', 'Missing password'
+    ]
+    with app.app_context():
+        created = db.session.get(Student, results[5]['id'])
+        assert created.email == 'bulk5@example.com'
+        assert created.user.check_password('password5')
+
+
+def test_bulk_students_take_one_contiguous_block_of_student_ids(app, client, kenya):
+    first = client.post('/students/bulk', json=[student(index) for index in range(5)])
+    second = client.post('/students/bulk', json=[student(index) for index in range(5, 8)])
+
+    student_ids = [result['student_id'] for response in (first, second) for result in response.json['results']]
+    assert student_ids == [Student.generate_student_id('KE', number) for number in range(1, 9)]
+    with app.app_context():
+        assert StudentIDCounter.query.filter_by(country_id=kenya).one().count == 8
+
+
+def test_bulk_students_rejects_duplicates_within_the_request(app, client, kenya):
+    response = client.post('/students/bulk', json=[
+        student(0),
+        student(1, email='bulk0@example.com'),
+        student(2, phone_number='+254700000000'),
+    ])
+
+    assert [result.get('message') for result in response.json['results']] == [
+        None, 'Duplicate email in request', 'Duplicate phone number in request'
+    ]
+    # Duplicates of an existing student are caught on a later request too
+    response = client.post('/students/bulk', json=[student(0, phone_number='+254799999999')])
+    assert response.json['results'][0]['message'] == 'Email already registered'
+
+
+def test_bulk_students_limits_the_request_size(app, client, kenya):
+    max_items = app.config['BULK_STUDENTS_MAX_ITEMS']
+    response = client.post('/students/bulk', json=[student(index) for index in range(max_items + 1)])
+    assert response.status_code == 413
+
+
+class CountingPool:
+    """Thread pool that records how many jobs were queued or running at once."""
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.in_pool = self.most_in_pool = 0
+
+    def submit(self, func, *args):
+        with self.lock:
+            self.in_pool += 1
+            self.most_in_pool = max(self.most_in_pool, self.in_pool)
+        return self.executor.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            # Before the future resolves, so the next submit never sees this job
+            with self.lock:
+                self.in_pool -= 1
+
+
+@pytest.mark.parametrize('bulk_workers', [1, 2])
+def test_hash_many_keeps_at_most_its_share_of_jobs_in_the_pool(app, monkeypatch, bulk_workers):
+    pool = CountingPool(workers=4)
+    slots = threading.BoundedSemaphore(4)
+    monkeypatch.setattr(password_hasher, '_executor', lambda: (pool, slots))
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 4)
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_BULK_WORKERS', bulk_workers)
+    passwords = [f'password{index}' for index in range(12)]
+
+    with app.app_context():
+        hashes = password_hasher.hash_many(passwords)
+
+    assert pool.most_in_pool == bulk_workers
+    assert all(_check_password(pw_hash, password) for pw_hash, password in zip(hashes, passwords))
+    assert slots.acquire(blocking=False)  # the batch gave its admission slot back
+    pool.executor.shutdown()
@@ -0,0 +1,79 @@
+"""Background roster imports: POST /users/upload?import=students and app.imports.run_import."""
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, password_hasher
+from app import routes
+from app.models import ImportJob, User
+
+HEADER = 'First Name,Last Name,Email,Phone,Country'
+
+
+def roster(count, start=0):
+    lines = [HEADER] + [f'First{i},Last{i},student{i}@example.com,+2547{i:08d},Kenya' for i in range(start, start + count)]
+    return '\n'.join(lines).encode()
+
+
+def upload(client, data, **form):
+    return client.post(
+        '/users/upload',
+        data={'file': (io.BytesIO(data), 'roster.csv'), 'import': 'students', **form},
+        content_type='multipart/form-data',
+    )
+
+
+def test_default_password_reaches_the_worker_only_as_a_hash(app, client, kenya, monkeypatch):
+    queued = []
+    delay = routes.import_students_task.delay
+    monkeypatch.setattr(routes.import_students_task, 'delay', lambda *args: queued.append(args) or delay(*args))
+
+    response = upload(client, roster(3), default_password='s3cret-default')
+
+    assert response.status_code == 202
+    assert queued == [(response.json['job_id'],)]
+    with app.app_context():
+        job = db.session.get(ImportJob, response.json['job_id'])
+        assert job.status == 'completed' and job.imported_rows == 3
+        assert job.password_hash != 's3cret-default'
+        user = User.query.filter_by(email='student1@example.com').one()
+        assert password_hasher.verify(user._password, 's3cret-default')
+
+
+def queue_without_running(client, monkeypatch, data):
+    monkeypatch.setattr(routes.import_students_task, 'delay', lambda *args: None)
+    return upload(client, data).json['job_id']
+
+
+def test_redelivered_task_resumes_a_job_whose_worker_died(app, client, kenya, monkeypatch):
+    from app.imports import run_import
+
+    job_id = queue_without_running(client, monkeypatch, roster(5))
+    with app.app_context():
+        # As left by a worker that committed two rows and was killed.
+        job = db.session.get(ImportJob, job_id)
+        job.status, job.processed_rows, job.heartbeat_at = 'running', 2, datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        run_import(job_id)
+
+        job = db.session.get(ImportJob, job_id)
+        assert (job.status, job.processed_rows, job.imported_rows) == ('completed', 5, 3)
+        assert job.finished_at is not None
+        emails = {user.email for user in User.query.filter_by(role='student')}
+        assert emails == {f'student{i}@example.com' for i in range(2, 5)}
+
+
+def test_job_held_by_a_live_worker_is_not_run_twice(app, client, kenya, monkeypatch):
+    from app.imports import ImportInProgress, run_import
+
+    job_id = queue_without_running(client, monkeypatch, roster(2))
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        job.status, job.heartbeat_at = 'running', datetime.utcnow()
+        db.session.commit()
+
+        with pytest.raises(ImportInProgress):
+            run_import(job_id)
+        assert db.session.get(ImportJob, job_id).processed_rows == 0
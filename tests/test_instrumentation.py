@@ -0,0 +1,77 @@
+"""Per-request query counting, N+1 detection and the /metrics endpoint."""
+import pytest
+from flask import Response
+
+from app import db
+from app.instrumentation import NPlusOneDetected, instrumentation
+from app.models import Student, User
+
+
+@pytest.fixture
+def metrics():
+    instrumentation.metrics.reset()
+    return instrumentation.metrics
+
+
+@pytest.fixture
+def students(app, kenya):
+    with app.app_context():
+        db.session.add_all([
+            Student(first_name=f'Student{i}', phone_number=f'+2547{i:08d}', email=f'student{i}@example.com',
+                    student_id=Student.generate_student_id('KE', i + 1), country_id=kenya)
+            for i in range(app.config['N_PLUS_ONE_THRESHOLD'] + 2)
+        ])
+        db.session.commit()
+
+
+def serialize_students(app, query):
+    """Run `to_dict()` over `query` as a request would, then end the request."""
+    with app.test_request_context('/students'):
+        instrumentation._start()
+        [student.to_dict() for student in query.all()]
+        return instrumentation._finish(Response())
+
+
+def test_to_dict_fan_out_is_detected(app, metrics, students):
+    with app.app_context():
+        # Without loader options every student lazy-loads its country, finances, enrollments...
+        with pytest.raises(NPlusOneDetected, match='GET /students ran the same statement'):
+            serialize_students(app, Student.query)
+
+    assert metrics.snapshot()['n_plus_one'][('/students', 'GET')] >= 1
+
+
+def test_eager_loading_passes_the_n_plus_one_check(app, metrics, students):
+    with app.app_context():
+        serialize_students(app, Student.query.options(*Student.loader_options()))
+
+    assert metrics.snapshot()['n_plus_one'] == {('/students', 'GET'): 0}
+
+
+def test_streamed_responses_count_the_queries_of_their_body(app, client, metrics):
+    with app.app_context():
+        db.session.add_all([User(email=f'user{i}@example.com', username=f'user{i}', role='user', password='x')
+                            for i in range(3)])
+        db.session.commit()
+
+    response = client.get('/users?stream=1')
+    assert len(response.data.splitlines()) == 3
+    response.close()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['requests'] == {('/users', 'GET', '200'): 1}
+    assert snapshot['queries'][('/users', 'GET')] >= 1
+
+
+def test_metrics_endpoint_serves_prometheus_text(app, client, metrics):
+    client.get('/users')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert 'shiloh_http_requests_total{endpoint="/users",method="GET",status="200"} 1' in lines
+    assert '# TYPE shiloh_http_request_duration_seconds histogram' in lines
+    assert any(line.startswith('shiloh_db_queries_total{endpoint="/users",method="GET"}') for line in lines)
+    assert any(line.startswith('shiloh_password_hash_seconds_count{operation="hash"}') for line in lines)
@@ -0,0 +1,51 @@
+"""PUT/GET /users/<id>/profile_picture."""
+import io
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import db
+from app.models import User
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        rows = [User(email=f'{role}@example.com', username=role, role=role, password='password')
+                for role in ('owner', 'other', 'admin')]
+        db.session.add_all(rows)
+        db.session.commit()
+        return {user.role: user.id for user in rows}
+
+
+def upload_picture(client, app, user_id, as_user, role):
+    with app.app_context():
+        token = create_access_token(identity=str(as_user), additional_claims={'role': role})
+    return client.put(
+        f'/users/{user_id}/profile_picture',
+        data={'profile_picture': (io.BytesIO(PNG), 'me.png', 'image/png')},
+        content_type='multipart/form-data',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+
+def test_users_can_replace_their_own_picture(app, client, users):
+    response = upload_picture(client, app, users['owner'], users['owner'], 'owner')
+
+    assert response.status_code == 200
+    picture = client.get(f"/users/{users['owner']}/profile_picture")
+    assert picture.data == PNG and picture.mimetype == 'image/png'
+
+
+def test_users_cannot_replace_someone_elses_picture(app, client, users):
+    response = upload_picture(client, app, users['owner'], users['other'], 'other')
+
+    assert response.status_code == 403
+    with app.app_context():
+        assert db.session.get(User, users['owner']).profile_picture_key is None
+
+
+def test_admins_can_replace_any_picture(app, client, users):
+    assert upload_picture(client, app, users['owner'], users['admin'], 'admin').status_code == 200
@@ -0,0 +1,61 @@
+"""ProfileCache: the cached student/teacher payloads behind login and GET /users/<id>."""
+import pytest
+from sqlalchemy import insert
+
+from app import db
+from app.models import Enrollment, Student, Teacher, User
+from app.profiles import profile_cache
+
+
+@pytest.fixture
+def student_user(app):
+    with app.app_context():
+        user = User(email='pupil@example.com', username='pupil', role='student', password='password')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_student(kenya, user_id, **fields):
+    db.session.add(Student(first_name='Pupil', phone_number='+254711111111', email='pupil@example.com',
+                           student_id='KE001', country_id=kenya, user_id=user_id, **fields))
+    db.session.commit()
+
+
+def test_missing_profiles_are_not_cached(app, kenya, student_user):
+    with app.app_context():
+        user = db.session.get(User, student_user)
+        assert profile_cache.role_details(user) is None
+
+        # Imports write students with Core inserts, which no session hook sees
+        db.session.execute(insert(Student.__table__).values(
+            first_name='Pupil', phone_number='+254711111111', email='pupil@example.com',
+            student_id='KE001', country_id=kenya, user_id=student_user,
+        ))
+        db.session.commit()
+
+        assert profile_cache.role_details(user)['student_id'] == 'KE001'
+
+
+def test_changing_a_teacher_refreshes_their_students(app, kenya, student_user):
+    with app.app_context():
+        teacher = Teacher(name='Ms Otieno', subject='Physics')
+        other = Teacher(name='Mr Kamau', subject='History')
+        db.session.add_all([teacher, other])
+        db.session.commit()
+        add_student(kenya, student_user, teacher_id=teacher.id)
+        student = Student.query.filter_by(email='pupil@example.com').one()
+        db.session.add(Enrollment(student_id=student.id, phone_number='+254711111111', teachers=[other]))
+        db.session.commit()
+        user = db.session.get(User, student_user)
+        details = profile_cache.role_details(user)
+        assert details['teacher'] == 'Ms Otieno'
+        assert details['enrollments'][0]['teachers'][0]['name'] == 'Mr Kamau'
+
+        teacher.name = 'Dr Otieno'
+        other.subject = 'Geography'
+        db.session.commit()
+
+        details = profile_cache.role_details(user)
+        assert details['teacher'] == 'Dr Otieno'
+        assert details['enrollments'][0]['teachers'][0]['subject'] == 'Geography'
@@ -0,0 +1,20 @@
+"""Cold start of web and worker processes: what gets imported and how long it takes.
+
+Both checks boot wsgi in a fresh interpreter (see benchmarks/import_time.py),
+since modules already imported by this test run would hide a regression.
+"""
+import os
+
+from benchmarks.import_time import FORBIDDEN, STARTUP_BUDGET_MS, boot
+
+
+def test_heavy_libraries_are_not_imported_at_startup():
+    _, modules = boot()
+    assert sorted(set(FORBIDDEN) & set(modules)) == []
+
+
+def test_startup_within_budget():
+    budget_ms = float(os.environ.get('STARTUP_BUDGET_MS', STARTUP_BUDGET_MS))
+    # Best of three, so one slow run on a busy machine does not fail the build.
+    wall_ms = min(boot()[0] for _ in range(3))
+    assert wall_ms <= budget_ms, f"startup took {wall_ms:.0f} ms, budget is {budget_ms:.0f} ms"
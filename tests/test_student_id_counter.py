@@ -0,0 +1,72 @@
+"""Concurrent allocation of student numbers through StudentIDCounter.reserve.
+
+On SQLite the threads are serialized by the database lock; point
+TEST_DATABASE_URI at a scratch Postgres database to race real connections.
+"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Country, Student, StudentIDCounter
+
+THREADS = 8
+
+
+def test_concurrent_reservations_hand_out_disjoint_contiguous_blocks(app, kenya):
+    sizes = [random.Random(index).randint(1, 25) for index in range(200)]
+
+    def reserve(size):
+        with app.app_context():
+            first = StudentIDCounter.reserve(kenya, size)
+            db.session.commit()
+            return range(first, first + size)
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        blocks = list(executor.map(reserve, sizes))
+
+    numbers = sorted(number for block in blocks for number in block)
+    assert numbers == list(range(1, sum(sizes) + 1))  # no number twice, none skipped
+    with app.app_context():
+        assert StudentIDCounter.query.filter_by(country_id=kenya).one().count == sum(sizes)
+
+
+def test_concurrent_registrations_get_unique_student_ids(app, kenya):
+    students = 100
+
+    def register(index):
+        with app.app_context():
+            try:
+                Student.create_with_unique_id(
+                    'Race', None, str(index), f'+254{index:09d}', f'race-{index}@example.com', 'Kenya', 'password'
+                )
+                return None
+            except Exception as e:
+                db.session.rollback()
+                return repr(e)
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        failures = [failure for failure in executor.map(register, range(students)) if failure]
+
+    assert failures == []
+    with app.app_context():
+        student_ids = db.session.execute(select(Student.student_id)).scalars().all()
+        assert sorted(student_ids) == [Student.generate_student_id('KE', number) for number in range(1, students + 1)]
+        assert db.session.execute(select(func.count()).select_from(StudentIDCounter)).scalar() == 1
+
+
+def test_reserving_a_number_does_not_commit_the_callers_pending_changes(app, kenya):
+    with app.app_context():
+        Student.create_with_unique_id('First', None, 'Student', '+254700000001', 'first@example.com', 'Kenya', 'password')
+
+        db.session.add(Country(name='Uganda', code='UG'))
+        with pytest.raises(IntegrityError):
+            Student.create_with_unique_id('Again', None, 'Student', '+254700000002', 'first@example.com', 'Kenya', 'password')
+        db.session.rollback()
+
+        assert Country.query.filter_by(code='UG').first() is None
+        # The number taken by the failed registration stays used: a gap, never a duplicate
+        assert StudentIDCounter.query.filter_by(country_id=kenya).one().count == 2
@@ -0,0 +1,11 @@
+"""Process entry point: builds the one app for gunicorn and Celery workers.
+
+    gunicorn wsgi:app
+    celery -A wsgi.celery worker -Q transactional -c 4
+"""
+from app import celery, create_app  # noqa: F401  (celery -A wsgi.celery)
+
+app = create_app()
+
+if __name__ == '__main__':
+    app.run(debug=True)